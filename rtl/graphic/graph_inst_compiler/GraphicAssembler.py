@@ -0,0 +1,323 @@
+'''
+    GraphicAssembler.py
+    Text assembly front-end of the graphic compiler
+
+    Syntax, one statement per line:
+        ; comment, // comment
+        LABEL:                          Label, may precede an instruction
+        .equ NAME, <expr>               Constant, defined before use
+        .include "file"                 Include a file, relative to the current one
+        .macro NAME a, b                Macro, parameters are substituted by name
+        ...
+        .endm
+        BOX    x0, y0, y1, w, fg_color, bg_color
+        STRING x0, y0, y1, "text", fg_color, bg_color, scale
+        CHART  x0, y0, y1, kx, bx, ky, by, color_0, color_1, waterfall
+        JUMP   LABEL | <expr>
+        WRITE
+
+    Arguments are positional or name = value. Expressions support integers
+    (123, 0x7b, 0b1111011), constants, ( ), unary - ~ and + - * / % << >> & ^ |.
+'''
+import os, re
+from GraphicInstructions import GIBox, GIString, GIChart, GIJump, GIWrite
+
+TOKEN_RE = re.compile(r'''
+     (?P<space>[ \t\r]+)
+    |(?P<comment>(?:;|//).*)
+    |(?P<string>"(?:[^"\\]|\\.)*")
+    |(?P<number>0[xX][0-9a-fA-F_]+|0[bB][01_]+|[0-9][0-9_]*)
+    |(?P<name>[A-Za-z_.][A-Za-z0-9_.]*)
+    |(?P<op><<|>>|[-+*/%&|^~(),:=])
+    |(?P<error>.)
+''', re.VERBOSE)
+
+# Mnemonic: (class, parameters)
+INSTRUCTIONS = {
+    'BOX':    (GIBox, ('x0', 'y0', 'y1', 'w', 'fg_color', 'bg_color')),
+    'STRING': (GIString, ('x0', 'y0', 'y1', 'text', 'fg_color', 'bg_color', 'scale')),
+    'CHART':  (GIChart, ('x0', 'y0', 'y1', 'kx', 'bx', 'ky', 'by', 'color_0', 'color_1', 'waterfall')),
+    'JUMP':   (GIJump, ('dest',)),
+    'WRITE':  (GIWrite, ()),
+}
+
+# Binary operators by precedence, low to high
+BINARY_OPS = (
+    {'|': lambda a, b: a | b},
+    {'^': lambda a, b: a ^ b},
+    {'&': lambda a, b: a & b},
+    {'<<': lambda a, b: a << b, '>>': lambda a, b: a >> b},
+    {'+': lambda a, b: a + b, '-': lambda a, b: a - b},
+    {'*': lambda a, b: a * b, '/': lambda a, b: a // b, '%': lambda a, b: a % b},
+)
+
+MAX_MACRO_DEPTH = 64
+
+class AsmError(RuntimeError):
+    '''Assembly error with the source location'''
+    def __init__(self, loc, msg):
+        super().__init__(f'{loc[0]}:{loc[1]}: {msg}')
+
+def tokenize(line, loc):
+    '''Tokens of a line as (kind, text) pairs'''
+    tokens = []
+
+    for m in TOKEN_RE.finditer(line):
+        kind = m.lastgroup
+
+        if kind == 'space' or kind == 'comment':
+            continue
+        if kind == 'error':
+            raise AsmError(loc, f'Unexpected character {repr(m.group())}')
+
+        tokens.append((kind, m.group()))
+
+    return tokens
+
+def split_args(tokens):
+    '''Split tokens by the commas out of the parentheses'''
+    args = [[]]
+    depth = 0
+
+    for v in tokens:
+        if v == ('op', '('):
+            depth += 1
+        elif v == ('op', ')'):
+            depth -= 1
+        elif v == ('op', ',') and depth == 0:
+            args.append([])
+            continue
+
+        args[-1].append(v)
+
+    if args == [[]]:
+        return []
+    return args
+
+class GraphicAssembler():
+    '''Single pass assembler, the output is a program for GraphicCompiler.load()'''
+
+    def __init__(self):
+        self.constants = {}
+        self.macros = {}
+        self.program = []
+
+        # Macro being defined: (name, parameters, body, location)
+        self.__macro = None
+        self.__includes = []
+
+    def assemble_file(self, fp):
+        with open(fp, 'r', encoding = 'utf-8') as f:
+            src = f.read()
+
+        return self.assemble(src, fp)
+
+    def assemble(self, src, filename = '<string>'):
+        '''Assemble a source, returns the program'''
+        path = os.path.abspath(filename)
+        if path in self.__includes:
+            raise RuntimeError('Recursive include of %s' % filename)
+        self.__includes.append(path)
+
+        for n, line in enumerate(src.splitlines(), 1):
+            loc = (filename, n)
+            self.__statement(tokenize(line, loc), loc, 0)
+
+        self.__includes.pop()
+
+        if self.__macro is not None and len(self.__includes) == 0:
+            raise AsmError(self.__macro[3], 'Macro %s is not closed by .endm' % self.__macro[0])
+
+        return self.program
+
+    def __statement(self, tokens, loc, depth):
+        # Macro definition body
+        if self.__macro is not None:
+            if tokens and tokens[0][1].lower() == '.endm':
+                name, params, body, _ = self.__macro
+                self.macros[name] = (params, body)
+                self.__macro = None
+            else:
+                self.__macro[2].append((tokens, loc))
+            return
+
+        # Labels
+        while len(tokens) >= 2 and tokens[0][0] == 'name' and tokens[1] == ('op', ':'):
+            self.program.append(tokens[0][1])
+            tokens = tokens[2:]
+
+        if len(tokens) == 0:
+            return
+
+        kind, word = tokens[0]
+        if kind != 'name':
+            raise AsmError(loc, f'Expect a mnemonic or a directive, got {repr(word)}')
+
+        if word.startswith('.'):
+            self.__directive(word.lower(), tokens[1:], loc)
+        elif word in self.macros:
+            self.__expand(word, tokens[1:], loc, depth)
+        elif word.upper() in INSTRUCTIONS:
+            self.program.append(self.__instruction(word.upper(), tokens[1:], loc))
+        else:
+            raise AsmError(loc, f'Unknown mnemonic {word}')
+
+    def __directive(self, word, tokens, loc):
+        if word == '.equ' or word == '.set':
+            args = split_args(tokens)
+            if len(args) != 2 or len(args[0]) != 1 or args[0][0][0] != 'name':
+                raise AsmError(loc, f'Usage: {word} NAME, <expr>')
+
+            self.constants[args[0][0][1]] = self.__eval(args[1], loc)
+        elif word == '.include':
+            if len(tokens) != 1 or tokens[0][0] != 'string':
+                raise AsmError(loc, 'Usage: .include "file"')
+
+            fp = os.path.join(os.path.dirname(loc[0]), self.__string(tokens[0][1], loc))
+            if not os.path.isfile(fp):
+                raise AsmError(loc, f'Include file {fp} not found')
+            self.assemble_file(fp)
+        elif word == '.macro':
+            if len(tokens) == 0 or tokens[0][0] != 'name':
+                raise AsmError(loc, 'Usage: .macro NAME a, b, ...')
+
+            params = []
+            for v in split_args(tokens[1:]):
+                if len(v) != 1 or v[0][0] != 'name':
+                    raise AsmError(loc, 'Invalid macro parameter')
+                params.append(v[0][1])
+
+            self.__macro = (tokens[0][1], params, [], loc)
+        elif word == '.endm':
+            raise AsmError(loc, '.endm without .macro')
+        else:
+            raise AsmError(loc, f'Unknown directive {word}')
+
+    def __expand(self, name, tokens, loc, depth):
+        if depth >= MAX_MACRO_DEPTH:
+            raise AsmError(loc, f'Macro {name} nested too deep')
+
+        params, body = self.macros[name]
+        args = split_args(tokens)
+        if len(args) != len(params):
+            raise AsmError(loc, f'Macro {name} expects {len(params)} arguments, got {len(args)}')
+
+        # Expressions are substituted in parentheses
+        d = {}
+        for k, v in zip(params, args):
+            d[k] = [('op', '(')] + v + [('op', ')')] if len(v) > 1 else v
+
+        for line, line_loc in body:
+            expanded = []
+            for v in line:
+                if v[0] == 'name' and v[1] in d:
+                    expanded.extend(d[v[1]])
+                else:
+                    expanded.append(v)
+
+            self.__statement(expanded, (loc[0], f'{loc[1]} ({name} at line {line_loc[1]})'), depth + 1)
+
+    def __instruction(self, mnemonic, tokens, loc):
+        cls, params = INSTRUCTIONS[mnemonic]
+
+        # JUMP LABEL
+        if mnemonic == 'JUMP' and len(tokens) == 1 and tokens[0][0] == 'name' and not tokens[0][1] in self.constants:
+            return GIJump(label = tokens[0][1])
+
+        values = {}
+        for i, arg in enumerate(split_args(tokens)):
+            # name = value
+            if len(arg) >= 2 and arg[0][0] == 'name' and arg[1] == ('op', '='):
+                key = arg[0][1]
+                arg = arg[2:]
+                if not key in params:
+                    raise AsmError(loc, f'{mnemonic} has no parameter {key}')
+            elif i < len(params):
+                key = params[i]
+            else:
+                raise AsmError(loc, f'{mnemonic} takes {len(params)} arguments')
+
+            if key in values:
+                raise AsmError(loc, f'Parameter {key} is given more than once')
+
+            if key == 'text':
+                if len(arg) != 1 or arg[0][0] != 'string':
+                    raise AsmError(loc, 'Expect a string')
+                values[key] = self.__string(arg[0][1], loc)
+            else:
+                values[key] = self.__eval(arg, loc)
+
+        missing = [v for v in params if not v in values]
+        if missing:
+            raise AsmError(loc, f'{mnemonic} missing parameter {", ".join(missing)}')
+
+        if mnemonic == 'JUMP':
+            return GIJump(dest_addr = values['dest'])
+        if mnemonic == 'CHART':
+            values['waterfall'] = values['waterfall'] != 0
+
+        return cls(**values)
+
+    def __string(self, s, loc):
+        try:
+            return s[1:-1].encode('latin-1').decode('unicode_escape')
+        except (UnicodeError, ValueError):
+            raise AsmError(loc, f'Invalid string {s}')
+
+    def __eval(self, tokens, loc):
+        if len(tokens) == 0:
+            raise AsmError(loc, 'Expect an expression')
+
+        v, i = self.__binary(tokens, 0, 0, loc)
+        if i != len(tokens):
+            raise AsmError(loc, f'Unexpected {repr(tokens[i][1])} in expression')
+
+        return v
+
+    def __binary(self, tokens, i, level, loc):
+        if level == len(BINARY_OPS):
+            return self.__unary(tokens, i, loc)
+
+        ops = BINARY_OPS[level]
+        v, i = self.__binary(tokens, i, level + 1, loc)
+
+        while i < len(tokens) and tokens[i][0] == 'op' and tokens[i][1] in ops:
+            op = ops[tokens[i][1]]
+            r, i = self.__binary(tokens, i + 1, level + 1, loc)
+            try:
+                v = op(v, r)
+            except (ZeroDivisionError, ValueError) as e:
+                raise AsmError(loc, str(e))
+
+        return v, i
+
+    def __unary(self, tokens, i, loc):
+        if i >= len(tokens):
+            raise AsmError(loc, 'Unexpected end of expression')
+
+        kind, s = tokens[i]
+
+        if s == '-' and kind == 'op':
+            v, i = self.__unary(tokens, i + 1, loc)
+            return -v, i
+        if s == '~' and kind == 'op':
+            v, i = self.__unary(tokens, i + 1, loc)
+            return ~v, i
+        if s == '(' and kind == 'op':
+            v, i = self.__binary(tokens, i + 1, 0, loc)
+            if i >= len(tokens) or tokens[i] != ('op', ')'):
+                raise AsmError(loc, 'Missing )')
+            return v, i + 1
+        if kind == 'number':
+            s = s.replace('_', '')
+            return int(s, 0) if s[:2].lower() in ('0x', '0b') else int(s, 10), i + 1
+        if kind == 'name':
+            if not s in self.constants:
+                raise AsmError(loc, f'Undefined constant {s}')
+            return self.constants[s], i + 1
+
+        raise AsmError(loc, f'Unexpected {repr(s)} in expression')
+
+def assemble_file(fp):
+    '''Assemble a file, returns the program'''
+    return GraphicAssembler().assemble_file(fp)
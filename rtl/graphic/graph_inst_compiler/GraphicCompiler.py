@@ -2,24 +2,133 @@
     GraphicCompiler.py
     Graphic Compiler
 '''
-import sys, getopt, os
-import importlib
+import sys, getopt, os, time
+from array import array
 from GraphicInstructions import GIBox, GIString, GIJump, GIWrite
+from GraphicOptimizer import GraphicOptimizer
+from GraphicTiming import analyze
+from GraphicAssembler import assemble_file
+try:
+    from Instrumentation import stage
+except ImportError:
+    from contextlib import nullcontext as stage
+    if os.environ.get('INSTRUMENT'):
+        print('INSTRUMENT is set, but Instrumentation is not on the module path. Add the script folder to PYTHONPATH.', file = sys.stderr)
 
-# Pseudo instructions
+# Machine word container, 32-bit unsigned
+WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# String ROM size, str_buffer in graphic_generator.v
+STRING_ROM_SIZE = 2048
+
+# Output formats
+OUTPUT_FORMATS = ('mem', 'bin', 'c')
+
+def format_mem(words, digits = 8):
+    '''Format words as a $readmemh memory file'''
+    fmt = '%%0%dx' % digits
+    if len(words) == 0:
+        return ''
+    return '\n'.join([fmt % v for v in words]) + '\n'
+
+def format_c_array(words, name, ctype = 'uint32_t', digits = 8):
+    '''Format words as a C array definition'''
+    fmt = '0x%%0%dx' % digits
+    li = [fmt % v for v in words]
+    # 8 words per line
+    lines = ['    ' + ', '.join(li[i:i + 8]) for i in range(0, len(li), 8)]
+
+    return f'const {ctype} {name}[{len(li)}] = {{\n' + ',\n'.join(lines) + '\n};\n'
+
+def to_bytes(words):
+    '''Convert a word array to little-endian raw binary'''
+    if sys.byteorder == 'big':
+        words = array(words.typecode, words)
+        words.byteswap()
+    return words.tobytes()
+
+def dump(words, fp, fmt = 'mem', digits = 8, name = 'graphic_data'):
+    '''Dump words to a file in the given format'''
+    if fmt == 'mem':
+        with open(fp, 'w', encoding = None) as f:
+            f.write(format_mem(words, digits))
+    elif fmt == 'bin':
+        with open(fp, 'wb') as f:
+            f.write(to_bytes(words))
+    elif fmt == 'c':
+        with open(fp, 'w', encoding = None) as f:
+            f.write(format_c_array(words, name, 'uint32_t' if digits == 8 else 'uint8_t', digits))
+    else:
+        raise ValueError('Invalid output format %s' % fmt)
+
+def pack_strings(strings, encoding = 'ascii'):
+    '''Pack strings into '\\0' terminated string data.
+
+    Identical strings are stored once, and a string which is the suffix of
+    another one points into it. Returns the data and a dict of string
+    addresses.'''
+    unique = list(dict.fromkeys(strings))
+
+    for v in unique:
+        if '\0' in v:
+            raise ValueError('String %s contains a \\0' % repr(v))
+
+    # In the descending order of the reversed strings, a suffix follows
+    # the strings ending with it
+    parent = {}
+    last = None
+    for v in sorted(unique, key = lambda v: v[::-1], reverse = True):
+        if not last is None and last.endswith(v):
+            parent[v] = last
+        else:
+            last = v
+
+    # Strings not shared, in the order of their first appearance
+    roots = [v for v in unique if not v in parent]
+
+    addrs = {}
+    p = 0
+    for v in roots:
+        addrs[v] = p
+        p += len(v.encode(encoding)) + 1
+
+    for v in unique:
+        if v in parent:
+            root = parent[v]
+            addrs[v] = addrs[root] + len(root.encode(encoding)) - len(v.encode(encoding))
+
+    if len(roots) == 0:
+        return bytearray(), addrs
+
+    data = bytearray(('\0'.join(roots) + '\0').encode(encoding))
+
+    return data, addrs
 
 class GraphicCompiler():
-    instructions = []
-    inst_str = ''
-    data = ''
-    labels = {}
+    '''Two-pass graphic instruction assembler.
 
-    iptr: int = 0
-    dptr: int = 0
+    Pass 1 (add/label) lays out the instructions and records the label
+    addresses, pass 2 (link) resolves the jump destinations. compile() then
+    packs the machine code into a 32-bit word array.'''
 
-    def __init__(self, verbose) -> None:
+    def __init__(self, verbose = False) -> None:
         self.verbose = verbose
 
+        self.instructions = []
+        self.labels = {}
+        # Label to instruction index
+        self.label_index = {}
+
+        # Machine code and string data
+        self.machine_code = array(WORD_TYPECODE)
+        self.data = bytearray()
+
+        # Per-instruction (address, instruction, encoding time in ns), verbose mode only
+        self.timing = []
+
+        self.iptr: int = 0
+        self.dptr: int = 0
+
     def add(self, inst):
         '''Add an instruction'''
         # Append instruction
@@ -27,98 +136,228 @@ class GraphicCompiler():
         self.iptr += inst.inst_len
 
     def label(self, label):
+        '''Define a label at the current instruction address'''
+        if label in self.labels:
+            raise RuntimeError('Label %s is defined more than once' % label)
+
         self.labels[label] = self.iptr
+        self.label_index[label] = len(self.instructions)
+
+    def load(self, insts):
+        '''Add a program, strings in the list are treated as labels'''
+        for v in insts:
+            if isinstance(v, str):
+                self.label(v)
+            else:
+                self.add(v)
+
+    def get_program(self):
+        '''The program as a list of instructions and labels'''
+        labels = {}
+        for k, v in self.label_index.items():
+            labels.setdefault(v, []).append(k)
+
+        insts = []
+        for i, v in enumerate(self.instructions):
+            insts.extend(labels.get(i, []))
+            insts.append(v)
+        insts.extend(labels.get(len(self.instructions), []))
+
+        return insts
+
+    def optimize(self, **kwargs):
+        '''Optimize the display list, should be called before map_data()'''
+        opt = GraphicOptimizer(verbose = self.verbose, **kwargs)
+        insts = opt.optimize(self.get_program())
+
+        # Lay out the optimized program again
+        self.instructions = []
+        self.labels = {}
+        self.label_index = {}
+        self.iptr = 0
+        self.load(insts)
+
+        if self.verbose:
+            print(opt.report)
+
+        return opt.report
+
+    def map_data(self, encoding = 'ascii'):
+        '''Map the string data, identical strings and suffixes share the storage'''
+        strings = [v.data for v in self.instructions if not v.data is None]
+
+        self.data, addrs = pack_strings(strings, encoding)
+        self.dptr = len(self.data)
+
+        if self.dptr > STRING_ROM_SIZE:
+            raise RuntimeError('String data (%d bytes) exceeds the string ROM (%d bytes)' % (self.dptr, STRING_ROM_SIZE))
 
-    def map_data(self):
         for v in self.instructions:
             if not v.data is None:
-                v.data_addr = self.dptr
+                v.data_addr = addrs[v.data]
+
+        if self.verbose:
+            for k, v in addrs.items():
+                print(f'DATA {v} {k}')
+            print(f'{len(strings)} strings, {len(addrs)} unique, {self.dptr} bytes')
 
-                if self.verbose:
-                    print(f'DATA {self.dptr} {v.data}')
+    def link(self):
+        '''Resolve the label of the jump instructions'''
+        for v in self.instructions:
+            if isinstance(v, GIJump) and v.label != '':
+                if not v.label in self.labels:
+                    raise RuntimeError('Undefined label %s' % v.label)
 
-                self.data += v.data.encode('ascii').hex('\n')
-                self.dptr += len(v.data)
+                v.dest_addr = self.labels[v.label]
 
     def compile(self):
+        self.link()
+
+        code = array(WORD_TYPECODE)
         p = 0
 
-        for v in self.instructions:
-            if v is type(GIJump) and not v.label == '':
-                v.dest_addr = self.labels[v.label]
-            
-            inst = v.compile()
+        if self.verbose:
+            self.timing = []
 
-            if(self.verbose):
-                print( v.hint('%08x' % p ))
+            for v in self.instructions:
+                t = time.perf_counter_ns()
+                inst = v.compile()
+                code.extend(inst[:v.inst_len])
+                t = time.perf_counter_ns() - t
 
-            self.inst_str += str(hex(inst[0]))[2:] + '\n'
-            if(v.inst_len == 1):
-                p = p + v.inst_len
-                continue
+                self.timing.append((p, v, t))
+                print(v.hint('%08x' % p))
+                print(f'        encoded in {t} ns')
 
-            self.inst_str += str(hex(inst[1]))[2:] + '\n'
-            if(v.inst_len == 2):
                 p = p + v.inst_len
-                continue
 
-            self.inst_str += str(hex(inst[1]))[2:] + '\n'
-            
-            # Set pointer    
-            p = p + v.inst_len
+            total = sum([v[2] for v in self.timing])
+            print(f'{len(self.instructions)} instructions, {len(code)} words, {total} ns')
+        else:
+            for v in self.instructions:
+                code.extend(v.compile()[:v.inst_len])
+
+        self.machine_code = code
+
+        return code
+
+    def analyze(self):
+        '''Static cycle cost analysis of the program, after compile()'''
+        report = analyze(self.instructions)
+
+        if self.verbose:
+            print(report.breakdown())
+
+        return report
+
+    def verify(self):
+        '''Round trip the program through the disassembler and check the
+        encoding against the RTL decoder, returns the errors'''
+        # The verifier depends on this module
+        from GraphicVerify import verify_program
+        return verify_program(self.get_program())
 
     def get_machine_code(self):
-        return self.inst_str
+        '''Machine code in the memory file format'''
+        return format_mem(self.machine_code)
+
+    def get_machine_code_array(self):
+        '''Machine code as a NumPy uint32 array, sharing the buffer'''
+        import numpy as np
+        return np.frombuffer(self.machine_code, dtype = np.uint32)
 
     def get_mapped_data(self):
-        return self.data
+        '''Mapped string data in the memory file format'''
+        return format_mem(self.data, 2)
 
-    def dump_mapped_data(self, fp):
-        with open(fp, 'w', encoding = None) as f:
-            f.write(self.data)
+    def dump_mapped_data(self, fp, fmt = 'mem'):
+        dump(self.data, fp, fmt, 2, 'graphic_string')
 
-    def dump_machine_code(self, fp):
-        with open(fp, 'w', encoding = None) as f:
-            f.write(self.inst_str)
+    def dump_machine_code(self, fp, fmt = 'mem'):
+        dump(self.machine_code, fp, fmt, 8, 'graphic_inst')
 
 HELP_MESSAGE = '''Graphic Compiler
-Usage: python GraphicCompiler.py -i <input_file> -o <output_file> -d <data_file> [-v] [-h]'''
+Usage: python GraphicCompiler.py -i <asm_file> -o <output_file> -d <data_file> [-f <format>] [-O] [-t] [-V] [-v] [-h]
+    -f <format>
+        Output format, mem (default), bin or c.
+    -O
+        Optimize the display list.
+    -t
+        Check the cycle cost of the program against the line period.
+    -V
+        Verify the encoding by a disassembly round trip.'''
 
 if __name__ == '__main__':
     # Parse the arguments
-    opts, args = getopt.getopt(sys.argv[1:], "hvi:o:d:")
+    opts, args = getopt.getopt(sys.argv[1:], "hvOtVi:o:d:f:")
+
+    verbose = False
+    optimize = False
+    timing = False
+    verify = False
+    output_format = 'mem'
 
     for opt,val in opts:
         if opt == '-i':
-            t = os.path.split(val)
-
-            if t[0] == '':
-                input_path = '.'
-            else:
-                input_path = t[0]
-            input_module = t[1][:-3]
+            input_file = val
         elif opt == '-o':
             output_file = val
         elif opt == '-d':
             data_file = val
+        elif opt == '-f':
+            if not val in OUTPUT_FORMATS:
+                print(HELP_MESSAGE)
+                sys.exit()
+            output_format = val
+        elif opt == '-O':
+            optimize = True
+        elif opt == '-t':
+            timing = True
+        elif opt == '-V':
+            verify = True
         elif opt == '-v':
             verbose = True
         else:
             print(HELP_MESSAGE)
             sys.exit()
 
-    m = importlib.import_module(input_path, input_module)
+    try:
+        with stage('assemble'):
+            program = assemble_file(input_file)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
 
     g = GraphicCompiler(verbose)
-    
-    for v in m.insts:
-        if isinstance(v, str):
-            g.label(v)
-        else:
-            g.add(v)
+    with stage('load'):
+        g.load(program)
+
+    if optimize:
+        with stage('optimize'):
+            print(g.optimize())
+
+    with stage('map_data'):
+        g.map_data()
+    with stage('compile'):
+        g.compile()
+
+    if verify:
+        with stage('verify'):
+            errors = g.verify()
+        for v in errors:
+            print('VERIFY: ' + v)
+
+        if errors:
+            sys.exit(1)
+
+    if timing:
+        with stage('analyze'):
+            report = g.analyze()
+        print(report)
 
-    g.map_data()
-    g.compile()
+        if not report.ok():
+            sys.exit(1)
 
-    g.dump_machine_code(output_file)
-    g.dump_mapped_data(data_file)
\ No newline at end of file
+    with stage('dump'):
+        g.dump_machine_code(output_file, output_format)
+        g.dump_mapped_data(data_file, output_format)
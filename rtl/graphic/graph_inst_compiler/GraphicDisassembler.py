@@ -0,0 +1,190 @@
+'''
+    GraphicDisassembler.py
+    Graphic machine code disassembler
+'''
+import sys, getopt
+import numpy as np
+from GraphicInstructions import GIBox, GIString, GIChart, GIJump, GIWrite
+from GraphicProgram import PROGRAM_DTYPE, INSTRUCTION_CLASSES, INST_LENGTHS
+
+def read_mem(fp, digits = 8):
+    '''Read a $readmemh memory file, or a raw little-endian binary file'''
+    if fp.endswith('.bin'):
+        with open(fp, 'rb') as f:
+            return np.frombuffer(f.read(), dtype = '<u4' if digits == 8 else np.uint8).astype(np.uint32)
+
+    words = []
+    with open(fp, 'r', encoding = 'utf-8') as f:
+        for line in f:
+            line = line.split('//')[0].strip()
+            if line == '':
+                continue
+            if line.startswith('@'):
+                # Address directive, fill the gap with zeros
+                addr = int(line[1:], 16)
+                words.extend([0] * (addr - len(words)))
+                continue
+
+            words.extend([int(v, 16) for v in line.split()])
+
+    return np.array(words, dtype = np.uint32)
+
+def inst_starts(words, count = None):
+    '''Start index of each instruction. The length depends on the opcode of
+    the previous instruction, so the boundaries are found by a scan over the
+    per-word lengths.'''
+    if count is None:
+        count = len(words)
+
+    lengths = INST_LENGTHS[(words[:count] >> 24) & 0x7].tolist()
+
+    starts = []
+    i = 0
+    while i < count:
+        starts.append(i)
+        i += lengths[i]
+
+    return np.array(starts, dtype = np.int64)
+
+def decode(words, count = None):
+    '''Decode a whole memory into a program record array'''
+    words = np.asarray(words, dtype = np.uint32)
+    starts = inst_starts(words, count)
+
+    # Words of each instruction, padded with zeros at the end of the memory
+    padded = np.concatenate([words, np.zeros(2, dtype = np.uint32)])
+    w = np.stack([padded[starts], padded[starts + 1], padded[starts + 2]], axis = 1)
+
+    rec = np.zeros(len(starts), dtype = PROGRAM_DTYPE)
+    rec['text'] = -1
+    opcodes = (w[:, 0] >> 24) & 0x7
+    rec['opcode'] = opcodes
+
+    for opcode, cls in INSTRUCTION_CLASSES.items():
+        sel = opcodes == opcode
+        if not sel.any():
+            continue
+
+        # Accumulate the fields in 64-bit, then store to the record fields
+        fields = {}
+        for name, word, bit, width, src in cls.LAYOUT:
+            v = ((w[sel, word] >> np.uint32(bit)) & np.uint32((1 << width) - 1)).astype(np.int64) << src
+            fields[name] = fields.get(name, 0) | v
+
+        for name, v in fields.items():
+            rec[name][sel] = v
+
+    # Unknown opcodes are left with the opcode field only
+    return rec, starts
+
+def read_string(data, addr):
+    ''''\\0' terminated string at addr of the string memory'''
+    data = bytes(data)
+    end = data.find(b'\0', addr)
+    if end < 0:
+        end = len(data)
+
+    return data[addr:end].decode('latin-1')
+
+def to_instructions(rec, data = None):
+    '''Instruction objects of a record array. Strings are read from data.'''
+    insts = []
+
+    for r in rec.tolist():
+        d = dict(zip(PROGRAM_DTYPE.names, r))
+        opcode = d['opcode']
+
+        if opcode == GIBox.opcode:
+            v = GIBox(d['x0'], d['y0'], d['y1'], d['w'], d['fg_color'], d['bg_color'])
+        elif opcode == GIString.opcode:
+            text = '' if data is None else read_string(data, d['data_addr'])
+            v = GIString(d['x0'], d['y0'], d['y1'], text, d['fg_color'], d['bg_color'], d['scale'])
+            v.data_addr = d['data_addr']
+        elif opcode == GIChart.opcode:
+            v = GIChart(d['x0'], d['y0'], d['y1'], d['kx'], d['bx'], d['ky'], d['by'], d['color_0'], d['color_1'], d['waterfall'])
+        elif opcode == GIJump.opcode:
+            v = GIJump(dest_addr = d['dest_addr'])
+        elif opcode == GIWrite.opcode:
+            v = GIWrite()
+        else:
+            raise RuntimeError('Invalid opcode %d' % opcode)
+
+        insts.append(v)
+
+    return insts
+
+def disassemble(words, data = None, count = None):
+    '''Disassemble a memory into a program for GraphicCompiler.load(),
+    labels are generated for the jump destinations'''
+    rec, starts = decode(words, count)
+    insts = to_instructions(rec, data)
+
+    dests = set([v.dest_addr for v in insts if isinstance(v, GIJump)])
+    labels = {a: 'L_%04x' % a for a in dests}
+
+    program = []
+    for a, v in zip(starts.tolist(), insts):
+        if a in labels:
+            program.append(labels[a])
+        if isinstance(v, GIJump) and v.dest_addr in labels:
+            v.label = labels[v.dest_addr]
+        program.append(v)
+
+    return program
+
+def to_assembly(program):
+    '''Assembly source of a program, see GraphicAssembler.py'''
+    li = []
+
+    for v in program:
+        if isinstance(v, str):
+            li.append(f'{v}:')
+        elif isinstance(v, GIBox):
+            li.append(f'    BOX    {v.x0}, {v.y0}, {v.y1}, {v.w}, {v.fg_color}, {v.bg_color}')
+        elif isinstance(v, GIString):
+            text = v.data.replace('\\', '\\\\').replace('"', '\\"')
+            li.append(f'    STRING {v.x0}, {v.y0}, {v.y1}, "{text}", {v.fg_color}, {v.bg_color}, {v.scale}')
+        elif isinstance(v, GIChart):
+            li.append(f'    CHART  {v.x0}, {v.y0}, {v.y1}, {v.kx}, {v.bx}, {v.ky}, {v.by}, 0x{v.color_0:04x}, 0x{v.color_1:04x}, {v.waterfall}')
+        elif isinstance(v, GIJump):
+            li.append(f'    JUMP   {v.label if v.label != "" else v.dest_addr}')
+        elif isinstance(v, GIWrite):
+            li.append('    WRITE')
+
+    return '\n'.join(li) + '\n'
+
+HELP_MESSAGE = '''Graphic Disassembler
+Usage: python GraphicDisassembler.py -i <inst_file> [-d <data_file>] [-n <words>] [-o <asm_file>] [-h]
+    Memory files are $readmemh files, or raw binary files (.bin).'''
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hi:d:n:o:")
+
+    data_file = None
+    output_file = None
+    count = None
+
+    for opt,val in opts:
+        if opt == '-i':
+            input_file = val
+        elif opt == '-d':
+            data_file = val
+        elif opt == '-n':
+            count = int(val, 0)
+        elif opt == '-o':
+            output_file = val
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    words = read_mem(input_file)
+    data = None if data_file is None else read_mem(data_file, 2).astype(np.uint8)
+
+    src = to_assembly(disassemble(words, data, count))
+
+    if output_file is None:
+        print(src, end = '')
+    else:
+        with open(output_file, 'w') as f:
+            f.write(src)
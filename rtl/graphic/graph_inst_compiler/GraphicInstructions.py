@@ -3,7 +3,19 @@
     Graphic instruction
 '''
 
+# Field layout of the instructions, matches the decoder in graphic_generator.v
+# (attribute, word, bit, width, attribute bit)
+LAYOUT_COMMON = (
+    ('y0',          0, 0,  12, 0),
+    ('y1',          0, 12, 12, 0),
+    ('opcode',      0, 24, 3,  0),
+    ('x0',          0, 27, 5,  0),          # x0[4:0]
+    ('x0',          1, 0,  7,  5),          # x0[11:5]
+)
+
 class InstBase():
+    __slots__ = ('x0', 'y0', 'y1')
+
     x0: int
     y0: int
     y1: int
@@ -11,15 +23,13 @@ class InstBase():
 
     inst_len: int = 3
 
-    _word0: int
-    _word1: int
-    _word2: int
-
     data: str = None
-    data_addr: int
+    data_addr: int = None
 
     pseudo: bool = False
 
+    LAYOUT = LAYOUT_COMMON
+
     def __init__(self, x0, y0, y1):
         self.x0 = x0
         self.y0 = y0
@@ -28,44 +38,41 @@ class InstBase():
     def get(self):
         return self
 
-    def _compile_w0(self):
-        return self.y0 | (self.y1 << 12) | (self.opcode << 24) | (self.x0 << 27)
-
-    def _compile_w1(self):
-        return 0
-
-    def _compile_w2(self):
-        return 0
-
     def compile(self):                  # Compile to machine code
-        w0_dest = self._compile_w0() & 0xffffffff
-        w1_dest = self._compile_w1() & 0xffffffff
-        w2_dest = self._compile_w2() & 0xffffffff
+        w = [0, 0, 0]
+
+        for name, word, bit, width, src in self.LAYOUT:
+            w[word] |= ((getattr(self, name) >> src) & ((1 << width) - 1)) << bit
 
-        return (w0_dest, w1_dest, w2_dest)
+        return (w[0], w[1], w[2])
 
     def _compile_hex(self):
         return ['%08x' % v for v in self.compile()]
 
 class GIString(InstBase):
+    __slots__ = ('data', 'data_addr', 'fg_color', 'bg_color', 'scale')
+
     fg_color: int
     bg_color: int
     scale: int
-    data_addr: int = None
 
-    def __init__(self, x0, y0, y1, text, fg_color, bg_color, scale):
-        self.x0 = x0
-        self.y0 = y0
-        self.y1 = y1
+    opcode = 0
+    inst_len = 3
 
+    LAYOUT = LAYOUT_COMMON + (
+        ('data_addr',   1, 7,  12, 0),
+        ('fg_color',    1, 20, 4,  0),
+        ('bg_color',    1, 24, 4,  0),
+        ('scale',       2, 0,  2,  0),
+    )
+
+    def __init__(self, x0, y0, y1, text, fg_color, bg_color, scale):
         self.data = text
+        self.data_addr = None
         self.fg_color = fg_color
         self.bg_color = bg_color
         self.scale = scale
 
-        self.opcode = 0
-        self.inst_len = 3
-
         super().__init__(x0, y0, y1)
 
     def hint(self, inst_addr):
@@ -76,26 +83,28 @@ class GIString(InstBase):
         front color = {self.fg_color}, back color = {self.bg_color},
         scale = {self.scale}'''
 
-    def _compile_w1(self):
-        return (self.x0 >> 5) | (self.data_addr << 7) | (self.fg_color << 19) | (self.bg_color << 23) | (self.scale < 27)
-
-    def _compile_w2(self):
-        return 0
-
 class GIBox(InstBase):
+    __slots__ = ('w', 'fg_color', 'bg_color')
+
     fg_color: int
     bg_color: int
-    
+
     w: int
 
+    opcode = 1
+    inst_len = 3
+
+    LAYOUT = LAYOUT_COMMON + (
+        ('w',           1, 7,  12, 0),
+        ('fg_color',    1, 20, 4,  0),
+        ('bg_color',    1, 24, 4,  0),
+    )
+
     def __init__(self, x0, y0, y1, w, fg_color, bg_color):
         self.w = w
         self.fg_color = fg_color
         self.bg_color = bg_color
 
-        self.opcode = 1
-        self.inst_len = 3
-
         super().__init__(x0, y0, y1)
 
     def hint(self, inst_addr):
@@ -105,13 +114,9 @@ class GIBox(InstBase):
         Width = {self.w}
         front color = {self.fg_color}, back color = {self.bg_color}'''
 
-    def _compile_w0(self):
-        return self.y0 | (self.y1 << 12) | (self.opcode << 24) | (self.x0 << 27)
-
-    def _compile_w1(self):
-        return ((self.x0 >> 5) & 0x7F) | (self.w << 7) | (self.fg_color << 20) | (self.bg_color << 24)
-
 class GIChart(InstBase):
+    __slots__ = ('color_0', 'color_1', 'kx', 'ky', 'bx', 'by', 'waterfall')
+
     color_0: int
     color_1: int
     kx: int
@@ -119,7 +124,20 @@ class GIChart(InstBase):
     bx: int
     by: int
     waterfall: int
-    
+
+    opcode = 2
+    inst_len = 3
+
+    LAYOUT = LAYOUT_COMMON + (
+        ('bx',          1, 7,  6,  0),
+        ('kx',          1, 13, 6,  0),
+        ('by',          1, 19, 6,  0),
+        ('ky',          1, 25, 6,  0),
+        ('waterfall',   1, 31, 1,  0),
+        ('color_0',     2, 0,  16, 0),
+        ('color_1',     2, 16, 16, 0),
+    )
+
     def __init__(self, x0, y0, y1, kx, bx, ky, by, color_0, color_1, waterfall: bool):
         self.kx = kx
         self.ky = ky
@@ -133,63 +151,51 @@ class GIChart(InstBase):
         else:
             self.waterfall = 0
 
-        self.opcode = 2
-        self.inst_len = 3
-
         super().__init__(x0, y0, y1)
 
     def hint(self, inst_addr):
         return \
-        f'''At {inst_addr}: BOX {self._compile_hex()}
+        f'''At {inst_addr}: CHART {self._compile_hex()}
         start = ({self.x0},{self.y0}), end_y = {self.y1},
         x' = {self.kx}x + {self.bx}, y' = {self.ky}y + {self.by},
         color_0 = {self.color_0}, color_1 = {self.color_1}
         waterfall = {self.waterfall}'''
 
-    def _compile_w1(self):
-        return (self.x0 >> 5) | (self.bx << 7) | (self.kx << 13) | (self.by << 19) | (self.ky << 25) | (1 << self.waterfall)
-
-    def _compile_w2(self):
-        return self.color_0 | (self.color_1 << 15)
-
 class GIJump(InstBase):
+    __slots__ = ('dest_addr', 'label')
+
     dest_addr: int
 
+    opcode = 4
+    inst_len = 1
+
+    LAYOUT = (
+        ('dest_addr',   0, 0,  24, 0),
+        ('opcode',      0, 24, 3,  0),
+    )
+
     def __init__(self, dest_addr = 0, label = ''):
         self.dest_addr = dest_addr
         self.label = label
 
-        self.opcode = 4
-        self.inst_len = 1
-
     def hint(self, inst_addr):
         return \
         f'''At {inst_addr}: JUMP {self._compile_hex()}
         Label = {self.label}, destination = {self.dest_addr}'''
-    
-    def _compile_w0(self):
-        return self.dest_addr | (self.opcode << 24)
-
-    def compile(self):                  # Compile to machine code
-        return (self._compile_w0() & 0xffffffff, 0, 0)
-    
-    def get(self):
-        return self
 
 class GIWrite(InstBase):
+    __slots__ = ()
+
+    opcode = 5
+    inst_len = 1
+
+    LAYOUT = (
+        ('opcode',      0, 24, 3,  0),
+    )
+
     def __init__(self):
-        self.opcode = 5
-        self.inst_len = 1
+        pass
 
     def hint(self, inst_addr):
         return \
         f'''At {inst_addr}: WRITE {self._compile_hex()}'''
-
-    def _compile_w0(self):
-        return self.opcode << 24
-
-    def compile(self):                  # Compile to machine code
-        return (self._compile_w0() & 0xffffffff, 0, 0)
-
-    def get(self):
-        return self
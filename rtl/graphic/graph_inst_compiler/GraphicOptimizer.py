@@ -0,0 +1,211 @@
+'''
+    GraphicOptimizer.py
+    Display list optimizer
+'''
+import heapq
+from dataclasses import dataclass
+from GraphicInstructions import GIBox, GIString, GIChart
+from GraphicTiming import ACTIVE_VERT, FONT_WIDTH, frame_cycles, string_scale
+
+# Maximum box width, 12-bit field
+BOX_MAX_WIDTH = 0xfff
+
+@dataclass
+class OptimizeReport():
+    inst_before: int = 0
+    inst_after: int = 0
+    words_before: int = 0
+    words_after: int = 0
+    cycles_before: int = 0
+    cycles_after: int = 0
+    merged: int = 0
+    removed: int = 0
+    moved: int = 0
+
+    def __str__(self):
+        saved = self.cycles_before - self.cycles_after
+        ratio = saved / self.cycles_before * 100 if self.cycles_before else 0
+
+        return \
+        f'''Instructions: {self.inst_before} -> {self.inst_after} ({self.words_before} -> {self.words_after} words)
+Merged boxes: {self.merged}, removed primitives: {self.removed}, reordered: {self.moved}
+Estimated cycles per frame: {self.cycles_before} -> {self.cycles_after} (saved {saved}, {ratio:.1f}%)'''
+
+def extent(inst):
+    '''Drawn area of a primitive as (x_start, x_end, y_start, y_end), ends are exclusive'''
+    if isinstance(inst, GIBox):
+        x1 = inst.x0 + inst.w + 1
+    elif isinstance(inst, GIString):
+        x1 = inst.x0 + len(inst.data) * FONT_WIDTH * string_scale(inst)
+    elif isinstance(inst, GIChart):
+        x1 = inst.x0 + ((511 * inst.kx) >> 4) + 1
+    else:
+        return None
+
+    return (inst.x0, x1, inst.y0, min(inst.y1, ACTIVE_VERT))
+
+def x_overlap(a, b):
+    return a[0] < b[1] and b[0] < a[1]
+
+def covers(a, b):
+    '''Area a covers area b'''
+    return a[0] <= b[0] and a[1] >= b[1] and a[2] <= b[2] and a[3] >= b[3]
+
+def overlap_pairs(rects):
+    '''Pairs (i, j), i < j, of the overlapping areas, found by a sweep on y'''
+    order = sorted(range(len(rects)), key = lambda i: rects[i][2])
+    active = []
+
+    for i in order:
+        y0 = rects[i][2]
+        active = [j for j in active if rects[j][3] > y0]
+
+        for j in active:
+            if x_overlap(rects[i], rects[j]):
+                yield (min(i, j), max(i, j))
+
+        active.append(i)
+
+class GraphicOptimizer():
+    '''Display list optimizer.
+
+    The program is split into segments at the labels and the non-drawing
+    instructions (jump, write). In each segment the optimizer
+        1. removes the primitives out of the screen or covered by a later box,
+        2. reorders the primitives by (y0, x0) without changing the drawing
+           order of the overlapping ones, which puts the boxes of a row next
+           to each other,
+        3. merges the adjacent boxes of the same color and y range.'''
+
+    def __init__(self, overdraw = True, reorder = True, merge = True, verbose = False):
+        self.overdraw = overdraw
+        self.reorder = reorder
+        self.merge = merge
+        self.verbose = verbose
+
+        self.report = OptimizeReport()
+
+    def __remove_hidden(self, seg, rects):
+        hidden = set()
+
+        for i, r in enumerate(rects):
+            if r[2] >= r[3] or r[0] >= r[1]:
+                hidden.add(i)
+
+        for i, j in overlap_pairs(rects):
+            if isinstance(seg[j], GIBox) and covers(rects[j], rects[i]):
+                hidden.add(i)
+
+                if self.verbose:
+                    print(f'REMOVE {seg[i].hint("-")}')
+
+        self.report.removed += len(hidden)
+
+        return [v for i, v in enumerate(seg) if not i in hidden], \
+               [v for i, v in enumerate(rects) if not i in hidden]
+
+    def __sort(self, seg, rects):
+        # Topological sort, overlapping primitives keep their order
+        succ = [[] for i in range(len(seg))]
+        npred = [0] * len(seg)
+
+        for i, j in overlap_pairs(rects):
+            succ[i].append(j)
+            npred[j] += 1
+
+        ready = [(rects[i][2], rects[i][0], i) for i in range(len(seg)) if npred[i] == 0]
+        heapq.heapify(ready)
+
+        order = []
+        while ready:
+            i = heapq.heappop(ready)[2]
+            order.append(i)
+
+            for j in succ[i]:
+                npred[j] -= 1
+                if npred[j] == 0:
+                    heapq.heappush(ready, (rects[j][2], rects[j][0], j))
+
+        self.report.moved += sum([1 for n, i in enumerate(order) if n != i])
+
+        return [seg[i] for i in order]
+
+    def __merge_boxes(self, seg):
+        dest = []
+
+        for v in seg:
+            if dest and isinstance(v, GIBox) and isinstance(dest[-1], GIBox):
+                m = merge_box(dest[-1], v)
+
+                if not m is None:
+                    dest[-1] = m
+                    self.report.merged += 1
+                    continue
+
+            dest.append(v)
+
+        return dest
+
+    def __optimize_segment(self, seg):
+        rects = [extent(v) for v in seg]
+
+        if self.overdraw:
+            seg, rects = self.__remove_hidden(seg, rects)
+        if self.reorder:
+            seg = self.__sort(seg, rects)
+        if self.merge:
+            seg = self.__merge_boxes(seg)
+
+        return seg
+
+    def optimize(self, insts):
+        '''Optimize a program, strings in the list are labels'''
+        self.report = OptimizeReport()
+
+        dest = []
+        seg = []
+
+        for v in insts:
+            if isinstance(v, str) or extent(v) is None:
+                # Segment barrier
+                dest.extend(self.__optimize_segment(seg))
+                dest.append(v)
+                seg = []
+            else:
+                seg.append(v)
+
+        dest.extend(self.__optimize_segment(seg))
+
+        # Summary
+        before = [v for v in insts if not isinstance(v, str)]
+        after = [v for v in dest if not isinstance(v, str)]
+
+        self.report.inst_before = len(before)
+        self.report.inst_after = len(after)
+        self.report.words_before = sum([v.inst_len for v in before])
+        self.report.words_after = sum([v.inst_len for v in after])
+        self.report.cycles_before = sum([frame_cycles(v) for v in before])
+        self.report.cycles_after = sum([frame_cycles(v) for v in after])
+
+        return dest
+
+def merge_box(a, b):
+    '''Merge two boxes drawn one after another, None if not mergeable.
+    The box unit draws the foreground color only, the background color is ignored.'''
+    if a.y0 != b.y0 or a.y1 != b.y1 or a.fg_color != b.fg_color:
+        return None
+
+    # The box covers x0 ~ x0 + w
+    a1 = a.x0 + a.w
+    b1 = b.x0 + b.w
+
+    if b.x0 > a1 + 1 or a.x0 > b1 + 1:
+        return None
+
+    x0 = min(a.x0, b.x0)
+    w = max(a1, b1) - x0
+
+    if w > BOX_MAX_WIDTH:
+        return None
+
+    return GIBox(x0 = x0, y0 = a.y0, y1 = a.y1, w = w, fg_color = a.fg_color, bg_color = a.bg_color)
@@ -0,0 +1,200 @@
+'''
+    GraphicProgram.py
+    Array-backed graphic program, vectorized encoder
+'''
+from array import array
+import numpy as np
+from GraphicInstructions import GIBox, GIString, GIChart, GIJump, GIWrite
+from GraphicCompiler import pack_strings, dump, STRING_ROM_SIZE, WORD_TYPECODE
+
+# An instruction per record
+PROGRAM_DTYPE = np.dtype([
+    ('opcode',    np.uint8),
+    ('x0',        np.int16),
+    ('y0',        np.int16),
+    ('y1',        np.int16),
+    ('w',         np.int16),
+    ('fg_color',  np.uint8),
+    ('bg_color',  np.uint8),
+    ('scale',     np.uint8),
+    ('waterfall', np.uint8),
+    ('kx',        np.int8),
+    ('bx',        np.int8),
+    ('ky',        np.int8),
+    ('by',        np.int8),
+    ('color_0',   np.uint16),
+    ('color_1',   np.uint16),
+    ('data_addr', np.uint16),
+    ('dest_addr', np.uint32),
+    ('text',      np.int32),            # Index of the text, -1 if none
+])
+
+# Opcode: instruction class
+INSTRUCTION_CLASSES = {v.opcode: v for v in (GIString, GIBox, GIChart, GIJump, GIWrite)}
+# Opcode: instruction length
+INST_LENGTHS = np.array([INSTRUCTION_CLASSES[v].inst_len if v in INSTRUCTION_CLASSES else 1 for v in range(8)], dtype = np.uint32)
+
+def records(n, opcode, **fields):
+    '''n records of an opcode, fields are scalars or arrays of length n'''
+    rec = np.zeros(n, dtype = PROGRAM_DTYPE)
+    rec['opcode'] = opcode
+    rec['text'] = -1
+
+    for k, v in fields.items():
+        rec[k] = v
+
+    return rec
+
+def inst_lengths(rec):
+    '''Length in words of each instruction'''
+    return INST_LENGTHS[rec['opcode']]
+
+def inst_addresses(rec):
+    '''Word address of each instruction'''
+    lengths = inst_lengths(rec)
+    addrs = np.zeros(len(rec), dtype = np.uint32)
+    np.cumsum(lengths[:-1], out = addrs[1:])
+
+    return addrs
+
+def encode(rec):
+    '''Encode all instructions in one pass, returns the machine code as uint32'''
+    words = np.zeros((len(rec), 3), dtype = np.uint32)
+
+    for opcode, cls in INSTRUCTION_CLASSES.items():
+        sel = rec['opcode'] == opcode
+        if not sel.any():
+            continue
+
+        part = rec[sel]
+        w = np.zeros((len(part), 3), dtype = np.uint32)
+
+        for name, word, bit, width, src in cls.LAYOUT:
+            v = part[name].astype(np.int64).astype(np.uint32)
+            w[:, word] |= ((v >> np.uint32(src)) & np.uint32((1 << width) - 1)) << np.uint32(bit)
+
+        words[sel] = w
+
+    # Drop the unused words of the short instructions
+    keep = np.arange(3) < inst_lengths(rec)[:, None]
+
+    return words[keep]
+
+class GraphicProgram():
+    '''Program as a record array, for large generated display lists.
+
+    Texts are kept in a list and referenced by index, labels and jump
+    labels by record index.'''
+
+    def __init__(self):
+        self.parts = []
+        self.texts = []
+        self.labels = {}            # Label: record index
+        self.jump_labels = {}       # Record index: label
+
+        self.__count = 0
+        self.rec = None
+        self.data = bytearray()
+        self.machine_code = np.zeros(0, dtype = np.uint32)
+
+    def __append(self, rec):
+        self.parts.append(rec)
+        self.__count += len(rec)
+        self.rec = None
+
+    def label(self, label):
+        if label in self.labels:
+            raise RuntimeError('Label %s is defined more than once' % label)
+        self.labels[label] = self.__count
+
+    def boxes(self, x0, y0, y1, w, fg_color, bg_color = 0):
+        '''Append boxes, arguments are scalars or arrays'''
+        n = np.broadcast(x0, y0, y1, w, fg_color, bg_color).size
+        self.__append(records(n, GIBox.opcode, x0 = x0, y0 = y0, y1 = y1, w = w, fg_color = fg_color, bg_color = bg_color))
+
+    def strings(self, x0, y0, y1, texts, fg_color, bg_color = 0, scale = 0):
+        '''Append strings, texts is a list of strings'''
+        n = len(texts)
+        rec = records(n, GIString.opcode, x0 = x0, y0 = y0, y1 = y1, fg_color = fg_color, bg_color = bg_color, scale = scale)
+        rec['text'] = np.arange(len(self.texts), len(self.texts) + n)
+
+        self.texts.extend(texts)
+        self.__append(rec)
+
+    def charts(self, x0, y0, y1, kx, bx, ky, by, color_0, color_1, waterfall = False):
+        n = np.broadcast(x0, y0, y1, kx, bx, ky, by, color_0, color_1, waterfall).size
+        self.__append(records(n, GIChart.opcode, x0 = x0, y0 = y0, y1 = y1, kx = kx, bx = bx, ky = ky, by = by,
+                              color_0 = color_0, color_1 = color_1, waterfall = np.asarray(waterfall) != 0))
+
+    def jump(self, label = '', dest_addr = 0):
+        if label != '':
+            self.jump_labels[self.__count] = label
+        self.__append(records(1, GIJump.opcode, dest_addr = dest_addr))
+
+    def write(self):
+        self.__append(records(1, GIWrite.opcode))
+
+    def add(self, inst):
+        '''Append an instruction object'''
+        f = {k: getattr(inst, k) for k in set([v[0] for v in inst.LAYOUT]) if k != 'opcode'}
+        rec = records(1, inst.opcode, **{k: v for k, v in f.items() if k != 'data_addr'})
+
+        if isinstance(inst, GIString):
+            rec['text'] = len(self.texts)
+            self.texts.append(inst.data)
+        elif isinstance(inst, GIJump) and inst.label != '':
+            self.jump_labels[self.__count] = inst.label
+
+        self.__append(rec)
+
+    def load(self, insts):
+        '''Append a program, strings in the list are labels'''
+        for v in insts:
+            if isinstance(v, str):
+                self.label(v)
+            else:
+                self.add(v)
+
+    def records(self):
+        '''All the records as one array'''
+        if self.rec is None:
+            self.rec = np.concatenate(self.parts) if self.parts else np.zeros(0, dtype = PROGRAM_DTYPE)
+            self.parts = [self.rec]
+
+        return self.rec
+
+    def map_data(self, encoding = 'ascii'):
+        rec = self.records()
+
+        self.data, addrs = pack_strings(self.texts, encoding)
+        if len(self.data) > STRING_ROM_SIZE:
+            raise RuntimeError('String data (%d bytes) exceeds the string ROM (%d bytes)' % (len(self.data), STRING_ROM_SIZE))
+
+        table = np.array([addrs[v] for v in self.texts] + [0], dtype = np.uint16)
+        sel = rec['text'] >= 0
+        rec['data_addr'][sel] = table[rec['text'][sel]]
+
+    def link(self):
+        rec = self.records()
+        addrs = inst_addresses(rec)
+        end = int(addrs[-1] + inst_lengths(rec[-1:])[0]) if len(rec) else 0
+
+        for i, label in self.jump_labels.items():
+            if not label in self.labels:
+                raise RuntimeError('Undefined label %s' % label)
+
+            n = self.labels[label]
+            rec['dest_addr'][i] = addrs[n] if n < len(rec) else end
+
+    def compile(self):
+        self.link()
+        self.machine_code = encode(self.records())
+
+        return self.machine_code
+
+    def dump_mapped_data(self, fp, fmt = 'mem'):
+        dump(self.data, fp, fmt, 2, 'graphic_string')
+
+    def dump_machine_code(self, fp, fmt = 'mem'):
+        dump(array(WORD_TYPECODE, self.machine_code.tobytes()), fp, fmt, 8, 'graphic_inst')
+
@@ -0,0 +1,254 @@
+'''
+    GraphicTiming.py
+    Cycle cost model of the graphic generator
+'''
+from bisect import bisect_left
+from dataclasses import dataclass
+from GraphicInstructions import GIBox, GIString, GIChart, GIJump, GIWrite
+
+# Screen parameters, graphic_generator.v
+ACTIVE_HORI = 1024
+ACTIVE_VERT = 768
+
+# Video timing, stream_2_video_out.v. hclk of the generator is the pixel clock
+PIX_H_TOTAL = 1328
+PIX_V_TOTAL = 806
+
+# Instruction FSM, graphic_generator.v
+CYCLES_SKIP = 2             # FECH0, FECH1. Jumps and instructions out of the y range
+CYCLES_DISPATCH = 4         # FECH0, FECH1, FECH2, START
+
+# Box unit, box_unit.v
+CYCLES_BOX_DONE = 1         # DONE
+# String unit, string_unit.v
+CYCLES_CHAR_FETCH = 3       # READ, RECH0, RECH1
+CYCLES_STRING_END = 5       # READ, RECH0, RECH1, DRAW on '\0', DONE
+FONT_WIDTH = 8
+# Chart unit, chart_unit.v
+CYCLES_CHART_RUN = 1024     # x = 0 ~ 1023
+CYCLES_CHART_DONE = 3       # done pipeline
+
+def string_scale(inst):
+    '''Horizontal scale factor of a string'''
+    return 1 << inst.scale
+
+def visible_lines(inst):
+    '''Count of the active lines in the y range of an instruction'''
+    y0 = max(inst.y0, 0)
+    y1 = min(inst.y1, ACTIVE_VERT)
+
+    return max(y1 - y0, 0)
+
+def unit_cycles(inst):
+    '''Cycles spent by the execution unit on a line in the y range'''
+    if isinstance(inst, GIBox):
+        return (inst.w + 1) + CYCLES_BOX_DONE
+    elif isinstance(inst, GIString):
+        chars = len(inst.data)
+        return chars * (CYCLES_CHAR_FETCH + FONT_WIDTH * string_scale(inst)) + CYCLES_STRING_END
+    elif isinstance(inst, GIChart):
+        return CYCLES_CHART_RUN + CYCLES_CHART_DONE
+    else:
+        return 0
+
+def line_cycles(inst, in_range = True):
+    '''Cycles of an instruction on a single line'''
+    if isinstance(inst, (GIJump, GIWrite)) or not in_range:
+        return CYCLES_SKIP
+
+    return CYCLES_DISPATCH + unit_cycles(inst)
+
+def frame_cycles(inst):
+    '''Cycles of an instruction over a whole frame'''
+    if isinstance(inst, (GIJump, GIWrite)):
+        return CYCLES_SKIP * ACTIVE_VERT
+
+    lines = visible_lines(inst)
+    return lines * line_cycles(inst) + (ACTIVE_VERT - lines) * CYCLES_SKIP
+
+@dataclass
+class InstCost():
+    addr: int
+    inst: object
+    lines: int              # Lines in the y range
+    cycles: int             # Cycles per frame
+    worst_line: int         # Cycles on a line in the y range
+
+@dataclass
+class TimingReport():
+    line_budget: int
+    line_cycles: list
+    inst_costs: list
+    overrun_lines: list
+    warnings: list
+
+    def worst_line(self):
+        y = max(range(len(self.line_cycles)), key = lambda i: self.line_cycles[i])
+        return (y, self.line_cycles[y])
+
+    def frame_cycles(self):
+        return sum(self.line_cycles)
+
+    def ok(self):
+        return len(self.overrun_lines) == 0
+
+    def breakdown(self, top = None):
+        '''Per-instruction cost breakdown, most expensive first'''
+        li = sorted(self.inst_costs, key = lambda v: v.cycles, reverse = True)
+        if not top is None:
+            li = li[:top]
+
+        s = ['ADDR      TYPE      LINES  CYCLES/LINE  CYCLES/FRAME']
+        for v in li:
+            s.append('%08x  %-8s  %5d  %11d  %12d' % (v.addr, type(v.inst).__name__, v.lines, v.worst_line, v.cycles))
+
+        return '\n'.join(s)
+
+    def __str__(self):
+        y, worst = self.worst_line()
+        s = f'''Frame: {self.frame_cycles()} cycles in {len(self.line_cycles)} lines
+Worst line: y = {y}, {worst} cycles of {self.line_budget} ({worst / self.line_budget * 100:.1f}%)'''
+
+        if self.ok():
+            s += '\nNo line overruns.'
+        else:
+            first = self.overrun_lines[0]
+            s += f'\nOVERRUN on {len(self.overrun_lines)} lines, first at y = {first} ({self.line_cycles[first]} cycles)'
+
+        for v in self.warnings:
+            s += '\nWARNING: ' + v
+
+        return s
+
+class TimingAnalyzer():
+    '''Static cycle cost analysis of a linked program.
+
+    The instruction FSM walks the program once per line. A line ends at a
+    GIWrite, which waits for the line buffer swap, so each line has to be
+    finished within a line period. Jumps are unconditional, so the path of a
+    line only depends on the address it starts at; the cost of a path on
+    every line is accumulated with a difference array over y.'''
+
+    def __init__(self, insts, line_budget = PIX_H_TOTAL):
+        self.insts = [v for v in insts if not isinstance(v, str)]
+        self.line_budget = line_budget
+
+        # Address of the instructions
+        self.addrs = []
+        p = 0
+        for v in self.insts:
+            self.addrs.append(p)
+            p += v.inst_len
+
+        self.index = {v: i for i, v in enumerate(self.addrs)}
+        self.warnings = []
+
+    def __next_index(self, i):
+        '''Index of the instruction executed after instruction i'''
+        v = self.insts[i]
+
+        if isinstance(v, GIJump):
+            if not v.dest_addr in self.index:
+                raise RuntimeError('Jump at %08x to %08x is not an instruction' % (self.addrs[i], v.dest_addr))
+            return self.index[v.dest_addr]
+
+        if i + 1 >= len(self.insts):
+            raise RuntimeError('Program runs out of the instruction memory at %08x' % self.addrs[i])
+        return i + 1
+
+    def __path(self, entry):
+        '''Instructions executed on a line starting at entry, and the entry of the next line'''
+        path = []
+        visited = set()
+        i = entry
+
+        while not i in visited:
+            visited.add(i)
+            path.append(i)
+
+            if isinstance(self.insts[i], GIWrite):
+                return path, self.__next_index(i)
+
+            i = self.__next_index(i)
+
+        self.warnings.append('No GIWrite in the loop at %08x, one pass of the loop is counted as a line' % self.addrs[i])
+        return path, i
+
+    def __path_cycles(self, path):
+        '''Cycles of a path on every line'''
+        diff = [0] * (ACTIVE_VERT + 1)
+        base = 0
+
+        for i in path:
+            v = self.insts[i]
+            base += CYCLES_SKIP
+
+            if isinstance(v, (GIJump, GIWrite)):
+                continue
+
+            y0 = max(v.y0, 0)
+            y1 = min(v.y1, ACTIVE_VERT)
+            if y0 < y1:
+                extra = line_cycles(v) - CYCLES_SKIP
+                diff[y0] += extra
+                diff[y1] -= extra
+
+        li = []
+        acc = base
+        for y in range(ACTIVE_VERT):
+            acc += diff[y]
+            li.append(acc)
+
+        return li
+
+    def analyze(self):
+        if len(self.insts) == 0:
+            raise RuntimeError('Empty program')
+
+        self.warnings = []
+
+        # Line paths
+        paths = {}
+        line_entry = []
+        entry = 0
+        for y in range(ACTIVE_VERT):
+            if not entry in paths:
+                path, next_entry = self.__path(entry)
+                paths[entry] = (path, next_entry, self.__path_cycles(path))
+
+            line_entry.append(entry)
+            entry = paths[entry][1]
+
+        line_cycles_li = [paths[e][2][y] for y, e in enumerate(line_entry)]
+
+        # Instruction costs
+        lines_of_entry = {}
+        for y, e in enumerate(line_entry):
+            lines_of_entry.setdefault(e, []).append(y)
+
+        total = [0] * len(self.insts)
+        in_range = [0] * len(self.insts)
+        for e, ys in lines_of_entry.items():
+            for i in paths[e][0]:
+                v = self.insts[i]
+
+                if isinstance(v, (GIJump, GIWrite)):
+                    total[i] += CYCLES_SKIP * len(ys)
+                    continue
+
+                # Lines are in ascending order
+                n = bisect_left(ys, v.y1) - bisect_left(ys, v.y0)
+                in_range[i] += n
+                total[i] += n * line_cycles(v) + (len(ys) - n) * CYCLES_SKIP
+
+        inst_costs = []
+        for i, v in enumerate(self.insts):
+            inst_costs.append(InstCost(self.addrs[i], v, in_range[i], total[i], line_cycles(v)))
+
+        overrun = [y for y, v in enumerate(line_cycles_li) if v > self.line_budget]
+
+        return TimingReport(self.line_budget, line_cycles_li, inst_costs, overrun, self.warnings)
+
+def analyze(insts, line_budget = PIX_H_TOTAL):
+    '''Analyze a linked program'''
+    return TimingAnalyzer(insts, line_budget).analyze()
@@ -0,0 +1,178 @@
+'''
+    GraphicUpdate.py
+    Display list delta updater
+'''
+from dataclasses import dataclass, field
+from GraphicInstructions import GIWrite
+
+# AHB address map, ahb_intf_graph_gen.v
+AHB_BASE = 0x0000_0000
+INST_BASE = 0x1000
+PALETTE_BASE = 0x2000
+STRING_BASE = 0x3000
+CHART_BASE = 0x4000
+
+# An AHB burst must not cross a 1KB boundary
+BURST_BOUNDARY = 0x400
+
+# FRBM commands
+FRBM_WRITE = 'W 0x%08x 0x%08x %s %s P0000 nolock okay'
+FRBM_SEQ = 'S 0x%08x'
+FRBM_POLL = 'P 0x%08x 0x%08x word sing P0000'
+FRBM_COMMENT = 'C "%s"'
+
+@dataclass
+class Burst():
+    '''Write burst, consecutive addresses'''
+    addr: int
+    size: str               # 'word' or 'byte'
+    data: list = field(default_factory = list)
+
+    def stride(self):
+        return 4 if self.size == 'word' else 1
+
+    def to_fri(self):
+        if len(self.data) == 1:
+            return [FRBM_WRITE % (self.addr, self.data[0], self.size, 'sing')]
+
+        li = [FRBM_WRITE % (self.addr, self.data[0], self.size, 'incr')]
+        li.extend([FRBM_SEQ % v for v in self.data[1:]])
+
+        return li
+
+def changed_runs(old, new, max_gap = 0):
+    '''Runs (start, end) of the changed items, end is exclusive.
+    Runs separated by no more than max_gap unchanged items are joined.'''
+    n = min(len(old), len(new))
+    changed = [i for i in range(n) if old[i] != new[i]]
+    changed.extend(range(n, len(new)))
+
+    runs = []
+    for i in changed:
+        if runs and i - runs[-1][1] <= max_gap:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+
+    return [tuple(v) for v in runs]
+
+def split_runs(runs, cuts):
+    '''Split runs at the given indices'''
+    cuts = sorted(cuts)
+    dest = []
+
+    for start, end in runs:
+        for c in cuts:
+            if start < c < end:
+                dest.append((start, c))
+                start = c
+        dest.append((start, end))
+
+    return dest
+
+def to_bursts(words, runs, base, size):
+    '''Convert runs to bursts, split at the burst boundary'''
+    stride = 4 if size == 'word' else 1
+    bursts = []
+
+    for start, end in runs:
+        i = start
+        while i < end:
+            addr = base + i * stride
+            # Items left before the boundary
+            n = (BURST_BOUNDARY - addr % BURST_BOUNDARY) // stride
+            n = min(n, end - i)
+
+            bursts.append(Burst(addr, size, list(words[i:i + n])))
+            i += n
+
+    return bursts
+
+class GraphicUpdater():
+    '''Minimal AHB write sequences between two compiled programs.
+
+    The string data is written before the instructions, so a new string is
+    in place before an instruction points at it. The instruction bursts are
+    split at the instruction boundaries following a GIWrite, so each line
+    segment of the program is updated by its own bursts, and an optional
+    frame sync (a poll on a status register, or a callable) is issued
+    before every group.
+
+    Only the changed words are written. A changed string which keeps its
+    length keeps the addresses of the other strings, so fixed-width readouts
+    (e.g. '%7.3f MHz') update with a few byte writes.'''
+
+    def __init__(self, compiler, base = AHB_BASE, max_gap = 0, sync = None):
+        '''compiler: the program running on the generator. sync: (addr, value)
+        of a status register polled before each update group, or None.'''
+        self.current = compiler
+        self.base = base
+        self.max_gap = max_gap
+        self.sync = sync
+
+    def __line_cuts(self, compiler):
+        '''Word indices after each GIWrite'''
+        cuts = []
+        p = 0
+        for v in compiler.instructions:
+            p += v.inst_len
+            if isinstance(v, GIWrite):
+                cuts.append(p)
+
+        return cuts
+
+    def diff(self, new):
+        '''Groups of bursts updating the current program to new'''
+        groups = []
+
+        # String data
+        runs = changed_runs(self.current.data, new.data, self.max_gap)
+        if runs:
+            groups.append(to_bursts(new.data, runs, self.base + STRING_BASE, 'byte'))
+
+        # Instructions, a group per line segment
+        runs = changed_runs(self.current.machine_code, new.machine_code, self.max_gap)
+        runs = split_runs(runs, self.__line_cuts(new))
+
+        cuts = [0] + self.__line_cuts(new)
+        segment = None
+        for run in runs:
+            s = len([v for v in cuts if v <= run[0]])
+            if s != segment:
+                groups.append([])
+                segment = s
+            groups[-1].extend(to_bursts(new.machine_code, [run], self.base + INST_BASE, 'word'))
+
+        return groups
+
+    def update(self, new):
+        '''Bursts updating the current program to new, new becomes the current program'''
+        groups = self.diff(new)
+        self.current = new
+
+        return groups
+
+    def to_fri(self, groups):
+        '''FRBM stimulus of the update groups'''
+        li = [FRBM_COMMENT % ('Display list update, %d bursts' % sum([len(v) for v in groups]))]
+
+        for v in groups:
+            if isinstance(self.sync, tuple):
+                li.append(FRBM_POLL % (self.sync[0], self.sync[1]))
+            for b in v:
+                li.extend(b.to_fri())
+
+        return '\n'.join(li) + '\n'
+
+    def apply(self, groups, write):
+        '''Apply the update groups by write(addr, data, size).
+        A callable sync is called before each group.'''
+        for v in groups:
+            if callable(self.sync):
+                self.sync()
+            for b in v:
+                write(b.addr, b.data, b.size)
+
+def bus_words(groups):
+    '''Count of the data beats of the update groups'''
+    return sum([sum([len(b.data) for b in v]) for v in groups])
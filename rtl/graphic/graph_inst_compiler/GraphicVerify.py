@@ -0,0 +1,265 @@
+'''
+    GraphicVerify.py
+    Round-trip verifier of the graphic instruction encoding
+'''
+import sys, getopt, random
+import numpy as np
+from GraphicInstructions import GIBox, GIString, GIChart, GIJump, GIWrite
+from GraphicCompiler import GraphicCompiler
+from GraphicProgram import GraphicProgram, INSTRUCTION_CLASSES
+from GraphicDisassembler import disassemble, to_assembly
+from GraphicAssembler import GraphicAssembler
+
+# Instruction decode of graphic_generator.v, transcribed independently of
+# the LAYOUT tables. Attribute: [(word, msb, lsb), ...], concatenated MSB first
+RTL_COMMON = {
+    'y0':        [(0, 11, 0)],                  # y0       = word_0[11:0]
+    'y1':        [(0, 23, 12)],                 # y1       = word_0[23:12]
+    'x0':        [(1, 6, 0), (0, 31, 27)],      # x0       = {word_1[6:0], word_0[31:27]}
+    'opcode':    [(0, 26, 24)],                 # opcode   = word_0[26:24]
+}
+RTL_DECODE = {
+    GIString: dict(RTL_COMMON, **{
+        'fg_color':  [(1, 23, 20)],             # fg_color = word_1[23:20]
+        'bg_color':  [(1, 27, 24)],             # bg_color = word_1[27:24]
+        'data_addr': [(1, 18, 7)],              # str_addr = word_1[18:7]
+        'scale':     [(2, 1, 0)],               # ch_scale = word_2[1:0]
+    }),
+    GIBox: dict(RTL_COMMON, **{
+        'fg_color':  [(1, 23, 20)],
+        'bg_color':  [(1, 27, 24)],
+        'w':         [(1, 18, 7)],              # lin_w    = word_1[18:7]
+    }),
+    GIChart: dict(RTL_COMMON, **{
+        'bx':        [(1, 12, 7)],              # chart_bx = word_1[12:7]
+        'kx':        [(1, 18, 13)],             # chart_kx = word_1[18:13]
+        'by':        [(1, 24, 19)],             # chart_by = word_1[24:19]
+        'ky':        [(1, 30, 25)],             # chart_ky = word_1[30:25]
+        'waterfall': [(1, 31, 31)],             # chart_ty = word_1[31]
+        'color_0':   [(2, 15, 0)],              # color_0  = word_2[15:0]
+        'color_1':   [(2, 31, 16)],             # color_1  = word_2[31:16]
+    }),
+    GIJump: {
+        'dest_addr': [(0, 23, 0)],              # jmp_dest = word_0[23:0]
+        'opcode':    [(0, 26, 24)],
+    },
+    GIWrite: {
+        'opcode':    [(0, 26, 24)],
+    },
+}
+
+def rtl_decode(cls, words):
+    '''Decode the words of an instruction as graphic_generator.v does'''
+    d = {}
+    for name, slices in RTL_DECODE[cls].items():
+        v = 0
+        for word, msb, lsb in slices:
+            width = msb - lsb + 1
+            v = (v << width) | ((words[word] >> lsb) & ((1 << width) - 1))
+        d[name] = v
+
+    return d
+
+def check_rtl(inst):
+    '''Check the encoding of an instruction against the RTL decoder, returns the errors'''
+    errors = []
+    d = rtl_decode(type(inst), inst.compile())
+
+    for name, v in d.items():
+        width = sum([msb - lsb + 1 for word, msb, lsb in RTL_DECODE[type(inst)][name]])
+        expected = getattr(inst, name) & ((1 << width) - 1)
+
+        if v != expected:
+            errors.append(f'{type(inst).__name__}.{name}: {expected} decoded by the RTL as {v}')
+
+    return errors
+
+def field_widths(cls):
+    '''Width in bits of each attribute in the layout of a class'''
+    d = {}
+    for name, word, bit, width, src in cls.LAYOUT:
+        d[name] = max(d.get(name, 0), src + width)
+
+    return d
+
+def check_layout():
+    '''Check that the fields of each instruction do not overlap, returns the errors'''
+    errors = []
+
+    for cls in INSTRUCTION_CLASSES.values():
+        used = [0, 0, 0]
+        src_used = {}
+
+        for name, word, bit, width, src in cls.LAYOUT:
+            mask = ((1 << width) - 1) << bit
+
+            if bit + width > 32:
+                errors.append(f'{cls.__name__}.{name}: bits {bit + width - 1}:{bit} out of word {word}')
+            if used[word] & mask:
+                errors.append(f'{cls.__name__}.{name}: word {word} bits {bit + width - 1}:{bit} overlap another field')
+            used[word] |= mask
+
+            src_mask = ((1 << width) - 1) << src
+            if src_used.get(name, 0) & src_mask:
+                errors.append(f'{cls.__name__}.{name}: attribute bits {src + width - 1}:{src} are encoded twice')
+            src_used[name] = src_used.get(name, 0) | src_mask
+
+            if word >= cls.inst_len:
+                errors.append(f'{cls.__name__}.{name}: field in word {word} of a {cls.inst_len}-word instruction')
+
+    return errors
+
+def random_text(rng):
+    chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .-:%"\\'
+    return ''.join([rng.choice(chars) for i in range(rng.randrange(0, 12))])
+
+def random_instruction(rng):
+    '''Instruction with random in-range fields, jumps are not included'''
+    cls = rng.choice([GIBox, GIString, GIChart, GIWrite])
+    f = {k: rng.randrange(1 << v) for k, v in field_widths(cls).items() if k != 'opcode'}
+
+    if cls is GIBox:
+        return GIBox(f['x0'], f['y0'], f['y1'], f['w'], f['fg_color'], f['bg_color'])
+    elif cls is GIString:
+        return GIString(f['x0'], f['y0'], f['y1'], random_text(rng), f['fg_color'], f['bg_color'], f['scale'])
+    elif cls is GIChart:
+        return GIChart(f['x0'], f['y0'], f['y1'], f['kx'], f['bx'], f['ky'], f['by'], f['color_0'], f['color_1'], f['waterfall'])
+    else:
+        return GIWrite()
+
+def random_program(rng, length):
+    '''Random program with labels and jumps'''
+    program = []
+    labels = []
+
+    for i in range(length):
+        if rng.random() < 0.05:
+            labels.append('L%d' % i)
+            program.append(labels[-1])
+        if labels and rng.random() < 0.05:
+            program.append(GIJump(label = rng.choice(labels)))
+        else:
+            program.append(random_instruction(rng))
+
+    # Strings share the string ROM
+    texts = sum([len(v.data) + 1 for v in program if isinstance(v, GIString)])
+    if texts > 2048:
+        program = [v for v in program if not isinstance(v, GIString)]
+
+    return program
+
+def compare(a, b):
+    '''Compare the encoded fields of two instructions, returns the errors'''
+    if type(a) != type(b):
+        return [f'{type(a).__name__} decoded as {type(b).__name__}']
+
+    errors = []
+    for name, width in field_widths(type(a)).items():
+        va = getattr(a, name) & ((1 << width) - 1)
+        vb = getattr(b, name)
+        if va != vb:
+            errors.append(f'{type(a).__name__}.{name}: {va} decoded as {vb}')
+
+    if isinstance(a, GIString) and a.data != b.data:
+        errors.append(f'GIString text {repr(a.data)} decoded as {repr(b.data)}')
+
+    return errors
+
+def compile_program(program):
+    g = GraphicCompiler()
+    g.load(program)
+    g.map_data()
+    g.compile()
+
+    return g
+
+def verify_program(program):
+    '''Round trip a program, returns the errors'''
+    errors = []
+
+    g = compile_program(program)
+    words = np.frombuffer(g.machine_code, dtype = np.uint32)
+
+    # Encoder against the RTL decoder
+    for i, v in enumerate(g.instructions):
+        errors.extend(['#%d %s' % (i, e) for e in check_rtl(v)])
+
+    # Scalar and vectorized encoders
+    p = GraphicProgram()
+    p.load(program)
+    p.map_data()
+    if not np.array_equal(p.compile(), words):
+        errors.append('Vectorized encoder differs from the scalar encoder')
+
+    # Machine code -> instructions
+    dis = disassemble(words, g.data)
+    insts = [v for v in dis if not isinstance(v, str)]
+
+    if len(insts) != len(g.instructions):
+        errors.append(f'{len(g.instructions)} instructions decoded as {len(insts)}')
+    else:
+        for i, (a, b) in enumerate(zip(g.instructions, insts)):
+            errors.extend(['#%d %s' % (i, v) for v in compare(a, b)])
+
+    # Instructions -> machine code
+    if not errors and compile_program(dis).machine_code != g.machine_code:
+        errors.append('Re-encoded machine code differs')
+
+    # Assembly text -> machine code
+    if not errors:
+        src = to_assembly(dis)
+        if compile_program(GraphicAssembler().assemble(src)).machine_code != g.machine_code:
+            errors.append('Machine code assembled from the disassembly differs')
+
+    return errors
+
+def fuzz(count = 1000, length = 40, seed = 0, verbose = False):
+    '''Round trip random programs, returns the count of the failed programs'''
+    errors = check_layout()
+    for v in errors:
+        print('LAYOUT: ' + v)
+
+    rng = random.Random(seed)
+    failed = 0
+
+    for i in range(count):
+        program = random_program(rng, rng.randrange(1, length + 1))
+        e = verify_program(program)
+
+        if e:
+            failed += 1
+            if verbose or failed <= 5:
+                print(f'Program #{i} failed:')
+                for v in e[:10]:
+                    print('    ' + v)
+
+    print(f'{count} programs, {failed} failed')
+
+    return failed + len(errors)
+
+HELP_MESSAGE = '''Graphic instruction round-trip verifier
+Usage: python GraphicVerify.py [-n <programs>] [-l <length>] [-s <seed>] [-v] [-h]'''
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hvn:l:s:")
+
+    count = 1000
+    length = 40
+    seed = 0
+    verbose = False
+
+    for opt,val in opts:
+        if opt == '-n':
+            count = int(val)
+        elif opt == '-l':
+            length = int(val)
+        elif opt == '-s':
+            seed = int(val)
+        elif opt == '-v':
+            verbose = True
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    sys.exit(1 if fuzz(count, length, seed, verbose) else 0)
@@ -89,7 +89,7 @@ module graphic_generator#(
             inst_r <= inst[inst_ar];
 
             if(inst_we)
-                inst[haddr_last[9:1]] <= hwdata_s;
+                inst[haddr_last[10:2]] <= hwdata_s;     // Word address, 0x1000 + 4 * index
         end
     end
 
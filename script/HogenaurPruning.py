@@ -7,6 +7,7 @@ from scipy.special import comb
 import math
 
 from string import Template
+from Instrumentation import timed
 
 import tkinter
 from tkinter import *
@@ -42,6 +43,7 @@ class HogenauerPruning():
         else:
             raise ValueError('[h Calcuation] Invalid j value.')
 
+    @timed('fj_square')
     def __get_Fj_square(self, j):
         sum = 0
 
@@ -73,6 +75,7 @@ class HogenauerPruning():
         tmp = (1 / self.__get_Fj_square(j)) * (6 / self.N) * self.__get_sigma_2NP1_square()
         return math.floor(0.5 * math.log2(tmp))
 
+    @timed('integrators')
     def get_integrators(self):
         li = []
         for j in range(1, self.N + 1):
@@ -84,6 +87,7 @@ class HogenauerPruning():
 
         return li
 
+    @timed('combs')
     def get_combs(self):
         li = []
         for j in range(self.N + 1, self.N * 2 + 1):
@@ -0,0 +1,230 @@
+'''
+    Instrumentation.py
+    Opt-in stage timing and profiling of the generators
+
+    Set the INSTRUMENT environment variable to enable it:
+        INSTRUMENT=1                Print the stage report at exit
+        INSTRUMENT=report.json      Write the stage report as JSON at exit
+    and optionally:
+        INSTRUMENT_MEMORY=1         Record the peak memory of the stages, by tracemalloc
+        INSTRUMENT_PROFILE=run.prof Profile the run by cProfile, for snakeviz or gprof2dot
+        INSTRUMENT_FOLDED=run.txt   Write the stages as folded stacks, for flamegraph.pl
+                                    or speedscope
+
+    Usage:
+        from Instrumentation import stage, timed
+
+        with stage('load'):
+            desc = loadDescription(fp)
+
+        @timed('fj_square')
+        def getFjSquare(j): ...
+
+    When disabled, stage() returns a shared no-op context manager and timed()
+    returns the function itself, so the instrumented code runs as before.
+
+    The tools out of this folder import it if the folder is on the module
+    path, and run without the stages otherwise, with a warning if INSTRUMENT
+    is set:
+        PYTHONPATH=script INSTRUMENT=1 python tb/infrastructure/data_proc/generate_spectrum.py ...
+
+    Stages of the worker processes of a pool are returned by collect() in the
+    workers, and added to the report of the parent by merge().
+'''
+import os, sys, time, json, atexit
+
+class _NullStage():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class StageStats():
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0         # Seconds, nested stages included
+        self.child = 0.0        # Seconds of the nested stages
+        self.peak = 0           # Bytes over the memory at the entry
+
+class Recorder():
+    '''Statistics of the stages, by the path of nested stage names'''
+
+    def __init__(self, memory = False):
+        self.stats = {}
+        self.stack = []
+        self.memory = memory
+        self.start = time.perf_counter()
+
+        if memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def enter(self, name):
+        path = self.stack[-1][0] + (name,) if self.stack else (name,)
+        mem = 0
+        if self.memory:
+            # The peak of the parent is kept before the peak is reset for the stage
+            mem, peak = self.tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1][3] = max(self.stack[-1][3], peak)
+            self.tracemalloc.reset_peak()
+
+        # Stages are reported in the order of their first entry
+        self.stats.setdefault(path, StageStats())
+
+        # [path, start time, memory at entry, peak so far]
+        self.stack.append([path, time.perf_counter(), mem, mem])
+
+    def exit(self):
+        path, start, mem, peak = self.stack.pop()
+        dt = time.perf_counter() - start
+
+        s = self.stats[path]
+        s.calls += 1
+        s.wall += dt
+
+        if self.stack:
+            self.stats[self.stack[-1][0]].child += dt
+
+        if self.memory:
+            peak = max(peak, self.tracemalloc.get_traced_memory()[1])
+            s.peak = max(s.peak, peak - mem)
+            if self.stack:
+                self.stack[-1][3] = max(self.stack[-1][3], peak)
+
+    def report(self):
+        '''Stages as a JSON compatible dict'''
+        return {
+            'program': os.path.basename(sys.argv[0]),
+            'total': time.perf_counter() - self.start,
+            'stages': [{
+                'stage': '/'.join(path),
+                'calls': s.calls,
+                'wall': s.wall,
+                'self': s.wall - s.child,
+                'peak_memory': s.peak if self.memory else None,
+            } for path, s in self.stats.items()],
+        }
+
+    def table(self):
+        lines = ['%-40s %8s %10s %10s %12s' % ('stage', 'calls', 'wall', 'self', 'peak MB')]
+        for v in self.report()['stages']:
+            depth = v['stage'].count('/')
+            name = '  ' * depth + v['stage'].split('/')[-1]
+            peak = '-' if v['peak_memory'] is None else '%.2f' % (v['peak_memory'] / 1e6)
+            lines.append('%-40s %8d %9.4fs %9.4fs %12s' % (name, v['calls'], v['wall'], v['self'], peak))
+        return '\n'.join(lines)
+
+    def folded(self):
+        '''Self time of the stages in microseconds, as folded stacks'''
+        return ''.join(['%s %d\n' % (';'.join(path), round((s.wall - s.child) * 1e6)) for path, s in self.stats.items()])
+
+class _Stage():
+    __slots__ = ('recorder', 'name')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.recorder.enter(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.recorder.exit()
+        return False
+
+# Recorder of the process, None if disabled
+recorder = None
+_profiler = None
+
+def stage(name):
+    '''Context manager of a named stage'''
+    if recorder is None:
+        return _NULL_STAGE
+    return recorder.stage(name)
+
+def timed(name = None):
+    '''Decorator of a function as a stage, the stage is named by the function by default'''
+    def decorator(f):
+        if recorder is None:
+            return f
+
+        stageName = name or f.__name__
+        def wrapper(*args, **kwargs):
+            with recorder.stage(stageName):
+                return f(*args, **kwargs)
+
+        wrapper.__name__ = f.__name__
+        wrapper.__doc__ = f.__doc__
+        return wrapper
+    return decorator
+
+def collect():
+    '''Report of the stages since the last collect, None if disabled.
+    The stages are cleared, call it out of any stage.'''
+    if recorder is None:
+        return None
+
+    report = recorder.report()
+    recorder.stats = {}
+    return report
+
+def merge(report):
+    '''Add the stages of a report of another process, as top level stages'''
+    if recorder is None or report is None:
+        return
+
+    for v in report['stages']:
+        s = recorder.stats.setdefault(tuple(v['stage'].split('/')), StageStats())
+        s.calls += v['calls']
+        s.wall += v['wall']
+        s.child += v['wall'] - v['self']
+        if v['peak_memory'] is not None:
+            s.peak = max(s.peak, v['peak_memory'])
+
+    # Stages first entered in the report are reported after their parents
+    order = {path: i for i, path in enumerate(recorder.stats)}
+    recorder.stats = dict(sorted(recorder.stats.items(),
+                                 key = lambda v: [order[v[0][:i + 1]] for i in range(len(v[0]))]))
+
+def _finish(reportFile, profileFile, foldedFile):
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(profileFile)
+
+    if reportFile in ('1', ''):
+        print(recorder.table(), file = sys.stderr)
+    else:
+        with open(reportFile, 'w') as f:
+            json.dump(recorder.report(), f, indent = 2)
+
+    if foldedFile:
+        with open(foldedFile, 'w') as f:
+            f.write(recorder.folded())
+
+def enable(reportFile = '1', memory = False, profileFile = None, foldedFile = None):
+    '''Enable the instrumentation, the reports are written at exit.
+    Functions decorated by timed() before are not instrumented.'''
+    global recorder, _profiler
+    if recorder is not None:
+        return
+
+    recorder = Recorder(memory)
+    if profileFile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+    atexit.register(_finish, reportFile, profileFile, foldedFile)
+
+if os.environ.get('INSTRUMENT'):
+    enable(os.environ['INSTRUMENT'], os.environ.get('INSTRUMENT_MEMORY', '') not in ('', '0'),
+           os.environ.get('INSTRUMENT_PROFILE'), os.environ.get('INSTRUMENT_FOLDED'))
@@ -0,0 +1,299 @@
+'''
+    bench_suite.py
+    Benchmarks of the Python tools, compared against a stored baseline
+'''
+import sys, getopt, os, io, time, json, platform, subprocess, tempfile, importlib.util
+from contextlib import redirect_stdout
+
+HELP_MESSAGE = '''Benchmark suite of the Python tools.
+Usage: python bench_suite.py [-S] [-k <filter>] [-r <repeats>] [-o <result_file>] [-b <baseline_file>] [-s] [-t <threshold>] [-l] [-h]
+    -S
+        Scaled-up inputs: R/N of large CIC filters, 10k-instruction display
+        lists, 10k-register maps, 1e8-sample stimuli. Representative inputs
+        by default.
+    -k <filter>
+        Run the benchmarks whose name contains one of the comma separated filters.
+    -r <repeats>
+        Repeats of each benchmark, the best time is kept. 3 by default.
+    -o <result_file>
+        Write the results as JSON.
+    -b <baseline_file>
+        Compare the results against the baseline, bench_baseline.json by default.
+    -s
+        Save the results as the baseline.
+    -t <threshold>
+        Relative slowdown flagged as a regression, 0.1 (10%) by default.
+    -l
+        List the benchmarks.
+    -h
+        Display this help message.
+
+Exit code is 1 if a benchmark fails, is slower than the baseline by the
+threshold, or the baseline is of the other inputs (scaled or representative).
+Baselines are per machine, save one on the build machine before comparing.'''
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+BASELINE_FILE = os.path.join(SCRIPT_DIR, 'bench_baseline.json')
+# Changes below this are timer noise, in seconds
+MIN_DELTA = 0.005
+
+def loadModule(path, name):
+    '''Import a module by path, the folder of the module is added to the module path'''
+    folder = os.path.dirname(path)
+    if not folder in sys.path:
+        sys.path.insert(0, folder)
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+def runScript(path, args, cwd):
+    '''Run a script, the time includes the start of the interpreter'''
+    env = dict(os.environ, MPLBACKEND = 'Agg')
+    p = subprocess.run([sys.executable, path] + args, cwd = cwd, env = env, capture_output = True, text = True)
+    if p.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (os.path.basename(path), p.stdout + p.stderr))
+
+# Benchmarks, a benchmark takes the scale and a temporary folder and returns
+# a function to time, the setup is not timed
+
+def benchHogenauer(scaled, tmp):
+    hp = loadModule(os.path.join(SCRIPT_DIR, 'HogenaurPruning.py'), 'HogenaurPruning')
+    # (R, M, N, B_in, B_out), small R and large N have the most terms
+    params = [(64, 1, 5, 16, 16)] if not scaled else [(8, 1, 10, 16, 16), (1024, 2, 8, 16, 24)]
+
+    def run():
+        for R, M, N, bi, bo in params:
+            calc = hp.HogenauerPruning(R, M, N, bi, bo)
+            calc.get_integrators()
+            calc.get_combs()
+    return run
+
+def graphicSource(n):
+    '''Assembly of n instructions, boxes and strings in labeled blocks'''
+    lines = ['.equ W, 16']
+    for i in range(n):
+        if i % 64 == 0:
+            lines.append('BLOCK_%d:' % (i // 64))
+        if i % 4 == 3:
+            lines.append('    STRING %d, %d, %d, "CH%d", 1, 0, 1' % (i % 1024, i % 768, i % 768 + 8, i % 16))
+        else:
+            lines.append('    BOX %d * W %% 1024, %d, %d, W, %d, 0' % (i, i % 768, i % 768 + 4, i % 4))
+    lines.append('    JUMP BLOCK_0')
+
+    return '\n'.join(lines) + '\n'
+
+def benchGraphic(scaled, tmp):
+    folder = os.path.join(ROOT_DIR, 'rtl', 'graphic', 'graph_inst_compiler')
+    asm = loadModule(os.path.join(folder, 'GraphicAssembler.py'), 'GraphicAssembler')
+    gc = loadModule(os.path.join(folder, 'GraphicCompiler.py'), 'GraphicCompiler')
+    src = graphicSource(10000 if scaled else 1000)
+
+    def run():
+        g = gc.GraphicCompiler()
+        g.load(asm.GraphicAssembler().assemble(src))
+        g.map_data()
+        g.compile()
+        g.get_machine_code()
+    return run
+
+def benchRegif(scaled, tmp):
+    folder = os.path.join(SCRIPT_DIR, 'regif_generator')
+    sys.path.insert(0, folder)
+    from bench_regif import syntheticDescription
+    from RegifDescription import validate
+    from rif_2_verilog import RegifSrcGenerator
+
+    with open(os.path.join(folder, 'src_tmpl', 'template_axi.v'), 'r') as f:
+        template = f.read()
+    raw = syntheticDescription(10000 if scaled else 100)
+
+    def run():
+        RegifSrcGenerator(template, validate(raw), 'bench.yml', 'bench.v').generateSource()
+    return run
+
+def spectrumConfig(tmp, length):
+    path = os.path.join(tmp, 'config.yml')
+    with open(path, 'w') as f:
+        f.write('''output-file: 'spectrum.mem'
+length: %d
+samplerate: 2.0e+4
+quant: 15
+spectrum:
+  - {freq: 0.01, ampl: 0.02}
+  - {freq: 0.05, ampl: 0.02}
+noise:
+  enable: True
+  snr: -30
+''' % length)
+    return path
+
+def benchGenerateSpectrum(scaled, tmp):
+    script = os.path.join(ROOT_DIR, 'tb', 'infrastructure', 'data_proc', 'generate_spectrum.py')
+    config = spectrumConfig(tmp, 100000000 if scaled else 1000000)
+
+    return lambda: runScript(script, ['-c', config, '-o', 'spectrum.mem'], tmp)
+
+def benchReadSpectrum(scaled, tmp):
+    ds = loadModule(os.path.join(ROOT_DIR, 'tb', 'infrastructure', 'data_proc', 'display_spectrum.py'), 'display_spectrum')
+    n = 100000000 if scaled else 1000000
+
+    path = os.path.join(tmp, 'read.mem')
+    with open(path, 'w') as f:
+        for i in range(0, n, 100000):
+            f.write('\n'.join(['%04x' % ((i + j) * 7 % 65536) for j in range(min(100000, n - i))]) + '\n')
+
+    return lambda: ds.readDataFile(path)
+
+def benchFrbm(scaled, tmp):
+    script = os.path.join(ROOT_DIR, 'tb', 'dsp', 'frbm_src_gen.py')
+    n = 1000000 if scaled else 100000
+
+    data = os.path.join(tmp, 'vec.mem')
+    with open(data, 'w') as f:
+        f.write(''.join(['%08x\n' % (i * 2654435761 % (1 << 32)) for i in range(n)]))
+
+    stimulus = os.path.join(tmp, 'stimulus.fri')
+    template = 'C "Vectors"\n; INSERT S VEC vec.mem HERE\nQ\n'
+
+    def run():
+        # The generator inserts in place, the stimulus is restored each time
+        with open(stimulus, 'w') as f:
+            f.write(template)
+        runScript(script, ['-i', 'vec.mem', '-o', stimulus], tmp)
+    return run
+
+BENCHMARKS = {
+    'hogenauer_pruning': benchHogenauer,
+    'graphic_compiler': benchGraphic,
+    'regif_verilog': benchRegif,
+    'generate_spectrum': benchGenerateSpectrum,
+    'display_spectrum_read': benchReadSpectrum,
+    'frbm_src_gen': benchFrbm,
+}
+
+def best(f, repeats):
+    t = None
+    for i in range(repeats):
+        # The messages of the tools are not timed on the console
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            f()
+            dt = time.perf_counter() - start
+        t = dt if t is None else min(t, dt)
+    return t
+
+def runBenchmarks(names, scaled = False, repeats = 3):
+    '''Results of the benchmarks, in seconds, None if a benchmark fails'''
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                f = BENCHMARKS[name](scaled, tmp)
+                results[name] = best(f, repeats)
+            except Exception as e:
+                print('%-24s FAILED, %s: %s' % (name, type(e).__name__, str(e).strip().splitlines()[-1] if str(e).strip() else ''))
+                results[name] = None
+                continue
+
+        print('%-24s %10.3fs' % (name, results[name]))
+
+    return {
+        'scaled': scaled,
+        'repeats': repeats,
+        'time': time.asctime(time.localtime()),
+        'machine': '%s %s, %s' % (platform.system(), platform.machine(), platform.processor()),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+def compare(current, baseline, threshold = 0.1):
+    '''Compare the results against the baseline, returns the regressions'''
+    if current['scaled'] != baseline.get('scaled'):
+        raise RuntimeError('The baseline is of %s inputs, run with%s -S' %
+                           (('scaled', '') if baseline.get('scaled') else ('representative', 'out')))
+
+    regressions = []
+    print('%-24s %10s %10s %8s' % ('benchmark', 'baseline', 'current', 'change'))
+    for name, t in current['results'].items():
+        base = baseline['results'].get(name)
+        if t is None or base is None:
+            print('%-24s %10s %10s' % (name, '-' if base is None else '%.3fs' % base, '-' if t is None else '%.3fs' % t))
+            continue
+
+        change = t / base - 1
+        flag = ''
+        if change > threshold and t - base > MIN_DELTA:
+            flag = ' SLOWER'
+            regressions.append(name)
+        print('%-24s %9.3fs %9.3fs %+7.1f%%%s' % (name, base, t, change * 100, flag))
+
+    return regressions
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hSk:r:o:b:st:l")
+
+    scaled = False
+    filters = None
+    repeats = 3
+    resultFile = None
+    baselineFile = BASELINE_FILE
+    save = False
+    threshold = 0.1
+
+    for opt,val in opts:
+        if opt == '-S':
+            scaled = True
+        elif opt == '-k':
+            filters = val.split(',')
+        elif opt == '-r':
+            repeats = int(val)
+        elif opt == '-o':
+            resultFile = val
+        elif opt == '-b':
+            baselineFile = val
+        elif opt == '-s':
+            save = True
+        elif opt == '-t':
+            threshold = float(val)
+        elif opt == '-l':
+            for v in BENCHMARKS:
+                print(v)
+            sys.exit()
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    names = [v for v in BENCHMARKS if not filters or any([f in v for f in filters])]
+    current = runBenchmarks(names, scaled, repeats)
+    failed = [k for k, v in current['results'].items() if v is None]
+    if failed:
+        print('FAILED: %s' % ', '.join(failed))
+
+    if resultFile is not None:
+        with open(resultFile, 'w') as f:
+            json.dump(current, f, indent = 2)
+
+    if save:
+        with open(baselineFile, 'w') as f:
+            json.dump(current, f, indent = 2)
+        print('Baseline saved to %s' % baselineFile)
+        sys.exit(1 if failed else 0)
+
+    if not os.path.isfile(baselineFile):
+        print('No baseline %s, save one with -s' % baselineFile)
+        sys.exit(1 if failed else 0)
+
+    with open(baselineFile, 'r') as f:
+        baseline = json.load(f)
+
+    try:
+        regressions = compare(current, baseline, threshold)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    sys.exit(1 if regressions or failed else 0)
@@ -0,0 +1,220 @@
+'''
+    fft_window.py
+    Fixed-point window tables of fft_window, with the metrics after quantization
+
+    Tables are cached by their parameters in .window_cache (WINDOW_CACHE to
+    move it), so the regression and build flows reuse them.
+
+    Usage as a library:
+        from fft_window import windowTable
+
+        coeffs, metrics = windowTable('kaiser:8.6', 1024, 16)
+'''
+import sys, getopt, os, math, json
+import numpy as np
+from scipy.signal import windows
+
+HELP_MESSAGE = '''Generate the window table (MEM_FILE) of fft_window.
+Usage: python fft_window.py [-w <windows>] [-n <length>] [-b <width>] [-f <fraction>] [-s] [-o <output_file>] [-r] [-F] [-h]
+    -w <windows>
+        Comma separated windows, hann by default:
+            hann, hamming, blackmanharris, flattop,
+            kaiser:<beta> (8.6 by default), chebwin:<attenuation dB> (100 by default)
+    -n <length>
+        Length of the window, the DATA_CNT of fft_window. 1024 by default.
+    -b <width>
+        Word length of the coefficients, the DW of fft_window. 16 by default.
+    -f <fraction>
+        Fraction bits of the coefficients, width - 1 by default (peak of 1.0
+        saturates to the largest positive word).
+    -s
+        Symmetric window, as window() of MATLAB. Periodic (DFT-even) by default.
+    -o <output_file>
+        Memory file, fft_window_<window>.mem by default. A folder is allowed
+        when several windows are given.
+    -r
+        Report the metrics only, no file is written.
+    -F
+        Regenerate the tables, ignoring the cache.
+    -h
+        Display this help message.'''
+
+CACHE_DIR = os.environ.get('WINDOW_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.window_cache'))
+# Bumped when the tables or metrics change, so stale entries are not reused
+CACHE_VERSION = 1
+
+# Windows by name, with the default parameter
+WINDOWS = {
+    'hann':             (lambda n, p, sym: windows.hann(n, sym = sym), None),
+    'hamming':          (lambda n, p, sym: windows.hamming(n, sym = sym), None),
+    'blackmanharris':   (lambda n, p, sym: windows.blackmanharris(n, sym = sym), None),
+    'flattop':          (lambda n, p, sym: windows.flattop(n, sym = sym), None),
+    'kaiser':           (lambda n, p, sym: windows.kaiser(n, p, sym = sym), 8.6),
+    'chebwin':          (lambda n, p, sym: windows.chebwin(n, p, sym = sym), 100.0),
+}
+
+def parseWindow(window):
+    '''Name and parameter of a window as name[:parameter]'''
+    name, _, param = window.partition(':')
+    if not name in WINDOWS:
+        raise ValueError('Unknown window %s, the windows are %s' % (name, ', '.join(WINDOWS)))
+
+    default = WINDOWS[name][1]
+    if param and default is None:
+        raise ValueError('%s has no parameter' % name)
+
+    return name, float(param) if param else default
+
+def windowKey(window, length, width, fraction, symmetric):
+    name, param = parseWindow(window)
+    label = name if param is None else '%s-%g' % (name, param)
+    return '%s_n%d_w%d_f%d_%s_v%d' % (label, length, width, fraction, 'sym' if symmetric else 'per', CACHE_VERSION)
+
+def quantize(w, width, fraction):
+    '''Signed integers of the window, saturated to the word'''
+    top = (1 << (width - 1)) - 1
+    return np.clip(np.round(w * (1 << fraction)), -top - 1, top).astype(np.int64)
+
+def windowMetrics(w):
+    '''Coherent gain, ENBW in bins and scalloping loss in dB'''
+    n = len(w)
+    s = w.sum()
+    # Response half a bin off the center
+    half = np.abs(np.sum(w * np.exp(-1j * np.pi * np.arange(n) / n)))
+
+    return {
+        'coherent_gain': float(s / n),
+        'enbw': float(n * np.sum(w * w) / (s * s)),
+        'scalloping_loss': float(-20 * math.log10(half / abs(s))),
+    }
+
+def generateWindow(window, length = 1024, width = 16, fraction = None, symmetric = False):
+    '''Window table and its metrics, of the float and the quantized window'''
+    name, param = parseWindow(window)
+    fraction = width - 1 if fraction is None else fraction
+
+    w = WINDOWS[name][0](length, param, symmetric)
+    q = quantize(w, width, fraction)
+    wq = q / (1 << fraction)
+
+    metrics = {
+        'window': window,
+        'length': length,
+        'width': width,
+        'fraction': fraction,
+        'symmetric': symmetric,
+        'float': windowMetrics(w),
+        'quantized': windowMetrics(wq),
+        'max_error': float(np.abs(wq - w).max()),
+        # A peak of 1.0 at width - 1 fraction bits is one LSB off, and not counted
+        'saturated': int(np.sum(np.abs(w * (1 << fraction)) > (1 << (width - 1)))),
+    }
+
+    return q, metrics
+
+def formatTable(coeffs, width):
+    digits = (width + 3) // 4
+    mask = (1 << width) - 1
+    return '\n'.join([('%0*x' % (digits, int(v) & mask)) for v in coeffs])
+
+def windowTable(window, length = 1024, width = 16, fraction = None, symmetric = False, force = False):
+    '''Window table and its metrics, from the cache if generated before'''
+    fraction = width - 1 if fraction is None else fraction
+    key = windowKey(window, length, width, fraction, symmetric)
+    memFile = os.path.join(CACHE_DIR, key + '.mem')
+    metricsFile = os.path.join(CACHE_DIR, key + '.json')
+
+    if not force and os.path.isfile(memFile) and os.path.isfile(metricsFile):
+        with open(memFile, 'r') as f:
+            coeffs = np.array([int(v, 16) for v in f.read().split()], dtype = np.int64)
+        # The words are stored unsigned
+        coeffs = np.where(coeffs >= (1 << (width - 1)), coeffs - (1 << width), coeffs)
+        with open(metricsFile, 'r') as f:
+            metrics = json.load(f)
+        metrics['window'] = window
+        return coeffs, metrics
+
+    coeffs, metrics = generateWindow(window, length, width, fraction, symmetric)
+
+    # Written aside and renamed, so parallel flows never read a partial entry
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    for path, text in ((memFile, formatTable(coeffs, width)), (metricsFile, json.dumps(metrics, indent = 2))):
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    return coeffs, metrics
+
+def writeWindowFile(window, path, length = 1024, width = 16, fraction = None, symmetric = False, force = False):
+    '''Write the cached table to the memory file, returns the metrics'''
+    coeffs, metrics = windowTable(window, length, width, fraction, symmetric, force)
+    with open(path, 'w') as f:
+        f.write(formatTable(coeffs, width))
+    return metrics
+
+def report(li):
+    print('%-20s %8s %8s %10s %10s %10s %12s' % ('window', 'CG', 'ENBW', 'ENBW(q)', 'SL dB', 'SL(q) dB', 'max error'))
+    for m in li:
+        print('%-20s %8.4f %8.4f %10.4f %10.4f %10.4f %12.3e' % (m['window'], m['quantized']['coherent_gain'],
+              m['float']['enbw'], m['quantized']['enbw'], m['float']['scalloping_loss'],
+              m['quantized']['scalloping_loss'], m['max_error']))
+        if m['saturated']:
+            print('    %d coefficients saturated, use fewer fraction bits for a unity peak' % m['saturated'])
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hw:n:b:f:so:rF")
+
+    window_list = ['hann']
+    length = 1024
+    width = 16
+    fraction = None
+    symmetric = False
+    output = None
+    reportOnly = False
+    force = False
+
+    for opt,val in opts:
+        if opt == '-w':
+            window_list = val.split(',')
+        elif opt == '-n':
+            length = int(val)
+        elif opt == '-b':
+            width = int(val)
+        elif opt == '-f':
+            fraction = int(val)
+        elif opt == '-s':
+            symmetric = True
+        elif opt == '-o':
+            output = val
+        elif opt == '-r':
+            reportOnly = True
+        elif opt == '-F':
+            force = True
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    li = []
+    try:
+        for window in window_list:
+            if reportOnly:
+                li.append(windowTable(window, length, width, fraction, symmetric, force)[1])
+                continue
+
+            name = 'fft_window_%s.mem' % window.replace(':', '_')
+            if output is None:
+                path = name
+            elif os.path.isdir(output) or len(window_list) > 1:
+                os.makedirs(output, exist_ok = True)
+                path = os.path.join(output, name)
+            else:
+                path = output
+
+            li.append(writeWindowFile(window, path, length, width, fraction, symmetric, force))
+            print('Window saved to %s' % path)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    report(li)
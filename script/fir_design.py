@@ -0,0 +1,257 @@
+'''
+    fir_design.py
+    Fixed-point FIR coefficient designer for the multi-cycle FIR (fir_bram_mc)
+
+    The tap count and the coefficient word length are searched jointly, and
+    the smallest design meeting the spec is written as the MEM_FILE of the
+    filter. fir_bram_mc takes one cycle per tap, so fewer taps sustain a higher
+    sample rate, and narrower coefficients fit a narrower multiplier.
+'''
+import sys, getopt, math
+from dataclasses import dataclass
+import numpy as np
+from scipy import signal
+import yaml
+
+HELP_MESSAGE = '''Design the coefficients of fir_bram_mc from a passband/stopband spec.
+Usage: python fir_design.py -c <config_file> [-o <output_file>] [-h]
+    -c <config_file>
+        YAML spec of the filter, e.g. fir_design.yml.
+    -o <output_file>
+        Memory file of the coefficients, output-file of the spec by default.
+    -h
+        Display this help message.
+
+Spec:
+    samplerate      Sample rate, band edges are in the same unit. 2.0 by
+                    default, i.e. edges normalized to the Nyquist frequency.
+    passband        List of [low, high] bands with the gain.
+    stopband        List of [low, high] bands.
+    ripple          Peak-to-peak passband ripple in dB.
+    attenuation     Minimum stopband attenuation in dB.
+    gain            Passband gain, 1.0 by default.
+    max-taps        Largest tap count searched, 1024 (the coefficient buffer) by default.
+    min-width       Narrowest coefficient word length searched, 8 by default.
+    width           Word length of the coefficient memory, 16 by default.
+    fraction        Fraction bits of the coefficients, 16 by default
+                    (the output of fir_bram_mc is acc[31:16]).
+    clock           Clock of the filter, to report the sustainable sample rate.
+    output-file     Memory file of the coefficients.'''
+
+# The coefficient buffer of fir_bram_mc
+MAX_TAPS = 1024
+# Tap counts evaluated in one pass
+TAPS_PER_PASS = 16
+# Frequency points per band, per tap of the largest candidate
+GRID_DENSITY = 16
+
+@dataclass
+class FirSpec():
+    passband: list
+    stopband: list
+    ripple: float
+    attenuation: float
+    samplerate: float = 2.0
+    gain: float = 1.0
+    maxTaps: int = MAX_TAPS
+    minWidth: int = 8
+    width: int = 16
+    fraction: int = 16
+
+    @property
+    def passDeviation(self):
+        '''Allowed relative deviation of the passband gain'''
+        v = pow(10, self.ripple / 20)
+        return (v - 1) / (v + 1)
+
+    @property
+    def stopDeviation(self):
+        '''Allowed stopband gain relative to the passband gain'''
+        return pow(10, -self.attenuation / 20)
+
+@dataclass
+class FirDesign():
+    taps: int
+    width: int
+    coeffs: np.ndarray          # Integers of the memory word, LSBs below the width are zero
+    passError: float            # Relative passband deviation
+    stopGain: float             # Relative stopband gain
+    candidates: int             # Candidates evaluated
+
+def loadSpec(config):
+    '''Spec from the parsed YAML config'''
+    for v in ('passband', 'stopband', 'ripple', 'attenuation'):
+        if not v in config:
+            raise ValueError('%s is missing from the spec' % v)
+
+    spec = FirSpec(
+        passband = [list(map(float, v)) for v in config['passband']],
+        stopband = [list(map(float, v)) for v in config['stopband']],
+        ripple = float(config['ripple']),
+        attenuation = float(config['attenuation']),
+        samplerate = float(config.get('samplerate', 2.0)),
+        gain = float(config.get('gain', 1.0)),
+        maxTaps = int(config.get('max-taps', MAX_TAPS)),
+        minWidth = int(config.get('min-width', 8)),
+        width = int(config.get('width', 16)),
+        fraction = int(config.get('fraction', 16)),
+    )
+
+    nyquist = spec.samplerate / 2
+    bands = sorted(spec.passband + spec.stopband)
+    for i, (lo, hi) in enumerate(bands):
+        if lo < 0 or hi > nyquist or lo >= hi:
+            raise ValueError('Invalid band [%g, %g], the edges are within [0, %g]' % (lo, hi, nyquist))
+        if i > 0 and lo <= bands[i - 1][1]:
+            raise ValueError('Bands [%g, %g] and [%g, %g] overlap' % (*bands[i - 1], lo, hi))
+    if spec.maxTaps > MAX_TAPS:
+        raise ValueError('fir_bram_mc holds up to %d taps' % MAX_TAPS)
+    if not 2 <= spec.minWidth <= spec.width:
+        raise ValueError('min-width must be within [2, width]')
+
+    return spec
+
+def estimateTaps(spec):
+    '''Tap count of the float design by the Kaiser formula, a start of the search'''
+    edges = sorted(spec.passband + spec.stopband)
+    transition = min([edges[i][0] - edges[i - 1][1] for i in range(1, len(edges))])
+    deviation = min(spec.passDeviation, spec.stopDeviation)
+    taps, beta = signal.kaiserord(-20 * math.log10(deviation), transition / (spec.samplerate / 2))
+    return taps
+
+def frequencyGrid(spec, taps):
+    '''Frequency points of the bands, in radians per sample, and whether a point is in the passband'''
+    points = []
+    isPass = []
+    for bands, flag in ((spec.passband, True), (spec.stopband, False)):
+        for lo, hi in bands:
+            n = max(8, int(GRID_DENSITY * taps * (hi - lo) / spec.samplerate))
+            points.append(np.linspace(lo, hi, n) * 2 * np.pi / spec.samplerate)
+            isPass.append(np.full(n, flag))
+    return np.concatenate(points), np.concatenate(isPass)
+
+def floatTaps(spec, taps):
+    '''Equiripple design weighted by the deviations, None if it fails'''
+    nyquist = spec.samplerate / 2
+    # An even tap count has a zero at the Nyquist frequency
+    if taps % 2 == 0 and any([hi >= nyquist for lo, hi in spec.passband]):
+        return None
+
+    bands = sorted([(v, spec.gain, 1 / spec.passDeviation) for v in spec.passband] +
+                   [(v, 0.0, 1 / spec.stopDeviation) for v in spec.stopband])
+    try:
+        return signal.remez(taps, [f for v in bands for f in v[0]], [v[1] for v in bands],
+                            weight = [v[2] for v in bands], fs = spec.samplerate, maxiter = 100)
+    except (ValueError, RuntimeError):
+        # Remez does not converge for some tap counts, least squares is the fallback
+        try:
+            return signal.firls(taps, [f for v in bands for f in v[0]], [d for v in bands for d in (v[1], v[1])],
+                                weight = [v[2] for v in bands], fs = spec.samplerate)
+        except ValueError:
+            return None
+
+def quantize(spec, h, width):
+    '''Integers of the memory word with the width most significant bits, None if saturated'''
+    step = 1 << (spec.width - width)
+    q = np.round(h * (1 << spec.fraction) / step) * step
+    if q.max() > (1 << (spec.width - 1)) - step or q.min() < -(1 << (spec.width - 1)):
+        return None
+    return q.astype(np.int64)
+
+def evaluate(spec, coeffs, grid, isPass):
+    '''Relative passband deviation and stopband gain of the rows of coefficients, in one pass'''
+    n = np.arange(coeffs.shape[1])
+    response = np.abs((coeffs / (1 << spec.fraction)) @ np.exp(-1j * np.outer(n, grid))) / spec.gain
+
+    passError = np.abs(response[:, isPass] - 1).max(axis = 1) if isPass.any() else np.zeros(len(coeffs))
+    stopGain = response[:, ~isPass].max(axis = 1) if (~isPass).any() else np.zeros(len(coeffs))
+    return passError, stopGain
+
+def designFir(spec, verbose = True):
+    '''Smallest design meeting the spec, the fewest taps then the narrowest coefficients'''
+    widths = list(range(spec.minWidth, spec.width + 1))
+    # Equiripple designs need fewer taps than the Kaiser estimate
+    start = max(3, int(estimateTaps(spec) * 0.6))
+    total = 0
+
+    for first in range(start, spec.maxTaps + 1, TAPS_PER_PASS):
+        last = min(first + TAPS_PER_PASS, spec.maxTaps + 1)
+        grid, isPass = frequencyGrid(spec, last)
+
+        # All quantized candidates of the tap counts, zero padded to a matrix
+        candidates = []
+        rows = []
+        for taps in range(first, last):
+            h = floatTaps(spec, taps)
+            if h is None:
+                continue
+            for w in widths:
+                q = quantize(spec, h, w)
+                if q is not None:
+                    candidates.append((taps, w))
+                    rows.append(np.pad(q, (0, last - taps)))
+        if not rows:
+            if verbose:
+                print('Taps %d-%d: the coefficients saturate, a lower gain fits the coefficient range' % (first, last - 1))
+            continue
+        total += len(rows)
+
+        passError, stopGain = evaluate(spec, np.array(rows), grid, isPass)
+        ok = (passError <= spec.passDeviation) & (stopGain <= spec.stopDeviation)
+        if verbose:
+            print('Taps %d-%d: %d candidates, %d meet the spec' % (first, last - 1, len(rows), ok.sum()))
+
+        if ok.any():
+            # Candidates are ordered by taps then width
+            i = int(np.argmax(ok))
+            taps, w = candidates[i]
+            return FirDesign(taps, w, rows[i][:taps], float(passError[i]), float(stopGain[i]), total)
+
+    raise ValueError('No design up to %d taps meets the spec' % spec.maxTaps)
+
+def writeMemFile(design, width, path):
+    '''Coefficients as hex words, for $readmemh'''
+    digits = (width + 3) // 4
+    mask = (1 << width) - 1
+    with open(path, 'w') as f:
+        f.write('\n'.join([('%0*x' % (digits, int(v) & mask)) for v in design.coeffs]))
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hc:o:")
+
+    config_file = None
+    output_file = None
+
+    for opt,val in opts:
+        if opt == '-c':
+            config_file = val
+        elif opt == '-o':
+            output_file = val
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    if config_file is None:
+        print(HELP_MESSAGE)
+        sys.exit()
+
+    with open(config_file, 'r') as f:
+        config = yaml.load(f, Loader = yaml.FullLoader)
+    output_file = output_file or config.get('output-file', 'fir.mem')
+
+    try:
+        spec = loadSpec(config)
+        design = designFir(spec)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    print('Taps: %d, coefficient width: %d bits, %d candidates evaluated' % (design.taps, design.width, design.candidates))
+    print('Passband ripple: %.3f dB, stopband attenuation: %.1f dB' %
+          (20 * math.log10((1 + design.passError) / (1 - design.passError)), -20 * math.log10(max(design.stopGain, 1e-12))))
+    print('Set the rate field of the control register to %d, %d cycles per output' % (design.taps, design.taps))
+    if 'clock' in config:
+        print('Sustainable sample rate: %g' % (float(config['clock']) / design.taps))
+
+    writeMemFile(design, spec.width, output_file)
+    print('Coefficients saved to %s' % output_file)
@@ -1,10 +1,31 @@
 '''
     CodeblockGenerators.py
     Code Block Generators
+
+    The generators take the register list of a description and the signal
+    names below, and generate the items of the blocks in a template.
+
+        write-address, read-address     Byte address of the access
+        write-strobe                    Byte strobes, 'none' if not used
+        write-data, read-data           Data of the access
+        write-enable                    Write of the write-address, of the BRAM ports
+        clock                           Clock of the BRAM ports
+
+    Registers with count > 0 are arrays, mapped to a block RAM of count words
+    aligned to its size. The read/write blocks are the items of a
+    casex of the word address, as the ahb_intf_* modules do, and the BRAMs
+    are read and written by their own ports:
+
+        casex(haddr_s[15:2])
+            ${reg_read}
+        endcase
 '''
 import math
 from string import Template
 
+# Width of the bus address
+ADDRESS_WIDTH = 32
+
 class CodeBlockGenerator():
     '''Base class of code block generators.'''
     BLOCK_TEMPLATE: str
@@ -13,37 +34,51 @@ class CodeBlockGenerator():
     reg_description: list
     signals: dict
 
-    def __init__(self, desc: list, signals: dict):
+    def __init__(self, desc: list, signals: dict, bus_width: int = 4):
         self.reg_description = desc
         self.signals = signals
+        self.bus_width = bus_width
 
     def generate(self):
         '''Generate code block'''
 
     def substitude(self, code_src):
-        '''Substitude the flag with code block'''
+        '''Substitude the flag with code block, other flags are kept'''
         d = {self.BLOCK_NAME: self.generate()}
 
-        return Template(code_src).substitute(d)
+        return Template(code_src).safe_substitute(d)
 
 class RegDefineGen(CodeBlockGenerator):
     '''Register define block generator'''
-    BLOCK_NAME = 'reg_field_define'
-    BLOCK_TEMPLATE = 'reg [${width}:0] ${name} [0:${count}];\n'
+    BLOCK_NAME = 'reg_define'
+    BLOCK_TEMPLATE = 'reg [${width}:0] ${name};\n'
+    BRAM_TEMPLATE = 'reg [${width}:0] ${name} [0:${count}];\n'
+    BRAM_RDATA_TEMPLATE = 'reg [${width}:0] ${name}_rdata;\n'
 
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
+    def __init__(self, desc: list, signals: dict, bus_width: int = 4, pipelined: bool = False):
+        super().__init__(desc, signals, bus_width)
+        # Define the BRAM output registers of BramPortGen
+        self.pipelined = pipelined
 
     def generate(self):
         s = ''
         for v in self.reg_description:
+            # Declared by the port of a whole-field register
+            if v.get('whole-field', 0) == 1:
+                continue
+
             d = {
                 'width': v['width'] * 8 - 1,
                 'count': v['count'] - 1,
                 'name': v['name']
             }
 
-            s += Template(self.BLOCK_TEMPLATE).substitute(d)
+            if v['count'] == 0:
+                s += Template(self.BLOCK_TEMPLATE).substitute(d)
+            else:
+                s += Template(self.BRAM_TEMPLATE).substitute(d)
+                if self.pipelined:
+                    s += Template(self.BRAM_RDATA_TEMPLATE).substitute(d)
 
         return s
 
@@ -52,9 +87,6 @@ class ResetBlockGen(CodeBlockGenerator):
     BLOCK_NAME = 'reg_reset'
     BLOCK_TEMPLATE = "${name} <= ${width}'h0;\n"
 
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
-
     def generate(self):
         s = ''
         for v in self.reg_description:
@@ -68,154 +100,220 @@ class ResetBlockGen(CodeBlockGenerator):
 
         return s
 
-def get_bram_addr(count: int, addr):
-    addr_space = math.ceil(math.log2(count))
-    return f'{addr}[{addr_space + 1}:2]'
+def indent(s: str):
+    '''Indent the lines of a block by 4 spaces'''
+    return ''.join(['    ' + v for v in s.splitlines(True)])
+
+def get_index_bits(count: int):
+    '''Address bits of the words of a BRAM'''
+    return math.ceil(math.log2(count)) if count > 1 else 0
+
+def get_bram_addr(count: int, addr: str, bus_width: int = 4):
+    '''Word index slice of a BRAM in the byte address signal'''
+    word_bits = int(math.log2(bus_width))
+    index_bits = get_index_bits(count)
+
+    if index_bits == 0:
+        return '0'
+    return f'{addr}[{index_bits + word_bits - 1}:{word_bits}]'
+
+def get_bram_addr_access(count: int, addr: int, bus_width: int = 4):
+    '''Case item of a register or a BRAM at a byte address, of the word
+    address. The index bits of a BRAM are don't care.'''
+    word = addr // bus_width
+    index_bits = get_index_bits(count)
 
-def get_bram_addr_access(count, addr):
-    addr_space = math.ceil(math.log2(count))
-    return (addr >> addr_space).encode('hex') + 'x' * (addr_space + 2)
+    if word & ((1 << index_bits) - 1):
+        raise RuntimeError('BRAM of %d words at 0x%x is not aligned to its size' % (count, addr))
+
+    if index_bits == 0:
+        return "'h%x" % word
+    if index_bits % 4 == 0:
+        return "'h%x%s" % (word >> index_bits, 'x' * (index_bits // 4))
+    return "'b%s%s" % (bin(word >> index_bits)[2:], 'x' * index_bits)
+
+def get_bram_base(count: int, addr: int, addr_sig: str, bus_width: int = 4):
+    '''Comparison of the byte address signal to the base of a BRAM, the
+    address bits above the word index'''
+    lsb = get_index_bits(count) + int(math.log2(bus_width))
+    return f"{addr_sig}[{ADDRESS_WIDTH - 1}:{lsb}] == {ADDRESS_WIDTH - lsb}'h{addr >> lsb:x}"
 
 class WriteBlockGen(CodeBlockGenerator):
-    '''Register write block generator'''
+    '''Register write block generator.
+    The BRAMs are written by BramPortGen, out of the reset block.'''
     BLOCK_NAME = 'reg_write'
-    BLOCK_TEMPLATE = "h${addr}:begin\n${write_block}end\n"
-    REG_WRITE_STRB = "if(${write_strobe}[${n}])\n\t${name}[${end_bit}:${start_bit}] <= ${write_data}[${end_bit}:${start_bit}];\n"
+    BLOCK_TEMPLATE = "${addr}:begin\n${write_block}end\n"
+    REG_WRITE_STRB = "if(${write_strobe}[${n}])\n    ${name}[${end_bit}:${start_bit}] <= ${write_data}[${end_bit}:${start_bit}];\n"
     REG_WRITE = "${name} <= ${write_data}[${end_bit}:0];\n"
-    BRAM_WRITE_STRB = "if(${write_strobe}[${n}])\n\t${name}[${addr}][${end_bit}:${start_bit}] <= ${write_data}[${end_bit}:${start_bit}];\n"
-    BRAM_WRITE = "${name}[${addr}] <= ${write_data}[${end_bit}:0];\n"
-
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
 
     def generate(self):
         # Signal name
         write_strobe = self.signals['write-strobe']
-        write_addr = self.signals['write-addr']
         write_data = self.signals['write-data']
 
+        s = ''
         for v in self.reg_description:
-            block = ''
+            # Read only, or BRAM
+            if v.get('access', 0) == 1 or v['count'] != 0:
+                continue
+
+            d = {
+                'name': v['name'],
+                'write_data': write_data,
+                'write_strobe': write_strobe
+            }
 
             if write_strobe == 'none':
                 # Generate whole register write block
-                d = {
-                    'name': v['name'],
-                    'end_bit': 8 * v['width'] - 1,
-                    'write_data': write_data
-                }
-
-                if v['count'] == 0:
-                    block = Template(self.REG_WRITE).substitute(d)
-                else:
-                    # Get bram write address and append
-                    d['addr'] = get_bram_addr(v['count'], write_addr)
-
-                    block = Template(self.BRAM_WRITE).substitute(d)
+                d['end_bit'] = 8 * v['width'] - 1
+                block = Template(self.REG_WRITE).substitute(d)
             else:
                 # Generate byte strobe block
-                strb_code = ''
-                for i in range(0,v['bytes']):
-                    d = {
-                        'n': str(i),
-                        'start_bit': i * 8,
-                        'end_bit': (i + 1) * 8 - 1,
-                        'write_strobe': write_strobe,
-                        'write_data': write_data
-                    }   
-
-                    if v['count'] == 0:
-                        # Register access
-                        strb_code += Template(self.REG_WRITE_STRB).safe_substitute(d)
-                    else:
-                        # BRAM access
-                        # Get access address and append
-                        d['addr'] = get_bram_addr(v['count'], write_addr)
-
-                        strb_code += Template(self.BRAM_WRITE_STRB).safe_substitute(d)
-
-                block = Template(strb_code).substitute(name = v['name'])
-            
-            # Address generation
-            if v['count'] == 0:
-                # Access single register.
-                addr_access = v['addr']
-            else:
-                # Access a BRAM.
-                addr_access = get_bram_addr_access(v['count'], v['addr'])
+                block = ''
+                for i in range(0, v['width']):
+                    d['n'] = i
+                    d['start_bit'] = i * 8
+                    d['end_bit'] = (i + 1) * 8 - 1
+                    block += Template(self.REG_WRITE_STRB).substitute(d)
 
             d = {
-                'addr': addr_access,
-                'write_block': block
+                'addr': get_bram_addr_access(v['count'], v['addr'], self.bus_width),
+                'write_block': indent(block)
             }
 
-        return Template(self.BLOCK_TEMPLATE).substitute(d)
+            s += Template(self.BLOCK_TEMPLATE).substitute(d)
+
+        return s
 
 class ReadBlockGen(CodeBlockGenerator):
     '''Read block generator, base class'''
-    BLOCK_NAME = 'reg_reset'
-    BLOCK_TEMPLATE = "h${addr}:begin\n${read_block}end\n"
+    BLOCK_NAME = 'reg_read'
+    BLOCK_TEMPLATE = "${addr}:${read_block}\n"
     REG_READ = ''
     BRAM_READ = ''
 
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
-
     def generate(self):
         # Signals
         read_data = self.signals['read-data']
+        read_addr = self.signals['read-address']
 
-        block = ''
+        s = ''
         for v in self.reg_description:
-            # Get register/BRAM address
-            if v['count'] == 0:
-                # Access single register.
-                d = {
-                    'read_data': read_data,
-                    'name': v['name']
-                }
-            else:
-                # Access a BRAM.
-                d = {
-                    'read_data': read_data,
-                    'ram_addr': get_bram_addr(v['count'], v['addr']),
-                    'name': v['name']
-                }
+            # Write only
+            if v.get('access', 0) == 2:
+                continue
 
-            block += Template(self.REG_READ).substitute(d)
+            d = {
+                'read_data': read_data,
+                'ram_addr': get_bram_addr(v['count'], read_addr, self.bus_width),
+                'name': v['name']
+            }
 
-            # Get register access address
             if v['count'] == 0:
                 # Access single register.
-                addr_access = v['addr']
+                block = Template(self.REG_READ).substitute(d)
             else:
                 # Access a BRAM.
-                addr_access = get_bram_addr_access(v['count'], v['addr'])
+                block = Template(self.BRAM_READ).substitute(d)
 
-        d = {
-            'addr': addr_access,
-            'read_block': block
-        }
+            d = {
+                'addr': get_bram_addr_access(v['count'], v['addr'], self.bus_width),
+                'read_block': block
+            }
 
-        return Template(self.BLOCK_TEMPLATE).substitute(d)
+            s += Template(self.BLOCK_TEMPLATE).substitute(d)
+
+        return s
 
 class ReadBlockGenSync(ReadBlockGen):
     '''Read block generator, synchonous'''
-    REG_READ = '${read_data} <= ${name}'
-    BRAM_READ = '${read_data} <= ${name}[${ram_addr}:2]'
+    REG_READ = '${read_data} <= ${name};'
+    BRAM_READ = '${read_data} <= ${name}[${ram_addr}];'
 
 class ReadBlockGenAsync(ReadBlockGen):
     '''Read block generator, asynchonous'''
-    REG_READ = '${read_dara} = ${name}'
-    BRAM_READ = '${read_data} = ${name}[${ram_addr}:2]'
+    REG_READ = '${read_data} = ${name};'
+    BRAM_READ = '${read_data} = ${name}[${ram_addr}];'
+
+class ReadBlockGenDataPhase(ReadBlockGen):
+    '''Read block generator of a pipelined bus, as AHB.
+    The BRAMs are read by BramPortGen by the address of the address phase,
+    and the read data is selected combinationally in the data phase. The
+    read-address of BramPortGen is the address of the address phase.'''
+    REG_READ = '${read_data} = ${name};'
+    BRAM_READ = '${read_data} = ${name}_rdata;'
+
+class BramPortGen(CodeBlockGenerator):
+    '''BRAM port generator of ReadBlockGenDataPhase and WriteBlockGen.
+    Each BRAM is read and written in its own clocked block without reset, so
+    it is inferred as a block RAM with byte write enables. The port reads
+    every cycle, so the output register is packed into the BRAM.'''
+    BLOCK_NAME = 'bram_port'
+    BLOCK_TEMPLATE = "always @(posedge ${clock}) begin\n${port_block}end\n"
+    WRITE_TEMPLATE = "if(${write_enable} && ${base}) begin\n${write_block}end\n"
+    BRAM_WRITE_STRB = "if(${write_strobe}[${n}])\n    ${name}[${addr}][${end_bit}:${start_bit}] <= ${write_data}[${end_bit}:${start_bit}];\n"
+    BRAM_WRITE = "${name}[${addr}] <= ${write_data}[${end_bit}:0];\n"
+    BRAM_READ = "${name}_rdata <= ${name}[${ram_addr}];\n"
+
+    def __init__(self, desc: list, signals: dict, bus_width: int = 4, bases: dict = None):
+        super().__init__(desc, signals, bus_width)
+        # Write select of the BRAMs by name, as of a minimal decoder. The
+        # comparison to the base address by default.
+        self.bases = bases or {}
+
+    def generate(self):
+        # Signal name
+        write_enable = self.signals['write-enable']
+        write_strobe = self.signals['write-strobe']
+        write_addr = self.signals['write-address']
+        write_data = self.signals['write-data']
+        read_addr = self.signals['read-address']
+
+        li = []
+        for v in self.reg_description:
+            if v['count'] == 0:
+                continue
+
+            d = {
+                'name': v['name'],
+                'write_data': write_data,
+                'write_strobe': write_strobe,
+                'addr': get_bram_addr(v['count'], write_addr, self.bus_width),
+                'ram_addr': get_bram_addr(v['count'], read_addr, self.bus_width)
+            }
+
+            block = ''
+            # Write port, unless read only
+            if v.get('access', 0) != 1:
+                if write_strobe == 'none':
+                    d['end_bit'] = 8 * v['width'] - 1
+                    write_block = Template(self.BRAM_WRITE).substitute(d)
+                else:
+                    # Byte lanes, the byte write enables of the BRAM
+                    write_block = ''
+                    for i in range(0, v['width']):
+                        d['n'] = i
+                        d['start_bit'] = i * 8
+                        d['end_bit'] = (i + 1) * 8 - 1
+                        write_block += Template(self.BRAM_WRITE_STRB).substitute(d)
+
+                block += Template(self.WRITE_TEMPLATE).substitute(
+                    write_enable = write_enable,
+                    base = self.bases.get(v['name']) or get_bram_base(v['count'], v['addr'], write_addr, self.bus_width),
+                    write_block = indent(write_block))
+
+            # Read port, unless write only
+            if v.get('access', 0) != 2:
+                block += Template(self.BRAM_READ).substitute(d)
+
+            li.append(Template(self.BLOCK_TEMPLATE).substitute(clock = self.signals['clock'], port_block = indent(block)))
+
+        return '\n'.join(li)
 
 class FieldDefineGen(CodeBlockGenerator):
     '''Field define generator'''
     BLOCK_NAME = 'reg_field_define'
-    BLOCK_TEMPLATE = "$wire [${width}-1:0] ${field};\n"
-
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
+    BLOCK_TEMPLATE = "wire [${end_bit}:0] ${field};\n"
 
     def generate(self):
         s = ''
@@ -225,10 +323,10 @@ class FieldDefineGen(CodeBlockGenerator):
                 bitRange = v['bit'].split(':')
 
                 d = {
-                    'width': int(bitRange[0]) - int(bitRange[1]),
+                    'end_bit': int(bitRange[0]) - int(bitRange[1]),
                     'field': v['name']
                 }
-                
+
                 s += Template(self.BLOCK_TEMPLATE).substitute(d)
 
         return s
@@ -238,9 +336,6 @@ class FieldAssignmentGen(CodeBlockGenerator):
     BLOCK_NAME = 'reg_field_assign'
     BLOCK_TEMPLATE = "assign ${field} = ${reg}[${bit_range}];\n"
 
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
-
     def generate(self):
         s = ''
         for w in self.reg_description:
@@ -261,14 +356,11 @@ class FieldUpdateGen(CodeBlockGenerator):
     BLOCK_NAME = 'reg_field_update'
     BLOCK_TEMPLATE = "${reg}[${bit_range}] <= ${field};\n"
 
-    def __init__(self, desc: dict, signals: dict):
-        super().__init__(desc, signals)
-
     def generate(self):
         s = ''
 
         for w in self.reg_description:
-            for v in w:
+            for v in w['fields']:
                 if v['type'] == 1:
                     d = {
                         'field': v['name'],
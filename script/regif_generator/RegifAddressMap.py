@@ -0,0 +1,177 @@
+'''
+    RegifAddressMap.py
+    Address map analysis of the register descriptions
+'''
+from dataclasses import dataclass
+
+# Registers per bank of the banked read decoder
+BANK_SIZE = 16
+# Width of the bus address
+ADDRESS_WIDTH = 32
+
+@dataclass
+class Region():
+    name: str
+    start: int          # Byte address
+    end: int            # Byte address after the last byte
+    value: int          # Word address, the bits out of the mask are zero
+    mask: int           # Word address bits that select the region
+
+def log2(n):
+    '''log2 of a power of 2, or None'''
+    if n <= 0 or n & (n - 1):
+        return None
+    return n.bit_length() - 1
+
+def bitSlices(bits):
+    '''Group bit positions into (msb, lsb) runs, MSB first'''
+    slices = []
+    for b in sorted(bits, reverse = True):
+        if slices and slices[-1][1] == b + 1:
+            slices[-1] = (slices[-1][0], b)
+        else:
+            slices.append((b, b))
+
+    return slices
+
+def project(value, bits):
+    '''Value of the bits, bits are MSB first'''
+    v = 0
+    for b in bits:
+        v = (v << 1) | ((value >> b) & 1)
+    return v
+
+class AddressMap():
+    '''Address regions of the registers of a description'''
+
+    def __init__(self, desc):
+        self.busWidth = desc['interface']['params']['width']
+        self.decode = desc['interface']['params'].get('decode', 'full')
+        self.wordBits = log2(self.busWidth)
+        if self.wordBits is None:
+            raise RuntimeError('Bus width %d is not a power of 2' % self.busWidth)
+
+        self.errors = []
+        self.regions = []
+
+        for reg in desc['registers']:
+            count = max(reg.get('count', 0), 1)
+            start = reg['addr']
+            end = start + count * self.busWidth
+
+            if start % self.busWidth:
+                self.errors.append('%s: address 0x%x is not aligned to the bus width %d' % (reg['name'], start, self.busWidth))
+
+            # A block RAM is decoded by the bits above its size
+            sizeBits = (count - 1).bit_length()
+            word = start >> self.wordBits
+            if word & ((1 << sizeBits) - 1):
+                self.errors.append('%s: block of %d words at 0x%x is not aligned to its size' % (reg['name'], count, start))
+
+            mask = ((1 << (ADDRESS_WIDTH - self.wordBits)) - 1) & ~((1 << sizeBits) - 1)
+            self.regions.append(Region(reg['name'], start, end, word & mask, mask))
+
+            if end > (1 << ADDRESS_WIDTH):
+                self.errors.append('%s: out of the %d-bit address space' % (reg['name'], ADDRESS_WIDTH))
+
+        self.errors.extend(self.overlaps())
+
+    def overlaps(self):
+        '''Overlapping regions, by a sweep over the regions sorted by address'''
+        errors = []
+        li = sorted(self.regions, key = lambda v: (v.start, v.end))
+
+        last = None
+        for v in li:
+            if last is not None and v.start < last.end:
+                errors.append('%s (0x%x-0x%x) overlaps %s (0x%x-0x%x)' % (v.name, v.start, v.end - 1, last.name, last.start, last.end - 1))
+            if last is None or v.end > last.end:
+                last = v
+
+        return errors
+
+    def check(self):
+        if self.errors:
+            raise RuntimeError('Invalid address map:\n    ' + '\n    '.join(self.errors))
+
+    def distinct(self, bits):
+        '''True if the regions are told apart by the word address bits'''
+        keys = set()
+        for v in self.regions:
+            # Don't care bits of a block RAM, all the combinations are taken
+            free = [b for b in bits if not (v.mask >> b) & 1]
+            base = project(v.value, bits)
+            for i in range(1 << len(free)):
+                k = base
+                for j, b in enumerate(free):
+                    if (i >> j) & 1:
+                        k |= 1 << (len(bits) - 1 - bits.index(b))
+                if k in keys:
+                    return False
+                keys.add(k)
+
+        return True
+
+    def decodeBits(self):
+        '''Minimal set of word address bits that select the regions, MSB first.
+
+        Bits are added greedily by the number of the classes they split the
+        regions into, then the bits not needed are removed.'''
+        if len(self.regions) <= 1:
+            return []
+
+        candidates = [b for b in range(ADDRESS_WIDTH - self.wordBits) if len(set([(v.value >> b) & 1 for v in self.regions])) > 1]
+
+        cols = {b: [(v.value >> b) & 1 for v in self.regions] for b in candidates}
+
+        # Without block RAMs, the regions are distinct if the bit columns are
+        full = (1 << (ADDRESS_WIDTH - self.wordBits)) - 1
+        if all([v.mask == full for v in self.regions]):
+            count = len(self.regions)
+            distinct = lambda bits: len(set(zip(*[cols[b] for b in bits]))) == count if bits else count <= 1
+        else:
+            distinct = self.distinct
+
+        bits = []
+        classes = [0] * len(self.regions)
+        while not distinct(sorted(bits, reverse = True)):
+            best = None
+            for b in candidates:
+                if b in bits:
+                    continue
+                n = len(set(zip(classes, cols[b])))
+                if best is None or n > best[0]:
+                    best = (n, b)
+
+            if best is None:
+                raise RuntimeError('Unable to decode the address map')
+
+            bits.append(best[1])
+            keys = {}
+            classes = [keys.setdefault(v, len(keys)) for v in zip(classes, cols[best[1]])]
+
+        for b in sorted(bits):
+            rest = sorted([v for v in bits if v != b], reverse = True)
+            if distinct(rest):
+                bits.remove(b)
+
+        return sorted(bits, reverse = True)
+
+    def report(self):
+        '''Text report of the address map'''
+        li = ['Address map, bus width %d bytes:' % self.busWidth]
+        for v in sorted(self.regions, key = lambda v: v.start):
+            li.append('    0x%08x-0x%08x %s' % (v.start, v.end - 1, v.name))
+
+        for v in self.errors:
+            li.append('ERROR: ' + v)
+
+        if not self.errors:
+            bits = [b + self.wordBits for b in self.decodeBits()]
+            li.append('Decode bits: %s' % (', '.join(['%d' % v for v in bits]) if bits else 'none'))
+            if self.decode == 'full':
+                li.append('Full decode, addresses out of the map read as zero.')
+            else:
+                li.append('Minimal decode, addresses out of the map alias to the registers.')
+
+        return '\n'.join(li)
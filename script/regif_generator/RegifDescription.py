@@ -0,0 +1,195 @@
+'''
+    RegifDescription.py
+    Register description loader and validator
+'''
+import os, json, hashlib
+import yaml
+
+# C accelerated safe loader if libyaml is available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Schema of the description file
+# Key: (type, default), keys without a default are required
+SCHEMA_DESCRIPTION = {
+    'module-name':      (str, None),
+    'module-desc':      (str, ''),
+    'module-files':     (list, []),
+}
+SCHEMA_SIGNALS = {
+    'write-address':    (str, None),
+    'write-strobe':     (str, None),
+    'write-data':       (str, None),
+    'read-address':     (str, None),
+    'read-function':    (str, None),
+}
+SCHEMA_PARAMS = {
+    'width':            (int, None),        # Bus width in bytes
+    'decode':           (str, 'full'),      # Address decode, see DECODE_TYPES
+}
+SCHEMA_REGISTER = {
+    'name':             (str, None),
+    'desc':             (str, ''),
+    'addr':             (int, None),
+    'width':            (int, None),        # Register width in bytes
+    'count':            (int, 0),           # Block RAM if not zero
+    'access':           (int, 0),           # 0 - RW, 1 - RO, 2 - WO
+    'whole-field':      (int, 0),           # The register is a single port
+    'fields':           (list, []),
+}
+SCHEMA_FIELD = {
+    'name':             (str, None),
+    'bit':              (str, None),        # 'msb:lsb'
+    'type':             (int, None),
+    'desc':             (str, ''),
+}
+
+# Field type: 0 - Update by register access only, 1 - Update with other signals,
+# 2 - Register access only, the register is output as a whole
+FIELD_TYPES = (0, 1, 2)
+ACCESS_TYPES = (0, 1, 2)
+# Address decode: full - all the address bits, addresses out of the map read as zero,
+# minimal - the bits that select the registers only, addresses out of the map alias
+DECODE_TYPES = ('minimal', 'full')
+
+# Cache folder of the normalized descriptions
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.desc_cache')
+
+class DescriptionError(ValueError):
+    '''Invalid register description, with the file and the key path'''
+    def __init__(self, fp, path, msg):
+        super().__init__('%s: %s: %s' % (fp, path, msg))
+
+def checkKeys(d, schema, fp, path):
+    '''Check the keys of a mapping and fill the defaults, returns a new dict'''
+    if not isinstance(d, dict):
+        raise DescriptionError(fp, path, 'Expect a mapping')
+
+    for k in d:
+        if not k in schema:
+            raise DescriptionError(fp, path, 'Unknown key %s' % k)
+
+    r = {}
+    for k, (t, default) in schema.items():
+        if not k in d or d[k] is None:
+            if default is None:
+                raise DescriptionError(fp, path, 'Missing key %s' % k)
+            r[k] = list(default) if isinstance(default, list) else default
+            continue
+
+        v = d[k]
+        # bool is a subclass of int, but is not a valid number here
+        if not isinstance(v, t) or (t is int and isinstance(v, bool)):
+            raise DescriptionError(fp, '%s.%s' % (path, k), 'Expect %s, got %s' % (t.__name__, repr(v)))
+        r[k] = v
+
+    return r
+
+def parseBitRange(s, fp, path):
+    '''(msb, lsb) of a bit range'''
+    try:
+        msb, lsb = [int(v) for v in s.split(':')]
+    except ValueError:
+        raise DescriptionError(fp, path, 'Invalid bit range %s, expect msb:lsb' % repr(s))
+
+    if msb < lsb or lsb < 0:
+        raise DescriptionError(fp, path, 'Invalid bit range %s' % s)
+
+    return msb, lsb
+
+def validate(desc, fp = '<desc>'):
+    '''Validate a description, returns the normalized description'''
+    desc = checkKeys(desc, {'description': (dict, None), 'interface': (dict, None), 'registers': (list, None)}, fp, '')
+    desc['description'] = checkKeys(desc['description'], SCHEMA_DESCRIPTION, fp, 'description')
+
+    interface = checkKeys(desc['interface'], {'signals': (dict, None), 'params': (dict, None)}, fp, 'interface')
+    interface['signals'] = checkKeys(interface['signals'], SCHEMA_SIGNALS, fp, 'interface.signals')
+    interface['params'] = checkKeys(interface['params'], SCHEMA_PARAMS, fp, 'interface.params')
+    desc['interface'] = interface
+
+    busWidth = interface['params']['width']
+    if busWidth <= 0:
+        raise DescriptionError(fp, 'interface.params.width', 'Bus width must be positive')
+    if not interface['params']['decode'] in DECODE_TYPES:
+        raise DescriptionError(fp, 'interface.params.decode', 'Expect one of %s' % ', '.join(DECODE_TYPES))
+
+    names = set()
+    registers = []
+    for i, reg in enumerate(desc['registers']):
+        path = 'registers[%d]' % i
+        reg = checkKeys(reg, SCHEMA_REGISTER, fp, path)
+        path = 'registers[%d](%s)' % (i, reg['name'])
+
+        if reg['name'] in names:
+            raise DescriptionError(fp, path, 'Register %s is defined more than once' % reg['name'])
+        names.add(reg['name'])
+
+        if reg['width'] <= 0 or reg['width'] > busWidth:
+            raise DescriptionError(fp, path, 'Register width %d out of the bus width %d' % (reg['width'], busWidth))
+        if reg['addr'] < 0 or reg['count'] < 0:
+            raise DescriptionError(fp, path, 'Negative address or count')
+        if not reg['access'] in ACCESS_TYPES:
+            raise DescriptionError(fp, path, 'Invalid access type %d' % reg['access'])
+        if not reg['whole-field'] in (0, 1):
+            raise DescriptionError(fp, path, 'whole-field must be 0 or 1')
+
+        fields = []
+        for j, field in enumerate(reg['fields']):
+            fieldPath = '%s.fields[%d]' % (path, j)
+            field = checkKeys(field, SCHEMA_FIELD, fp, fieldPath)
+
+            if not field['type'] in FIELD_TYPES:
+                raise DescriptionError(fp, fieldPath, 'Invalid field type %d' % field['type'])
+            if field['type'] == 2 and reg['whole-field'] == 0:
+                raise DescriptionError(fp, fieldPath, 'Field type 2 requires whole-field: 1')
+
+            msb, lsb = parseBitRange(field['bit'], fp, fieldPath)
+            if msb >= reg['width'] * 8:
+                raise DescriptionError(fp, fieldPath, 'Bit range %s out of the register width' % field['bit'])
+
+            fields.append(field)
+
+        reg['fields'] = fields
+        registers.append(reg)
+
+    desc['registers'] = registers
+
+    return desc
+
+def sourceHash():
+    '''Hash of this file, cached descriptions are invalid if the schema changed'''
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def loadDescription(fp, cacheDir = CACHE_DIR):
+    '''Load and validate a description file. The normalized description is
+    cached by the hash of the file, cacheDir = None disables the cache.'''
+    with open(fp, 'rb') as f:
+        raw = f.read()
+
+    if cacheDir is not None:
+        key = hashlib.sha256(raw + sourceHash().encode()).hexdigest()
+        cacheFile = os.path.join(cacheDir, key + '.json')
+
+        if os.path.isfile(cacheFile):
+            with open(cacheFile, 'r') as f:
+                return json.load(f)
+
+    try:
+        desc = yaml.load(raw, SafeLoader)
+    except yaml.YAMLError as e:
+        raise DescriptionError(fp, '', 'YAML error, %s' % e)
+
+    desc = validate(desc, fp)
+
+    if cacheDir is not None:
+        os.makedirs(cacheDir, exist_ok = True)
+        # Write then rename, parallel batch jobs may share the cache
+        tmp = '%s.%d' % (cacheFile, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(desc, f)
+        os.replace(tmp, cacheFile)
+
+    return desc
@@ -0,0 +1,227 @@
+'''
+    RegifHost.py
+    Host side register access of the generated Python drivers
+'''
+from collections import namedtuple
+
+# Field of a register, value = (word & mask) >> shift
+Field = namedtuple('Field', ['name', 'shift', 'mask'])
+# Register, addr is the byte address, count is the words of an array register
+Register = namedtuple('Register', ['name', 'addr', 'width', 'count', 'access', 'fields'])
+
+ACCESS_RW = 0
+ACCESS_RO = 1
+ACCESS_WO = 2
+
+class Transport():
+    '''Bus transport, addresses are byte addresses, data are bus words.
+    A transport implements burst read and write of consecutive words.'''
+    def read(self, addr, count = 1):
+        raise NotImplementedError
+
+    def write(self, addr, words):
+        raise NotImplementedError
+
+class MemoryTransport(Transport):
+    '''In-memory stand-in of a bus, counts the transactions'''
+    def __init__(self, busWidth = 4):
+        self.busWidth = busWidth
+        self.mem = {}
+        self.reads = 0
+        self.writes = 0
+        self.log = []
+
+    def read(self, addr, count = 1):
+        self.reads += 1
+        self.log.append(('R', addr, count))
+        return [self.mem.get(addr + i * self.busWidth, 0) for i in range(count)]
+
+    def write(self, addr, words):
+        self.writes += 1
+        self.log.append(('W', addr, len(words)))
+        for i, v in enumerate(words):
+            self.mem[addr + i * self.busWidth] = v
+
+def runs(items, step):
+    '''Split (addr, value) pairs sorted by address into runs of consecutive words'''
+    li = []
+    for addr, v in items:
+        if li and addr == li[-1][0] + len(li[-1][1]) * step:
+            li[-1][1].append(v)
+        else:
+            li.append((addr, [v]))
+    return li
+
+class RegisterView():
+    '''Field attributes of a register, dev.control.enable = 1'''
+    def __init__(self, block, reg):
+        object.__setattr__(self, '_block', block)
+        object.__setattr__(self, '_reg', reg)
+
+    def __getattr__(self, name):
+        return self._block.get(self._reg.name, name)
+
+    def __setattr__(self, name, value):
+        self._block.set(self._reg.name, **{name: value})
+
+    def read(self):
+        return self._block.read(self._reg.name)
+
+    def write(self, value):
+        self._block.write(self._reg.name, value)
+
+class RegisterBlock():
+    '''Register block of a description, REGISTERS is filled by the generated subclass.
+
+    Field updates in a batch() are merged per register and flushed with one
+    read and one write per register, consecutive registers in one burst.'''
+    BUS_WIDTH = 4
+    REGISTERS = {}
+
+    def __init__(self, transport, base = 0):
+        self.transport = transport
+        self.base = base
+
+        # Last written value of the write-only registers
+        self.shadow = {}
+        # Register: (value, mask of the bits set) of the running batch
+        self.__pending = None
+
+    def __getattr__(self, name):
+        regs = type(self).REGISTERS
+        if name in regs:
+            return RegisterView(self, regs[name])
+        raise AttributeError(name)
+
+    def __reg(self, name):
+        try:
+            return self.REGISTERS[name]
+        except KeyError:
+            raise KeyError('No register %s in %s' % (name, type(self).__name__))
+
+    def __field(self, reg, name):
+        try:
+            return reg.fields[name]
+        except KeyError:
+            raise KeyError('No field %s in register %s' % (name, reg.name))
+
+    def read(self, name):
+        reg = self.__reg(name)
+        if reg.access == ACCESS_WO:
+            return self.shadow.get(name, 0)
+        return self.transport.read(self.base + reg.addr)[0]
+
+    def write(self, name, value):
+        reg = self.__reg(name)
+        if reg.access == ACCESS_RO:
+            raise RuntimeError('Register %s is read only' % name)
+
+        value &= (1 << (reg.width * 8)) - 1
+        if self.__pending is not None:
+            self.__pending[name] = (value, (1 << (reg.width * 8)) - 1)
+            return
+
+        self.transport.write(self.base + reg.addr, [value])
+        self.shadow[name] = value
+
+    def get(self, name, field):
+        f = self.__field(self.__reg(name), field)
+        return (self.read(name) & f.mask) >> f.shift
+
+    def set(self, name, **fields):
+        '''Update fields of a register by one read-modify-write'''
+        reg = self.__reg(name)
+        if reg.access == ACCESS_RO:
+            raise RuntimeError('Register %s is read only' % name)
+
+        value, mask = 0, 0
+        for k, v in fields.items():
+            f = self.__field(reg, k)
+            value |= (v << f.shift) & f.mask
+            mask |= f.mask
+
+        if self.__pending is not None:
+            old, oldMask = self.__pending.get(name, (0, 0))
+            self.__pending[name] = ((old & ~mask) | value, oldMask | mask)
+            return
+
+        self.__flush({name: (value, mask)})
+
+    def batch(self):
+        '''Context of merged field updates, with dev.batch(): ...'''
+        return Batch(self)
+
+    def _begin(self):
+        if self.__pending is not None:
+            raise RuntimeError('Nested batch')
+        self.__pending = {}
+
+    def _end(self, commit = True):
+        pending, self.__pending = self.__pending, None
+        if commit:
+            self.__flush(pending)
+
+    def __flush(self, pending):
+        step = self.BUS_WIDTH
+        regs = sorted([self.__reg(v) for v in pending], key = lambda v: v.addr)
+
+        # Registers not written as a whole are read first, in bursts
+        current = {}
+        toRead = []
+        for reg in regs:
+            full = (1 << (reg.width * 8)) - 1
+            if pending[reg.name][1] == full:
+                continue
+            if reg.access == ACCESS_WO:
+                current[reg.name] = self.shadow.get(reg.name, 0)
+            else:
+                toRead.append((reg.addr, reg.name))
+
+        for addr, names in runs(toRead, step):
+            words = self.transport.read(self.base + addr, len(names))
+            current.update(zip(names, words))
+
+        # Merge and write, in bursts
+        toWrite = []
+        for reg in regs:
+            value, mask = pending[reg.name]
+            v = (current.get(reg.name, 0) & ~mask) | value
+            toWrite.append((reg.addr, v))
+            self.shadow[reg.name] = v
+
+        for addr, words in runs(toWrite, step):
+            self.transport.write(self.base + addr, words)
+
+    def read_array(self, name, start = 0, count = None):
+        '''Burst read of an array register'''
+        reg = self.__reg(name)
+        count = self.__range(reg, start, count)
+        return self.transport.read(self.base + reg.addr + start * self.BUS_WIDTH, count)
+
+    def write_array(self, name, words, start = 0):
+        '''Burst write of an array register'''
+        reg = self.__reg(name)
+        self.__range(reg, start, len(words))
+        mask = (1 << (reg.width * 8)) - 1
+        self.transport.write(self.base + reg.addr + start * self.BUS_WIDTH, [v & mask for v in words])
+
+    def __range(self, reg, start, count):
+        size = max(reg.count, 1)
+        if count is None:
+            count = size - start
+        if start < 0 or count < 0 or start + count > size:
+            raise IndexError('Words %d-%d out of register %s of %d words' % (start, start + count - 1, reg.name, size))
+        return count
+
+class Batch():
+    def __init__(self, block):
+        self.block = block
+
+    def __enter__(self):
+        self.block._begin()
+        return self.block
+
+    def __exit__(self, excType, exc, tb):
+        # Updates are dropped if the batch raised
+        self.block._end(excType is None)
+        return False
@@ -0,0 +1,105 @@
+'''
+    RegifTemplate.py
+    Precompiled templates of the register interface generators
+'''
+import re
+from functools import lru_cache
+
+# Placeholders of string.Template: $$, $name, ${name}
+PATTERN = re.compile(r'\$(?:(?P<escaped>\$)|(?P<named>[_a-zA-Z][_a-zA-Z0-9]*)|\{(?P<braced>[_a-zA-Z][_a-zA-Z0-9]*)\})')
+
+def dropLineEnd(s):
+    '''The text after the line ending at the start'''
+    if s.startswith('\r\n'):
+        return s[2:]
+    return s[1:]
+
+class CompiledTemplate():
+    '''string.Template compatible template, parsed once.
+
+    substitute() formats a one-line template by a prepared str.format string.
+    render() fills the blocks of a source template in one pass: the lines of
+    a block after the first are indented as the placeholder is, and the line
+    of an empty block alone on its line is dropped.'''
+
+    def __init__(self, template):
+        self.template = template
+
+        # Literals and (name, indent, alone) of the placeholders, alternately
+        self.chunks = []
+        fmt = []
+        literal = ''
+        pos = 0
+
+        for m in PATTERN.finditer(template):
+            literal += template[pos:m.start()]
+            pos = m.end()
+
+            if m.group('escaped') is not None:
+                literal += '$'
+                continue
+
+            name = m.group('named') or m.group('braced')
+
+            # Leading blanks of the line, if the placeholder is the first on the line
+            start = max(literal.rfind('\n'), literal.rfind('\r')) + 1
+            first = (start > 0 or len(self.chunks) == 0) and literal[start:].strip(' \t') == ''
+            indent = literal[start:] if first else ''
+
+            self.chunks.append(literal)
+            self.chunks.append((name, indent, first))
+            fmt.append(literal.replace('{', '{{').replace('}', '}}'))
+            fmt.append('{%s}' % name)
+            literal = ''
+
+        literal += template[pos:]
+        self.chunks.append(literal)
+
+        # The placeholder is alone if it is the first on the line and the line ends after it
+        for i in range(1, len(self.chunks), 2):
+            name, indent, first = self.chunks[i]
+            self.chunks[i] = (name, indent, first and self.chunks[i + 1].startswith(('\n', '\r')))
+        fmt.append(literal.replace('{', '{{').replace('}', '}}'))
+
+        self.format = ''.join(fmt)
+        self.names = set([v[0] for v in self.chunks[1::2]])
+
+    def substitute(self, mapping = None, **kwargs):
+        if mapping is not None:
+            kwargs = dict(mapping, **kwargs)
+        try:
+            return self.format.format_map(kwargs)
+        except KeyError as e:
+            raise KeyError('Missing placeholder %s in template' % e)
+
+    def render(self, blocks, ending = '\n'):
+        '''Fill the blocks, block lines are joined by the ending'''
+        out = []
+        chunks = self.chunks
+
+        drop = False
+
+        for i in range(0, len(chunks) - 1, 2):
+            literal = dropLineEnd(chunks[i]) if drop else chunks[i]
+            name, indent, alone = chunks[i + 1]
+            if not name in blocks:
+                raise KeyError('Missing block %s of template' % name)
+
+            text = (ending + indent).join(str(blocks[name]).splitlines())
+
+            # An empty block alone on its line leaves no blank line
+            drop = alone and text == ''
+            if drop:
+                literal = literal[:len(literal) - len(indent)]
+
+            out.append(literal)
+            out.append(text)
+
+        out.append(dropLineEnd(chunks[-1]) if drop else chunks[-1])
+
+        return ''.join(out)
+
+@lru_cache(maxsize = None)
+def compileTemplate(template):
+    '''Compiled template, cached by the template text'''
+    return CompiledTemplate(template)
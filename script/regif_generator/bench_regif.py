@@ -0,0 +1,88 @@
+'''
+    bench_regif.py
+    Benchmark of the register interface generation on synthetic register maps
+'''
+import sys, getopt, time
+from RegifDescription import validate
+from RegifAddressMap import AddressMap
+from rif_2_verilog import RegifSrcGenerator, GENERATOR_DIR
+
+HELP_MESSAGE = '''Benchmark of the register interface generation.
+Usage: python bench_regif.py [-n <registers>[,<registers>...]] [-r <repeats>] [-t <template>] [-h]
+    The time of each stage is the best of the repeats. The time per register
+    should stay flat as the maps grow.'''
+
+def syntheticDescription(n, busWidth = 4):
+    '''Description of n registers with two fields each'''
+    registers = []
+    for i in range(n):
+        registers.append({
+            'name': 'reg_%d' % i,
+            'addr': i * busWidth,
+            'width': busWidth,
+            'fields': [
+                {'name': 'reg_%d_ctrl' % i, 'bit': '7:0', 'type': 0},
+                {'name': 'reg_%d_stat' % i, 'bit': '15:8', 'type': 1},
+            ],
+        })
+
+    return {
+        'description': {'module-name': 'bench'},
+        'interface': {
+            'signals': {'write-address': 'waddr_s', 'write-strobe': 'wstrb_s', 'write-data': 'wdata_s',
+                        'read-address': 'raddr_s', 'read-function': 'read_reg'},
+            'params': {'width': busWidth},
+        },
+        'registers': registers,
+    }
+
+def best(f, repeats):
+    '''Best time of the repeats, and the last result'''
+    t = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        r = f()
+        dt = time.perf_counter() - start
+        t = dt if t is None else min(t, dt)
+
+    return t, r
+
+def bench(sizes, repeats = 3, templateFile = GENERATOR_DIR + '/src_tmpl/template_axi.v'):
+    with open(templateFile, 'r') as f:
+        template = f.read()
+
+    print('%10s %10s %10s %10s %10s %12s %10s' % ('registers', 'validate', 'decode', 'generate', 'total', 'us/register', 'MB'))
+    results = []
+
+    for n in sizes:
+        raw = syntheticDescription(n)
+
+        tValidate, desc = best(lambda: validate(raw), repeats)
+        tDecode, bits = best(lambda: AddressMap(desc).decodeBits(), repeats)
+        tGenerate, src = best(lambda: RegifSrcGenerator(template, desc, 'bench.yml', 'bench.v').generateSource(), repeats)
+
+        total = tValidate + tGenerate
+        print('%10d %10.3f %10.3f %10.3f %10.3f %12.1f %10.2f' % (n, tValidate, tDecode, tGenerate, total, total / n * 1e6, len(src) / 1e6))
+        results.append({'registers': n, 'validate': tValidate, 'decode': tDecode, 'generate': tGenerate})
+
+    return results
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hn:r:t:")
+
+    sizes = [100, 1000, 10000]
+    repeats = 3
+    kwargs = {}
+
+    for opt,val in opts:
+        if opt == '-n':
+            sizes = [int(v) for v in val.split(',')]
+        elif opt == '-r':
+            repeats = int(val)
+        elif opt == '-t':
+            kwargs['templateFile'] = val
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    bench(sizes, repeats, **kwargs)
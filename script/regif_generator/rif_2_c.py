@@ -0,0 +1,207 @@
+'''
+    rif_2_c.py
+    Register interface description file to C header converter
+'''
+from string import Template
+import sys, getopt, time
+from RegifDescription import loadDescription, DescriptionError
+from RegifAddressMap import AddressMap
+
+# Help message
+HELP_MESSAGE = '''Convert register description file to a C header.
+Usages:rif_2_c.py -i <input_file> -o <output_file>
+    -i <input_file>
+        Specify the register description file.
+    -o <output_file>
+        Specify the output file.
+    -h
+        Display this help message.
+
+Example:
+    #include "dem_a_regif.h"
+    volatile dem_a_regs_t *dem = DEM_A_REGS(0x40001000);
+    dem->control = DEM_A_CONTROL_MODE_SET(dem->control, 2);
+    dem_a_control_t c = {.word = dem->control};
+    c.bits.enable = 1;
+    dem->control = c.word;
+'''
+
+HEADER_TEMPLATE = '''/*
+    Filename:${outputfile}
+    Source:${sourcefile}
+    Time:${datetime}
+
+    Generated by register interface generator
+    ${module_desc}
+
+    Bit-fields are laid out LSB first, as GCC does for little-endian targets
+    (RISC-V, ARM). The _SET/_GET macros do not depend on the layout.
+*/
+#ifndef ${guard}
+#define ${guard}
+
+#include <stdint.h>
+#include <stddef.h>
+
+/* Register offsets */
+${offsets}
+/* Field masks, shifts and accessors */
+${fields}
+/* Register layouts */
+${unions}
+/* Register map */
+typedef struct {
+${members}} ${prefix}_regs_t;
+
+${asserts}
+#define ${upper}_REGS(base) ((volatile ${prefix}_regs_t *)(base))
+
+#ifndef REGIF_COPY_WORDS
+#define REGIF_COPY_WORDS
+/* Copy words to or from a register array, unrolled for back-to-back bus writes */
+static inline void regif_copy_words(volatile uint${bus_bits}_t *dst, const volatile uint${bus_bits}_t *src, size_t n)
+{
+    while(n >= 4) {
+        uint${bus_bits}_t a = src[0], b = src[1], c = src[2], d = src[3];
+        dst[0] = a; dst[1] = b; dst[2] = c; dst[3] = d;
+        dst += 4; src += 4; n -= 4;
+    }
+    while(n--)
+        *dst++ = *src++;
+}
+#endif
+${copy_helpers}
+#endif
+'''
+
+FIELD_DEFINES = '''#define ${name}_SHIFT ${shift}
+#define ${name}_MASK 0x${mask}u
+#define ${name}_GET(reg) (((reg) & ${name}_MASK) >> ${name}_SHIFT)
+#define ${name}_SET(reg, v) (((reg) & ~${name}_MASK) | (((uint${bus_bits}_t)(v) << ${name}_SHIFT) & ${name}_MASK))
+'''
+UNION_TEMPLATE = '''typedef union {
+    uint${bus_bits}_t word;
+    struct {
+${bits}    } bits;
+} ${prefix}_${name}_t;
+'''
+COPY_WRITE = '''static inline void ${prefix}_${name}_write(volatile ${prefix}_regs_t *regs, const uint${bus_bits}_t *src, size_t start, size_t n)
+{
+    regif_copy_words(&regs->${name}[start], src, n);
+}
+'''
+COPY_READ = '''static inline void ${prefix}_${name}_read(volatile ${prefix}_regs_t *regs, uint${bus_bits}_t *dst, size_t start, size_t n)
+{
+    regif_copy_words(dst, &regs->${name}[start], n);
+}
+'''
+
+def bitFields(reg, busBits):
+    '''Bit-field members of a register, the gaps are unnamed members'''
+    li = []
+    for f in reg['fields']:
+        msb, lsb = [int(v) for v in f['bit'].split(':')]
+        li.append((lsb, msb, f['name']))
+    li.sort()
+
+    s = ''
+    pos = 0
+    for lsb, msb, name in li:
+        if lsb > pos:
+            s += '        uint%d_t : %d;\n' % (busBits, lsb - pos)
+        s += '        uint%d_t %s : %d;\n' % (busBits, name, msb - lsb + 1)
+        pos = msb + 1
+    if pos < busBits:
+        s += '        uint%d_t : %d;\n' % (busBits, busBits - pos)
+
+    return s
+
+def generateHeader(desc, srcFileName, outputFileName):
+    '''C header source of a description'''
+    addressMap = AddressMap(desc)
+    addressMap.check()
+
+    prefix = desc['description']['module-name'].replace('-', '_').lower()
+    upper = prefix.upper()
+    busWidth = desc['interface']['params']['width']
+    busBits = busWidth * 8
+    if not busBits in (8, 16, 32, 64):
+        raise RuntimeError('Bus width %d has no C integer type' % busWidth)
+
+    offsets = ''
+    fields = ''
+    unions = ''
+    members = ''
+    asserts = ''
+    helpers = ''
+
+    pos = 0
+    reserved = 0
+    for reg in sorted(desc['registers'], key = lambda v: v['addr']):
+        name = reg['name']
+        regUpper = '%s_%s' % (upper, name.upper())
+        count = reg['count']
+
+        offsets += '#define %s_OFFSET 0x%xu\n' % (regUpper, reg['addr'])
+        if count:
+            offsets += '#define %s_COUNT %du\n' % (regUpper, count)
+
+        for f in reg['fields']:
+            msb, lsb = [int(v) for v in f['bit'].split(':')]
+            mask = ((1 << (msb - lsb + 1)) - 1) << lsb
+            fields += Template(FIELD_DEFINES).substitute(name = '%s_%s' % (regUpper, f['name'].upper()), shift = lsb,
+                                                         mask = '%x' % mask, bus_bits = busBits)
+
+        if reg['fields']:
+            unions += Template(UNION_TEMPLATE).substitute(bus_bits = busBits, bits = bitFields(reg, busBits), prefix = prefix, name = name)
+
+        # Gap to the register
+        if reg['addr'] > pos:
+            members += '    uint%d_t _reserved%d[%d];\n' % (busBits, reserved, (reg['addr'] - pos) // busWidth)
+            reserved += 1
+
+        access = ['', 'const ', ''][reg['access']]
+        if count:
+            members += '    %svolatile uint%d_t %s[%d];\n' % (access, busBits, name, count)
+            d = dict(name = name, prefix = prefix, bus_bits = busBits)
+            helpers += '\n/* %s, %d words */\n' % (name, count)
+            if reg['access'] != 1:
+                helpers += Template(COPY_WRITE).substitute(d)
+            if reg['access'] != 2:
+                helpers += Template(COPY_READ).substitute(d)
+        else:
+            members += '    %svolatile uint%d_t %s;\n' % (access, busBits, name)
+
+        asserts += '_Static_assert(offsetof(%s_regs_t, %s) == %s_OFFSET, "%s offset");\n' % (prefix, name, regUpper, name)
+        pos = reg['addr'] + max(count, 1) * busWidth
+
+    return Template(HEADER_TEMPLATE).substitute(
+        outputfile = outputFileName, sourcefile = srcFileName, datetime = time.asctime(time.localtime()),
+        module_desc = desc['description']['module-desc'], guard = '%s_REGIF_H' % upper,
+        offsets = offsets, fields = fields, unions = unions, members = members, asserts = asserts,
+        prefix = prefix, upper = upper, bus_bits = busBits, copy_helpers = helpers)
+
+def generateFile(inputFile, outputFile):
+    source = generateHeader(loadDescription(inputFile), inputFile, outputFile)
+
+    with open(outputFile, 'w') as f:
+        f.write(source)
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hi:o:")
+
+    for opt,val in opts:
+        if opt == '-i':
+            inputFile = val
+        elif opt == '-o':
+            outputFile = val
+        else:
+            print(HELP_MESSAGE)
+            exit()
+
+    try:
+        generateFile(inputFile, outputFile)
+    except (DescriptionError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
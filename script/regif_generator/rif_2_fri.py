@@ -0,0 +1,374 @@
+'''
+    rif_2_fri.py
+    Register interface description file to AHB FRBM stimulus converter
+'''
+from string import Template
+import sys, getopt, os, time
+from RegifDescription import loadDescription, DescriptionError
+from RegifAddressMap import AddressMap
+
+# Help message
+HELP_MESSAGE = '''Generate AHB FRBM stimulus of a register interface.
+Usages:rif_2_fri.py -i <input_file> -o <output_file> [-a <base_address>] [-r <report_file>]
+       rif_2_fri.py -d <desc_dir> -O <output_dir> [-a <base_address>]
+    -i <input_file>
+        Specify the register description file.
+    -o <output_file>
+        Specify the output .fri file.
+    -a <base_address>
+        Base address of the register interface on the bus, 0 by default.
+    -r <report_file>
+        Write the coverage report to the file, otherwise it is printed.
+    -d <desc_dir>
+        Generate every description file in the folder.
+    -O <output_dir>
+        Output folder of -d. Outputs are named <description>_regif.fri and
+        <description>_regif_coverage.txt.
+    -h
+        Display this help message.
+
+The stimulus checks:
+    Reset values, all registers read 0 out of the input fields.
+    Walking ones and zeros through the output fields of RW registers.
+    Byte and halfword writes on every byte lane of RW registers.
+    Array registers written and read back by INCR bursts.
+Compile the output with fm2conv.pl -busWidth 32, as the tb makefiles do.
+'''
+
+FILE_HEADER = ''';
+; ${outputfile}
+; AHB FRBM source file for register interface testing
+;
+; Source: ${sourcefile}
+; Time: ${datetime}
+; Generated by register interface generator
+;
+'''
+
+# AHB bursts do not cross a 1KB boundary
+BURST_BOUNDARY = 1024
+# Transfer sizes of FRBM by bytes
+SIZES = {1: 'byte', 2: 'half', 4: 'word'}
+
+def fieldRange(field):
+    '''(msb, lsb) of a field'''
+    msb, lsb = [int(v) for v in field['bit'].split(':')]
+    return msb, lsb
+
+def fieldMask(field):
+    msb, lsb = fieldRange(field)
+    return ((1 << (msb - lsb + 1)) - 1) << lsb
+
+def pattern(addr):
+    '''Data of an array word, different on every address and byte'''
+    return (addr * 0x9e3779b1 + 0x5a5a5a5a) & 0xffffffff
+
+class Coverage():
+    '''Bits and byte lanes exercised by a stimulus.
+
+    A bit is covered when it is written 0 and 1 and both are checked by a
+    read. A byte lane is covered when it is written by a byte transfer.'''
+
+    def __init__(self, desc):
+        self.registers = desc['registers']
+        self.busWidth = desc['interface']['params']['width']
+
+        # By register name
+        self.set = {}           # Bits written 1
+        self.clear = {}         # Bits written 0
+        self.checked1 = {}      # Bits read back 1
+        self.checked0 = {}      # Bits read back 0
+        self.lanes = {}         # Byte lanes written alone
+        self.words = {}         # Array words written and read
+
+        for v in self.registers:
+            for d in (self.set, self.clear, self.checked1, self.checked0):
+                d[v['name']] = 0
+            self.lanes[v['name']] = set()
+            self.words[v['name']] = [set(), set()]
+
+    def write(self, reg, value, strobe):
+        '''A write of the byte lanes of strobe'''
+        mask = 0
+        for i in range(self.busWidth):
+            if strobe & (1 << i):
+                mask |= 0xff << (i * 8)
+
+        name = reg['name']
+        self.set[name] |= value & mask
+        self.clear[name] |= ~value & mask
+
+        if strobe and strobe & (strobe - 1) == 0:
+            self.lanes[name].add(strobe.bit_length() - 1)
+
+    def read(self, reg, value, mask):
+        name = reg['name']
+        self.checked1[name] |= value & mask
+        self.checked0[name] |= ~value & mask
+
+    def arrayWrite(self, reg, index):
+        self.words[reg['name']][0].add(index)
+
+    def arrayRead(self, reg, index):
+        self.words[reg['name']][1].add(index)
+
+    def fieldCovered(self, reg, field):
+        '''Covered bits and bits of a field'''
+        msb, lsb = fieldRange(field)
+        name = reg['name']
+        bits = self.set[name] & self.clear[name] & self.checked1[name] & self.checked0[name]
+
+        return bin((bits & fieldMask(field)) >> lsb).count('1'), msb - lsb + 1
+
+    def report(self):
+        lines = []
+        total = [0, 0]
+
+        for reg in self.registers:
+            name = reg['name']
+
+            if reg['count']:
+                written, read = self.words[name]
+                lines.append('%-24s array, %d/%d words written, %d/%d words read'
+                             % (name, len(written), reg['count'], len(read), reg['count']))
+                total[0] += (len(written) + len(read)) / 2
+                total[1] += reg['count']
+                continue
+
+            lanes = self.lanes[name]
+            lines.append('%-24s byte lanes %s' % (name, ''.join(['x' if i in lanes else '-' for i in range(reg['width'])])))
+
+            for field in reg['fields']:
+                covered, bits = self.fieldCovered(reg, field)
+                if field['type'] == 1:
+                    note = 'input, not covered'
+                else:
+                    note = '%d/%d bits' % (covered, bits)
+                    total[0] += covered
+                    total[1] += bits
+
+                lines.append('    %-20s %-8s %s' % (field['name'], field['bit'], note))
+
+        if total[1]:
+            lines.append('Coverage: %.1f%% of the output field bits and array words' % (100 * total[0] / total[1]))
+
+        return '\n'.join(lines)
+
+class StimulusGenerator():
+    '''FRBM stimulus of the registers of a description'''
+
+    def __init__(self, desc, base = 0):
+        self.desc = desc
+        self.base = base
+        self.busWidth = desc['interface']['params']['width']
+        if self.busWidth != 4:
+            raise RuntimeError('FRBM stimulus needs a 32-bit bus, the bus width is %d' % self.busWidth)
+
+        AddressMap(desc).check()
+
+        self.coverage = Coverage(desc)
+        self.lines = []
+
+    def comment(self, s):
+        self.lines.append('C "%s"' % s)
+
+    def write(self, reg, offset, value, size = 4):
+        '''Write of size bytes at the byte offset of a register, value is the bus word'''
+        addr = reg['addr'] + offset
+        strobe = ((1 << size) - 1) << (offset % self.busWidth)
+
+        self.lines.append('W 0x%08x 0x%08x %s sing P0000 nolock okay' % (self.base + addr, value, SIZES[size]))
+        self.coverage.write(reg, value, strobe)
+
+    def read(self, reg, value, mask):
+        '''Word read of a register, the bits out of the mask are not checked'''
+        value &= mask
+        if mask == 0xffffffff:
+            self.lines.append('R 0x%08x 0x%08x word sing P0000 nolock okay' % (self.base + reg['addr'], value))
+        else:
+            self.lines.append('R 0x%08x 0x%08x 0x%08x word sing P0000 nolock okay' % (self.base + reg['addr'], value, mask))
+        self.coverage.read(reg, value, mask)
+
+    def burst(self, command, reg, start, values):
+        '''INCR bursts of an array from the word start, split at the 1KB boundaries'''
+        addr = reg['addr'] + start * self.busWidth
+
+        i = 0
+        while i < len(values):
+            beats = min(len(values) - i, (BURST_BOUNDARY - (self.base + addr) % BURST_BOUNDARY) // self.busWidth)
+
+            self.lines.append('%s 0x%08x 0x%08x word incr P0000 nolock okay' % (command, self.base + addr, values[i]))
+            for v in values[i + 1:i + beats]:
+                self.lines.append('S 0x%08x' % v)
+
+            for j in range(beats):
+                if command == 'W':
+                    self.coverage.arrayWrite(reg, start + i + j)
+                else:
+                    self.coverage.arrayRead(reg, start + i + j)
+
+            i += beats
+            addr += beats * self.busWidth
+
+    def registerMask(self, reg):
+        '''Bits of a register that read back as written'''
+        if reg['whole-field'] == 1:
+            return (1 << (reg['width'] * 8)) - 1
+
+        mask = 0
+        for v in reg['fields']:
+            if v['type'] != 1:
+                mask |= fieldMask(v)
+        return mask
+
+    def resetMask(self, reg):
+        '''Bits of a register out of the input fields'''
+        mask = (1 << (reg['width'] * 8)) - 1
+        for v in reg['fields']:
+            if v['type'] == 1:
+                mask &= ~fieldMask(v)
+        return mask
+
+    def outputFields(self, reg):
+        '''Fields written by the bus'''
+        if reg['whole-field'] == 1 and not reg['fields']:
+            return [{'name': reg['name'], 'bit': '%d:0' % (reg['width'] * 8 - 1), 'type': 2}]
+        return [v for v in reg['fields'] if v['type'] != 1]
+
+    def generateReset(self):
+        self.comment('Reading reset values')
+        for reg in self.desc['registers']:
+            if reg['count'] == 0 and reg['access'] != 2:
+                self.read(reg, 0, self.resetMask(reg))
+
+    def generateWalking(self):
+        for reg in self.desc['registers']:
+            if reg['count'] or reg['access'] == 1:
+                continue
+
+            mask = self.registerMask(reg)
+            check = reg['access'] == 0 and mask != 0
+
+            for field in self.outputFields(reg):
+                msb, lsb = fieldRange(field)
+                fieldBits = fieldMask(field)
+
+                self.comment('Walking ones and zeros, %s.%s' % (reg['name'], field['name']))
+                for bit in range(lsb, msb + 1):
+                    for value in (1 << bit, fieldBits & ~(1 << bit)):
+                        self.write(reg, 0, value)
+                        if check:
+                            self.read(reg, value, mask)
+
+            # Leave the register as reset
+            self.write(reg, 0, 0)
+
+    def generateByteLanes(self):
+        for reg in self.desc['registers']:
+            if reg['count'] or reg['access'] == 1:
+                continue
+
+            mask = self.registerMask(reg)
+            check = reg['access'] == 0 and mask != 0
+            self.comment('Byte strobes, %s' % reg['name'])
+
+            for size in (1, 2):
+                for offset in range(0, reg['width'] - size + 1, size):
+                    # Lanes of the transfer set, the others keep 0
+                    value = ((1 << (size * 8)) - 1) << (offset * 8)
+                    self.write(reg, offset, value, size)
+                    if check:
+                        self.read(reg, value, mask)
+                    self.write(reg, 0, 0)
+
+    def generateArrays(self):
+        for reg in self.desc['registers']:
+            if reg['count'] == 0:
+                continue
+
+            mask = (1 << (reg['width'] * 8)) - 1
+            values = [pattern(reg['addr'] + i * self.busWidth) & mask for i in range(reg['count'])]
+
+            if reg['access'] != 1:
+                self.comment('Burst write, %s, %d words' % (reg['name'], reg['count']))
+                self.burst('W', reg, 0, values)
+            if reg['access'] == 0:
+                self.comment('Burst read, %s, %d words' % (reg['name'], reg['count']))
+                self.burst('R', reg, 0, values)
+
+    def generate(self):
+        self.lines = []
+        self.generateReset()
+        self.generateWalking()
+        self.generateByteLanes()
+        self.generateArrays()
+        self.comment('Done.')
+        self.lines.append('Q')
+
+        return '\n'.join(self.lines) + '\n'
+
+def generateFile(inputFile, outputFile, base = 0):
+    '''Generate a stimulus file, returns the coverage report'''
+    gen = StimulusGenerator(loadDescription(inputFile), base)
+    stimulus = gen.generate()
+
+    header = Template(FILE_HEADER).substitute(outputfile = os.path.basename(outputFile), sourcefile = inputFile,
+                                              datetime = time.asctime(time.localtime()))
+
+    with open(outputFile, 'w') as f:
+        f.write(header + '\n' + stimulus)
+
+    return gen.coverage.report()
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hi:o:a:r:d:O:")
+
+    base = 0
+    reportFile = None
+    descDir = None
+
+    for opt,val in opts:
+        if opt == '-i':
+            inputFile = val
+        elif opt == '-o':
+            outputFile = val
+        elif opt == '-a':
+            base = int(val, 0)
+        elif opt == '-r':
+            reportFile = val
+        elif opt == '-d':
+            descDir = val
+        elif opt == '-O':
+            outputDir = val
+        else:
+            print(HELP_MESSAGE)
+            exit()
+
+    if descDir is None:
+        jobs = [(inputFile, outputFile, reportFile)]
+    else:
+        os.makedirs(outputDir, exist_ok = True)
+        jobs = []
+        for v in sorted(os.listdir(descDir)):
+            if v.endswith(('.yml', '.yaml')):
+                stem = os.path.join(outputDir, os.path.splitext(v)[0] + '_regif')
+                jobs.append((os.path.join(descDir, v), stem + '.fri', stem + '_coverage.txt'))
+
+    failed = False
+    for inputFile, outputFile, reportFile in jobs:
+        try:
+            report = generateFile(inputFile, outputFile, base)
+        except (DescriptionError, RuntimeError) as e:
+            print(e)
+            failed = True
+            continue
+
+        if reportFile is None:
+            print(report)
+        else:
+            with open(reportFile, 'w') as f:
+                f.write(report + '\n')
+            print('Generated: %s' % outputFile)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,116 @@
+'''
+    rif_2_python.py
+    Register interface description file to Python driver converter
+'''
+from string import Template
+import sys, getopt, time
+from RegifDescription import loadDescription, DescriptionError
+from RegifAddressMap import AddressMap
+
+# Help message
+HELP_MESSAGE = '''Convert register description file to a Python driver.
+Usages:rif_2_python.py -i <input_file> -o <output_file>
+    -i <input_file>
+        Specify the register description file.
+    -o <output_file>
+        Specify the output file.
+    -h
+        Display this help message.
+
+The driver needs RegifHost.py in the module path. Example:
+    from RegifHost import MemoryTransport
+    from dem_a_regif import DemA
+    dev = DemA(MemoryTransport())
+    dev.control.enable = 1
+    with dev.batch():
+        dev.set('control', mode = 1, unbias = 1)
+        dev.data_bias.write(100)
+'''
+
+DRIVER_TEMPLATE = """'''
+    Filename:${outputfile}
+    Source:${sourcefile}
+    Time:${datetime}
+
+    Generated by register interface generator
+'''
+from RegifHost import RegisterBlock, Register, Field
+
+# Register addresses
+${addr_constants}
+# Field masks and shifts
+${field_constants}
+class ${class_name}(RegisterBlock):
+    '''${module_desc}'''
+    BUS_WIDTH = ${bus_width}
+    REGISTERS = {
+${registers}    }
+"""
+REG_ENTRY = "        '${name}': Register('${name}', 0x${addr}, ${width}, ${count}, ${access}, {\n${fields}        }),\n"
+FIELD_ENTRY = "            '${name}': Field('${name}', ${shift}, 0x${mask}),\n"
+
+def className(moduleName):
+    return ''.join([v[:1].upper() + v[1:] for v in moduleName.replace('-', '_').split('_')])
+
+def fieldMask(field):
+    '''(shift, mask) of a field'''
+    msb, lsb = [int(v) for v in field['bit'].split(':')]
+    return lsb, ((1 << (msb - lsb + 1)) - 1) << lsb
+
+def generatePython(desc, srcFileName, outputFileName):
+    '''Python driver source of a description'''
+    AddressMap(desc).check()
+
+    addrConstants = ''
+    fieldConstants = ''
+    registers = ''
+
+    for reg in desc['registers']:
+        upper = reg['name'].upper()
+        addrConstants += '%s = 0x%x\n' % (upper, reg['addr'])
+
+        fields = ''
+        fieldList = reg['fields']
+        # A whole-field register is a field of its own
+        if reg['whole-field'] == 1 and len(fieldList) == 0:
+            fieldList = [{'name': reg['name'], 'bit': '%d:0' % (reg['width'] * 8 - 1)}]
+
+        for f in fieldList:
+            shift, mask = fieldMask(f)
+            fields += Template(FIELD_ENTRY).substitute(name = f['name'], shift = shift, mask = '%x' % mask)
+            fieldConstants += '%s_%s_SHIFT = %d\n%s_%s_MASK = 0x%x\n' % (upper, f['name'].upper(), shift, upper, f['name'].upper(), mask)
+
+        registers += Template(REG_ENTRY).substitute(name = reg['name'], addr = '%x' % reg['addr'], width = reg['width'],
+                                                    count = reg['count'], access = reg['access'], fields = fields)
+
+    return Template(DRIVER_TEMPLATE).substitute(
+        outputfile = outputFileName, sourcefile = srcFileName, datetime = time.asctime(time.localtime()),
+        addr_constants = addrConstants, field_constants = fieldConstants,
+        class_name = className(desc['description']['module-name']),
+        module_desc = desc['description']['module-desc'].replace("'''", '"""'),
+        bus_width = desc['interface']['params']['width'], registers = registers)
+
+def generateFile(inputFile, outputFile):
+    source = generatePython(loadDescription(inputFile), inputFile, outputFile)
+
+    with open(outputFile, 'w') as f:
+        f.write(source)
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hi:o:")
+
+    for opt,val in opts:
+        if opt == '-i':
+            inputFile = val
+        elif opt == '-o':
+            outputFile = val
+        else:
+            print(HELP_MESSAGE)
+            exit()
+
+    try:
+        generateFile(inputFile, outputFile)
+    except (DescriptionError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
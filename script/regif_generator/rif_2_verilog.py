@@ -4,59 +4,99 @@
 '''
 
 from datetime import datetime
-import yaml
-from string import Template
-import sys, getopt, os, time
+import sys, getopt, os, re, time, json, hashlib
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from RegifDescription import loadDescription, DescriptionError
+from RegifAddressMap import AddressMap, BANK_SIZE, bitSlices, project
+from RegifTemplate import compileTemplate
+import CodeblockGenerators as cbg
+try:
+    import Instrumentation
+    from Instrumentation import stage
+except ImportError:
+    Instrumentation = None
+    from contextlib import nullcontext as stage
+    if os.environ.get('INSTRUMENT'):
+        print('INSTRUMENT is set, but Instrumentation is not on the module path. Add the script folder to PYTHONPATH.', file = sys.stderr)
 
 # Constants
 # Help message
 HELP_MESSAGE = '''Convert register description file to verilog source.
 Usages:rif_2_verilog.py -t <template_file> -i <input_file> -o <output_file>
+       rif_2_verilog.py -b -t <template_file>[,<template_file>...] -O <output_dir> [-d <desc_dir>] [-j <jobs>] [-f]
     -t <template_name>
-        Specify the template file.
+        Specify the template file. Several templates are separated by commas in the batch mode.
     -T
         List the verilog templates in the ./src_tmpl folder.
     -i <input_file>
         Specify the register description file.
     -o <output_file>
         Specify the output file.
+    -m
+        Print the address map analysis of the input file.
+    -b
+        Batch mode. Generate every description file in the description folder
+        with every template. Outputs are named <description>_regif_<template>.v,
+        where <template> is the template name without the template_ prefix.
+    -d <desc_dir>
+        Description folder of the batch mode, ./reg_desc by default.
+    -O <output_dir>
+        Output folder of the batch mode.
+    -j <jobs>
+        Number of parallel jobs in the batch mode, count of CPUs by default.
+    -f
+        Regenerate all outputs in the batch mode. Otherwise an output is
+        skipped if its description, template and generator are unchanged.
     -h
         Display this help message.
 '''
 # File header comment
-COMMENT_HEADER = '''    Filename:${outputfile}
+COMMENT_HEADER = compileTemplate('''    Filename:${outputfile}
     Source:${sourcefile}
     Time:${datetime}
 
-    Generated by register interface generator'''
+    Generated by register interface generator''')
 
 # Register define
-REG_DEFINE = "reg [${width}:0] ${name};\n"
+REG_DEFINE = compileTemplate("reg [${width}:0] ${name};\n")
 # Register read
-REG_READ = "'h${addr}:${read_function} = ${name};\n"
-REG_READ_FILL = "${addr}:${read_function} = { {(${padding_bits}){1'b0}}, ${name}}\n"
+REG_READ = compileTemplate("'h${addr}:${read_function} = ${data};\n")
+REG_READ_FULL = compileTemplate("case(${address}[${msb}:${lsb}])\n${items}default:${read_function} = ${width}'h0;\nendcase\n")
+REG_READ_ONEHOT = compileTemplate("${read_function} = ${terms};\n")
+REG_READ_TERM = compileTemplate("({${width}{${select}}} & ${data})")
+REG_READ_BANK = compileTemplate("case(${select})\n${items}default:${read_function} = ${width}'h0;\nendcase\n")
+REG_READ_BANK_ITEM = compileTemplate("${value}:${read_function} = ${terms};\n")
+REG_READ_FILL = compileTemplate("{ {${padding_bits}{1'b0}}, ${name}}")
+REG_READ_CASEX = compileTemplate("${read_function} = ${width}'h0;\ncasex(${address}[${msb}:${lsb}])\n${items}endcase\n")
 # Register reset
-REG_RESET = "${name} <= ${width}'h0;\n"
+REG_RESET = compileTemplate("${name} <= ${width}'h0;\n")
 # Register write
-REG_WRITE = "'h${addr}:begin\n${write_block}end\n"
-REG_WRITE_STRB = "if(${write_strobe}[${n}])\n\t${name} <= wdata_s[${end_bit}:${start_bit}];\n"
+REG_WRITE = compileTemplate("${addr}:begin\n${write_block}end\n")
+REG_WRITE_CASE = compileTemplate("case(${select})\n${items}endcase\n")
+REG_WRITE_CASEX = compileTemplate("casex(${address}[${msb}:${lsb}])\n${items}endcase\n")
+REG_WRITE_STRB = compileTemplate("if(${write_strobe}[${n}])\n    ${name}[${end_bit}:${start_bit}] <= ${write_data}[${end_bit}:${start_bit}];\n")
 # Register field define
-REG_FIELD_DEFINE = "${dir} wire [${end_bit}:0] ${field},\n"
-REG_FIELD_DEFINE_WHOLE = "${dir} reg [${end_bit}:0] ${field},\n"
-REG_FIELD_DEFINE_SINGLE = "${dir} wire ${field},\n"
+REG_FIELD_DEFINE = compileTemplate("${dir} wire [${end_bit}:0] ${field},\n")
+REG_FIELD_DEFINE_WHOLE = compileTemplate("${dir} reg [${end_bit}:0] ${field},\n")
+REG_FIELD_DEFINE_SINGLE = compileTemplate("${dir} wire ${field},\n")
 # Register field output
-REG_FIELD_ASSIGN = "assign ${field} = ${name}[${bit_range}];\n"
+REG_FIELD_ASSIGN = compileTemplate("assign ${field} = ${name}[${bit_range}];\n")
 # Register field update
-REG_FIELD_UPDATE = "${name}[${bit_range}] <= ${field};\n"
+REG_FIELD_UPDATE = compileTemplate("${name}[${bit_range}] <= ${field};\n")
+
+# Net and variable declarations of the generated source
+DECLARATION = re.compile(r'^\s*(?:(?:input|output|inout)\s+)?(?:reg|wire)\s+(?:signed\s+)?(?:\[[^\]]*\]\s*)?([A-Za-z_]\w*)', re.M)
 
 @dataclass
 class BlockGenerator():
     template:str
 
-    def __init__(self, template, blockGenerateFunction):
+    def __init__(self, template, blockGenerateFunction, perRegister = True):
         self.template = template
         self.getBlockContent = blockGenerateFunction
+        # Called for each register, or once for the register list
+        self.perRegister = perRegister
 
 class RegifSrcGenerator():
     def __init__(self, template, desc, srcFileName, outputFileName):
@@ -71,6 +111,21 @@ class RegifSrcGenerator():
         self.__busWidth = desc['interface']['params']['width']
         self.__readFunctionName = desc['interface']['signals']['read-function']
         self.__writeStrobeName = desc['interface']['signals']['write-strobe']
+        self.__writeDataName = desc['interface']['signals']['write-data']
+        self.__readAddressName = desc['interface']['signals']['read-address']
+        self.__writeAddressName = desc['interface']['signals']['write-address']
+
+        # Address decode
+        self.__decode = desc['interface']['params'].get('decode', 'full')
+        with stage('address_map'):
+            self.__addressMap = AddressMap(desc)
+            self.__addressMap.check()
+        with stage('decode_bits'):
+            self.__decodeBits = self.__addressMap.decodeBits()
+        # Address of the read data
+        self.__readSelectName = self.__readAddressName
+        # Compiled byte write blocks by register width
+        self.__byteWrite = {}
 
         # Source file line ending
         if str.find(self.__template, '\r\n') != -1:
@@ -89,57 +144,241 @@ class RegifSrcGenerator():
         self.__blockGenerators = [
             BlockGenerator('reg_field_define',self.__getFieldDefines),
             BlockGenerator('reg_field_assign',self.__getFieldAssignment),
-            BlockGenerator('reg_field_update',self.__getFieldUpdate),
+            BlockGenerator('reg_field_update',self.__getFieldUpdate)
+        ]
 
-            BlockGenerator('reg_define',self.__getRegDefine),
-            BlockGenerator('reg_read',self.__getReadBlock),
-            BlockGenerator('reg_write',self.__getWriteBlock),
-            BlockGenerator('reg_reset',self.__getResetBlock)
+        if 'bram_port' in compileTemplate(self.__template).names:
+            # Pipelined bus templates, block RAM arrays are supported
+            self.__blockGenerators += self.__getPipelinedGenerators()
+        else:
+            for v in desc['registers']:
+                if v.get('count', 0) != 0:
+                    raise RuntimeError('Block RAM register %s is not supported by this template' % v['name'])
+
+            self.__blockGenerators += [
+                BlockGenerator('reg_define',self.__getRegDefine),
+                BlockGenerator('reg_read',self.__getReadBlock,False),
+                BlockGenerator('reg_write',self.__getWriteBlock,False),
+                BlockGenerator('reg_reset',self.__getResetBlock)
+            ]
+
+    def __getPipelinedGenerators(self):
+        '''Block generators of the templates with a bram_port block, as the
+        AHB template. The registers are decoded as the other templates, a
+        block RAM by its bits above the word index, and read by the address
+        of the data phase. The block RAMs have their own ports, read by the
+        address phase address.'''
+        for v in self.__desc['registers']:
+            if v['count'] != 0 and v['whole-field'] == 1:
+                raise RuntimeError('Block RAM register %s can not be a whole field' % v['name'])
+
+        # Template signals of the data phase
+        self.__readSelectName = 'raddr_last'
+
+        signals = {
+            'write-address': self.__writeAddressName,
+            'write-strobe': self.__writeStrobeName,
+            'write-data': self.__writeDataName,
+            'read-address': self.__readAddressName,
+            'read-data': self.__readFunctionName,
+            'write-enable': 'write_pending',
+            'clock': 'clk'
+        }
+        registers = self.__desc['registers']
+        busWidth = self.__busWidth
+
+        # Block RAM writes selected by the decode bits
+        bases = {}
+        if self.__decode != 'full':
+            for v in registers:
+                if v['count'] != 0:
+                    bits = self.__getRegionBits(v, self.__decodeBits)
+                    bases[v['name']] = ('%s == %s' % (self.__getSelect(self.__writeAddressName, bits), self.__getSelectValue(v, bits))
+                                        if bits else "1'b1")
+
+        self.__readItems = cbg.ReadBlockGenDataPhase(registers, signals, busWidth)
+        self.__writeItems = cbg.WriteBlockGen(registers, signals, busWidth)
+
+        generators = [
+            cbg.RegDefineGen(registers, signals, busWidth, pipelined = True),
+            cbg.ResetBlockGen(registers, signals, busWidth),
+            cbg.BramPortGen(registers, signals, busWidth, bases)
         ]
 
+        return [BlockGenerator(v.BLOCK_NAME, lambda registers, v = v: v.generate(), False) for v in generators] + [
+            BlockGenerator('reg_read', self.__getPipelinedReadBlock, False),
+            BlockGenerator('reg_write', self.__getPipelinedWriteBlock, False)
+        ]
+
+    def __getPipelinedReadBlock(self, registers):
+        '''Read block of the data phase, the write only registers read as zero'''
+        if self.__decode == 'full':
+            return REG_READ_CASEX.substitute(read_function = self.__readFunctionName, width = self.__busWidth * 8,
+                                             address = self.__readSelectName, msb = 31, lsb = self.__addressMap.wordBits,
+                                             items = cbg.indent(self.__readItems.generate()))
+
+        return self.__getReadBlock([v for v in registers if v['access'] != 2])
+
+    def __getPipelinedWriteBlock(self, registers):
+        '''Write block of the registers, the block RAMs are written by their ports'''
+        if self.__decode == 'full':
+            return REG_WRITE_CASEX.substitute(address = self.__writeAddressName, msb = 31, lsb = self.__addressMap.wordBits,
+                                              items = cbg.indent(self.__writeItems.generate()))
+
+        return self.__getWriteBlock([v for v in registers if v['count'] == 0 and v['access'] != 1])
+
     def setEnding(self, ending):
         self.__ending = ending
 
     # Get register signal definations
-    
+    def __getRegDefine(self, regDesc):
+        # Declared by the port of a whole-field register
+        if regDesc['whole-field'] == 1:
+            return ''
 
-    def __getReadBlock(self, regDesc):
-        addr = regDesc['addr']
         name = regDesc['name']
-        width = regDesc['width']
+        width = regDesc['width'] * 8 - 1
+
+        return REG_DEFINE.substitute(name = name, width = width)
+
+    def __getSelect(self, address, bits):
+        '''Expression of the byte address bits of the word address bits'''
+        slices = ['%s[%d:%d]' % (address, a + self.__addressMap.wordBits, b + self.__addressMap.wordBits) if a != b
+                  else '%s[%d]' % (address, a + self.__addressMap.wordBits) for a, b in bitSlices(bits)]
+
+        if len(slices) == 1:
+            return slices[0]
+        return '{%s}' % ', '.join(slices)
+
+    def __getSelectValue(self, regDesc, bits):
+        return "%d'h%x" % (len(bits), project(regDesc['addr'] >> self.__addressMap.wordBits, bits))
+
+    def __getRegionBits(self, regDesc, bits):
+        '''Decode bits of a register, the word index bits of a block RAM are not'''
+        indexBits = (max(regDesc['count'], 1) - 1).bit_length()
+        return [b for b in bits if b >= indexBits]
+
+    def __getBankValues(self, regDesc, bits):
+        '''Select values of the banks of a register, a block RAM spans the
+        banks of its word index bits'''
+        regionBits = self.__getRegionBits(regDesc, bits)
+        if len(regionBits) == len(bits):
+            return [self.__getSelectValue(regDesc, bits)]
+
+        base = project(regDesc['addr'] >> self.__addressMap.wordBits, bits)
+        free = [len(bits) - 1 - i for i, b in enumerate(bits) if not b in regionBits]
+        values = []
+        for i in range(1 << len(free)):
+            value = base
+            for j, k in enumerate(free):
+                if (i >> j) & 1:
+                    value |= 1 << k
+            values.append("%d'h%x" % (len(bits), value))
+
+        return values
+
+    def __getReadData(self, regDesc):
+        # Output register of the block RAM port
+        name = regDesc['name'] + '_rdata' if regDesc['count'] != 0 else regDesc['name']
+
+        if self.__busWidth > regDesc['width']:
+            paddingBits = (self.__busWidth - regDesc['width']) * 8
+            return REG_READ_FILL.substitute(padding_bits = paddingBits, name = name)
+        return name
+
+    def __getReadTerms(self, registers, bits):
+        '''AND-OR multiplexer of the registers, selected by the bits'''
+        if len(bits) == 0:
+            return self.__getReadData(registers[0])
+
+        select = self.__getSelect(self.__readSelectName, bits)
+        terms = []
+        for v in registers:
+            regionBits = self.__getRegionBits(v, bits)
+            if len(regionBits) == len(bits):
+                sel = '%s == %s' % (select, self.__getSelectValue(v, bits))
+            elif regionBits:
+                sel = '%s == %s' % (self.__getSelect(self.__readSelectName, regionBits), self.__getSelectValue(v, regionBits))
+            else:
+                sel = "1'b1"
+            terms.append(REG_READ_TERM.substitute(width = self.__busWidth * 8, select = sel, data = self.__getReadData(v)))
+
+        return '\n    | '.join(terms)
+
+    def __getReadBlock(self, registers):
         readFunction = self.__readFunctionName
+        width = self.__busWidth * 8
 
-        if self.__busWidth > width:
-            paddingBits = self.__busWidth - width
-            return Template(REG_READ_FILL).substitute(addr = addr, padding_bits = paddingBits, name = name, read_function = readFunction)
-        elif self.__busWidth == width:
-            return Template(REG_READ).substitute(addr = addr, name = name, read_function = readFunction)
-        else:
-            raise RuntimeError('Register width larger than bus width.')
+        if len(registers) == 0:
+            return "%s = %d'h0;\n" % (readFunction, width)
+
+        # Full decode, a case of the word address
+        if self.__decode == 'full':
+            wordBits = self.__addressMap.wordBits
+            items = ''.join([REG_READ.substitute(addr = '%x' % (v['addr'] >> wordBits), read_function = readFunction,
+                             data = self.__getReadData(v)) for v in registers])
+            return REG_READ_FULL.substitute(address = self.__readSelectName, msb = 31, lsb = wordBits,
+                                                      items = cbg.indent(items), read_function = readFunction, width = width)
+
+        # Small maps, a one-hot AND-OR multiplexer of the decode bits
+        bits = self.__decodeBits
+        if len(registers) <= BANK_SIZE:
+            return REG_READ_ONEHOT.substitute(read_function = readFunction, terms = self.__getReadTerms(registers, bits))
+
+        # Large maps, banks selected by the high decode bits
+        bankBits = bits[:max(1, (len(registers) - 1).bit_length() - (BANK_SIZE - 1).bit_length())]
+        regBits = bits[len(bankBits):]
+
+        banks = {}
+        for v in registers:
+            for value in self.__getBankValues(v, bankBits):
+                banks.setdefault(value, []).append(v)
+
+        items = ''.join([REG_READ_BANK_ITEM.substitute(value = value, read_function = readFunction,
+                                                       terms = self.__getReadTerms(li, regBits).replace('\n', '\n    '))
+                         for value, li in sorted(banks.items())])
+
+        return REG_READ_BANK.substitute(select = self.__getSelect(self.__readSelectName, bankBits),
+                                        items = cbg.indent(items), read_function = readFunction, width = width)
 
     def __getResetBlock(self, regDesc):
         name = regDesc['name']
         width = regDesc['width'] * 8
 
-        return Template(REG_RESET).substitute(name = name, width = width)
+        return REG_RESET.substitute(name = name, width = width)
 
-    def __getWriteBlock(self, regDesc):
-        name = regDesc['name']
-        addr = regDesc['addr']
-        bytes = regDesc['width']
-        writeStrobe = self.__writeStrobeName
+    def __getByteWrite(self, regDesc):
+        '''Byte write enable block of a register'''
+        width = regDesc['width']
 
-        # Generate byte write enable block
-        bweCode = ''
-        for i in range(0,bytes):
-            startBit = i * 8
-            endBit = (i + 1) * 8 - 1
+        # The lanes of a register width are the same but the name
+        if not width in self.__byteWrite:
+            lanes = [REG_WRITE_STRB.substitute(n = i, start_bit = i * 8, end_bit = (i + 1) * 8 - 1, name = '${name}',
+                                               write_strobe = self.__writeStrobeName, write_data = self.__writeDataName)
+                     for i in range(0, width)]
+            self.__byteWrite[width] = compileTemplate(''.join(lanes))
 
-            bweCode += Template(REG_WRITE_STRB).safe_substitute(n = str(i), start_bit = str(startBit), end_bit = str(endBit), write_strobe = writeStrobe)
+        return self.__byteWrite[width].substitute(name = regDesc['name'])
 
-        bweCode = Template(bweCode).substitute(name = name)
+    def __getWriteBlock(self, registers):
+        if len(registers) == 0:
+            return ''
 
-        return Template(REG_WRITE).substitute(addr = addr, write_block = bweCode)
+        if self.__decode == 'full':
+            wordBits = self.__addressMap.wordBits
+            select = '%s[31:%d]' % (self.__writeAddressName, wordBits)
+            values = ["'h%x" % (v['addr'] >> wordBits) for v in registers]
+        else:
+            bits = self.__decodeBits
+            if len(bits) == 0:
+                return self.__getByteWrite(registers[0])
+
+            select = self.__getSelect(self.__writeAddressName, bits)
+            values = [self.__getSelectValue(v, bits) for v in registers]
+
+        items = ''.join([REG_WRITE.substitute(addr = a, write_block = cbg.indent(self.__getByteWrite(v))) for a, v in zip(values, registers)])
+
+        return REG_WRITE_CASE.substitute(select = select, items = cbg.indent(items))
 
     def __getFieldDefines(self, regDesc):
         if regDesc['whole-field'] == 1:
@@ -147,7 +386,7 @@ class RegifSrcGenerator():
             end_bit = regDesc['width'] * 8 - 1
             name = regDesc['name']
 
-            return Template(REG_FIELD_DEFINE_WHOLE).substitute(dir = direction, end_bit = end_bit, field = name)
+            return REG_FIELD_DEFINE_WHOLE.substitute(dir = direction, end_bit = end_bit, field = name)
 
         s = ''
 
@@ -166,9 +405,9 @@ class RegifSrcGenerator():
             bitRange = v['bit'].split(':')
             width = int(bitRange[0]) - int(bitRange[1])
             if width == 0:
-                s += Template(REG_FIELD_DEFINE_SINGLE).substitute(dir = direction, field = name)
+                s += REG_FIELD_DEFINE_SINGLE.substitute(dir = direction, field = name)
             else:
-                s += Template(REG_FIELD_DEFINE).substitute(dir = direction, end_bit = width, field = name)
+                s += REG_FIELD_DEFINE.substitute(dir = direction, end_bit = width, field = name)
         return s
 
     def __getFieldAssignment(self, regDesc):
@@ -182,7 +421,7 @@ class RegifSrcGenerator():
                 name = v['name']
                 bitRange = v['bit']
 
-                s += Template(REG_FIELD_ASSIGN).substitute(field = name, name = regName, bit_range = bitRange)
+                s += REG_FIELD_ASSIGN.substitute(field = name, name = regName, bit_range = bitRange)
 
         return s
 
@@ -196,7 +435,7 @@ class RegifSrcGenerator():
                 name = v['name']
                 bitRange = v['bit']
 
-                s += Template(REG_FIELD_UPDATE).substitute(field = name, name = regName, bit_range = bitRange)
+                s += REG_FIELD_UPDATE.substitute(field = name, name = regName, bit_range = bitRange)
 
         return s
 
@@ -205,62 +444,171 @@ class RegifSrcGenerator():
         dt = time.localtime()
         dt = time.asctime(dt)
 
-        return Template(COMMENT_HEADER).substitute(outputfile = self.__outputFile, sourcefile = self.__sourceFile, datetime = dt)
+        return COMMENT_HEADER.substitute(outputfile = self.__outputFile, sourcefile = self.__sourceFile, datetime = dt)
 
-    def __insertTabAndFormat(self, s, n, tab):
-        # Split the string by line
-        li = s.splitlines(keepends = False)
+    def generateSource(self):
+        registers = self.__desc['registers']
 
-        for i in range(1,len(li)):
-            li[i] = (tab * n) + li[i]
+        # Content of the blocks
+        d = {}
+        for v in self.__blockGenerators:
+            with stage(v.template):
+                if v.perRegister:
+                    d[v.template] = ''.join([v.getBlockContent(reg) for reg in registers])
+                else:
+                    d[v.template] = v.getBlockContent(registers)
 
-        return self.__ending.join(li)
+        # Add header
+        d['header_comment'] = self.__getHeaderComment()
 
-    def generateSource(self):
-        # Blocks to be substituted
-        blocks = ['' for i in range(len(self.__blockGenerators))]
+        # Fill the blocks in the template, indented as the placeholders
+        with stage('render'):
+            source = compileTemplate(self.__template).render(d, self.__ending)
 
-        # Get the content of the blocks
-        for v in self.__desc['registers']:
-            for i in range(len(self.__blockGenerators)):
-                blocks[i] += self.__blockGenerators[i].getBlockContent(v)
+        self.__checkDeclarations(source)
 
-        # Insert tab for the blocks and generate substitute dict
-        d = {}
-        for i in range(len(self.__blockGenerators)):
-            # Find the template position first
-            pos = str.find(self.__template, self.__blockGenerators[i].template)
-            # Then find the last \n or \r
-            lastEnding = 0
-            for j in range(0, pos):
-                if self.__template[pos - j] == '\n' or self.__template[pos - j] == '\r':
-                    break
-            frontBlank = self.__template[pos-j:pos]
-            # Calculate the number of the tabs
-            # Tab or several spaces?
-            if str.find(frontBlank, '\t') != -1:
-                tabs = j
-                tab = '\t'
-            else:
-                tabs = j / 4    # A tab MUST BE equal to four spaces
-                tab = '    '
+        return source
 
-            # Insert tabs
-            blocks[i] = self.__insertTabAndFormat(blocks[i], int(tabs), tab)
+    def __checkDeclarations(self, source):
+        '''A signal declared twice, e.g. a register of the template blocks and a port, does not compile'''
+        seen = set()
+        for name in DECLARATION.findall(source):
+            if name in seen:
+                raise RuntimeError('Signal %s is declared twice in the generated source' % name)
+            seen.add(name)
+
+# Folder of the generator
+GENERATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+# Source files of the generator, included in the hash of an output
+GENERATOR_FILES = ['rif_2_verilog.py', 'CodeblockGenerators.py', 'RegifDescription.py', 'RegifAddressMap.py', 'RegifTemplate.py']
+# Hash cache of the batch mode, in the output folder
+CACHE_FILE = '.rif_cache.json'
+
+def generateFile(inputFile, templateFile, outputFile):
+    '''Generate a register interface source file'''
+    with stage('load'):
+        desc = loadDescription(inputFile)
+
+        # Open the template file
+        with open(templateFile, 'r') as f:
+            template = f.read()
 
-            d[self.__blockGenerators[i].template] = blocks[i]
+    # Generate register interface source file
+    with stage('generate'):
+        gen = RegifSrcGenerator(template, desc, inputFile, outputFile)
+        regifSource = gen.generateSource()
 
-        # Add header
-        d['header_comment'] = self.__getHeaderComment()
+    # Write to the output file
+    with stage('write'):
+        with open(outputFile, 'w') as f:
+            f.write(regifSource)
+
+def fileHash(*files):
+    h = hashlib.sha256()
+    for v in files:
+        with open(v, 'rb') as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+def generatorHash():
+    return fileHash(*[os.path.join(GENERATOR_DIR, v) for v in GENERATOR_FILES])
+
+def getOutputName(inputFile, templateFile):
+    descName = os.path.splitext(os.path.basename(inputFile))[0]
+    templateName = os.path.splitext(os.path.basename(templateFile))[0]
+    if templateName.startswith('template_'):
+        templateName = templateName[len('template_'):]
+
+    return '%s_regif_%s.v' % (descName, templateName)
+
+def batchJob(job):
+    '''Generate an output in a worker process, returns (output, error)'''
+    inputFile, templateFile, outputFile = job
+
+    try:
+        generateFile(inputFile, templateFile, outputFile)
+    except Exception as e:
+        return (outputFile, '%s: %s' % (type(e).__name__, e))
+
+    return (outputFile, None)
+
+def batchWorker(job):
+    '''batchJob in a worker process, returns the result and the stage report of the job'''
+    result = batchJob(job)
+    return result, Instrumentation.collect() if Instrumentation else None
+
+def generateBatch(descDir, templateFiles, outputDir, jobs = None, force = False):
+    '''Generate all descriptions with all templates, returns the failed outputs'''
+    os.makedirs(outputDir, exist_ok = True)
+
+    # Hash cache
+    cacheFile = os.path.join(outputDir, CACHE_FILE)
+    cache = {}
+    if os.path.isfile(cacheFile) and not force:
+        with open(cacheFile, 'r') as f:
+            cache = json.load(f)
+
+    genHash = generatorHash()
+    templateHash = {v: fileHash(v) for v in templateFiles}
+
+    inputFiles = sorted([os.path.join(descDir, v) for v in os.listdir(descDir) if v.endswith(('.yml', '.yaml'))])
+
+    # Jobs of the changed outputs
+    todo = []
+    hashes = {}
+    for inputFile in inputFiles:
+        inputHash = fileHash(inputFile)
+
+        for templateFile in templateFiles:
+            outputFile = os.path.join(outputDir, getOutputName(inputFile, templateFile))
+            key = os.path.basename(outputFile)
+            hashes[key] = [inputHash, templateHash[templateFile], genHash]
+
+            if cache.get(key) == hashes[key] and os.path.isfile(outputFile):
+                print('Up to date: %s' % outputFile)
+                continue
+
+            todo.append((inputFile, templateFile, outputFile))
+
+    # Generate in parallel
+    failed = []
+    if len(todo) > 1 and jobs != 1:
+        results = []
+        with ProcessPoolExecutor(max_workers = jobs) as executor:
+            for result, report in executor.map(batchWorker, todo):
+                results.append(result)
+                if Instrumentation:
+                    Instrumentation.merge(report)
+    else:
+        results = [batchJob(v) for v in todo]
+
+    for outputFile, error in results:
+        key = os.path.basename(outputFile)
+        if error is None:
+            print('Generated: %s' % outputFile)
+            cache[key] = hashes[key]
+        else:
+            print('FAILED: %s, %s' % (outputFile, error))
+            cache.pop(key, None)
+            failed.append(outputFile)
 
-        # Substitute the blocks in the template file
-        source = Template(self.__template).substitute(d)
+    with open(cacheFile, 'w') as f:
+        json.dump(cache, f, indent = 2, sort_keys = True)
 
-        return source
+    print('%d outputs, %d generated, %d failed' % (len(hashes), len(todo) - len(failed), len(failed)))
+
+    return failed
 
 if __name__ == '__main__':
     # Parse the arguments
-    opts, args = getopt.getopt(sys.argv[1:], "hi:Tt:o:")
+    opts, args = getopt.getopt(sys.argv[1:], "hi:Tt:o:mbd:O:j:f")
+
+    batch = False
+    addressMap = False
+    descDir = os.path.join(GENERATOR_DIR, 'reg_desc')
+    jobs = None
+    force = False
 
     for opt,val in opts:
         if opt == '-i':
@@ -269,6 +617,18 @@ if __name__ == '__main__':
             templateName = val
         elif opt == '-o':
             outputFile = val
+        elif opt == '-m':
+            addressMap = True
+        elif opt == '-b':
+            batch = True
+        elif opt == '-d':
+            descDir = val
+        elif opt == '-O':
+            outputDir = val
+        elif opt == '-j':
+            jobs = int(val)
+        elif opt == '-f':
+            force = True
         elif opt == '-T':
             print('Templates in the ./src_tmpl folder:')
             for root, dirs, files in os.walk("./src_tmpl", topdown=False):
@@ -279,27 +639,19 @@ if __name__ == '__main__':
         else:
             print(HELP_MESSAGE)
             exit()
-    
-    # Open the desription file
-    desc = None
-    with open(inputFile, 'r') as f:
-        desc = f.read()
-        f.close()
-
-        desc = yaml.load(desc, yaml.loader.Loader)
-
-    # Open the template file
-    templateFile = 'src_tmpl/%s' % templateName
-    template = None
-    with open(templateFile, 'r') as f:
-        template = f.read()
-        f.close()
 
-    # Generate register interface source file
-    gen = RegifSrcGenerator(template, desc, inputFile, outputFile)
-    regifSource = gen.generateSource()
+    if batch:
+        templateFiles = [os.path.join(GENERATOR_DIR, 'src_tmpl', v) for v in templateName.split(',')]
+        failed = generateBatch(descDir, templateFiles, outputDir, jobs, force)
 
-    # Write to the output file
-    with open(outputFile, 'w') as f:
-        f.write(regifSource)
-        f.close()
+        sys.exit(1 if failed else 0)
+
+    if addressMap:
+        print(AddressMap(loadDescription(inputFile)).report())
+        exit()
+
+    try:
+        generateFile(inputFile, 'src_tmpl/%s' % templateName, outputFile)
+    except (DescriptionError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,122 @@
+/*
+${header_comment}
+*/
+module ahb_regif_template(
+    /* Signal I/O */
+    ${reg_field_define}
+
+    /* Configure interface, AHB-Lite */
+    // Global
+    input  wire        clk,            //! Slave interface clock
+    input  wire        reset_n,        //! Slave interface reset, active low
+    // Address phase
+    input  wire [31:0] haddr_s,        //! Address
+    input  wire [2:0]  hburst_s,       //! Burst type, no sense, bursts are single transfers back to back
+    input  wire [2:0]  hsize_s,        //! Transfer size
+    input  wire [1:0]  htrans_s,       //! Transfer type
+    input  wire        hwrite_s,       //! Write transfer
+    input  wire        hsel_s,         //! Slave select
+    input  wire        hready_s,       //! Previous transfer done
+    // Data phase
+    input  wire [31:0] hwdata_s,       //! Write data
+    output reg  [31:0] hrdata_s,       //! Read data
+    output wire        hreadyout_s,    //! Transfer done, always ready
+    output wire        hresp_s         //! Response, always OKAY
+);
+
+    /*
+        Zero wait state pipeline. A transfer is accepted at the end of its
+        address phase, then completed in its data phase:
+            Write: the data is written at the end of the data phase.
+            Read:  the registers are read by the address of the data phase,
+                   the block RAMs are read at the end of the address phase.
+        A read right after a write of the same word gets the written bytes
+        from the write data, so back to back transfers never wait.
+    */
+    assign hreadyout_s = 1'b1;
+    assign hresp_s     = 1'b0;
+
+    // Address phase
+    wire        ahb_accept = hsel_s && hready_s && htrans_s[1];     // NONSEQ or SEQ
+    wire [31:0] raddr_s    = haddr_s;
+
+    // Byte strobes of the transfer size
+    reg  [3:0]  ahb_strb;
+    always @(*) begin
+        case(hsize_s)
+            3'b000:  ahb_strb = 4'b0001 << haddr_s[1:0];
+            3'b001:  ahb_strb = haddr_s[1] ? 4'b1100 : 4'b0011;
+            default: ahb_strb = 4'b1111;
+        endcase
+    end
+
+    // Data phase
+    reg         write_pending;
+    reg  [31:0] waddr_s;
+    reg  [3:0]  wstrb_s;
+    reg  [31:0] raddr_last;
+    wire [31:0] wdata_s = hwdata_s;
+
+    // Read after write forwarding
+    reg         fwd_hit;
+    reg  [31:0] fwd_data;
+    reg  [31:0] fwd_mask;
+
+    always @(posedge clk, negedge reset_n) begin
+        if(!reset_n) begin
+            write_pending <= 1'b0;
+            waddr_s       <= 32'h0;
+            wstrb_s       <= 4'h0;
+            raddr_last    <= 32'h0;
+            fwd_hit       <= 1'b0;
+            fwd_data      <= 32'h0;
+            fwd_mask      <= 32'h0;
+        end
+        else begin
+            write_pending <= ahb_accept && hwrite_s;
+
+            if(ahb_accept && hwrite_s) begin
+                waddr_s <= haddr_s;
+                wstrb_s <= ahb_strb;
+            end
+
+            if(ahb_accept && !hwrite_s)
+                raddr_last <= haddr_s;
+
+            fwd_hit  <= ahb_accept && !hwrite_s && write_pending && (waddr_s[31:2] == haddr_s[31:2]);
+            fwd_data <= hwdata_s;
+            fwd_mask <= { {8{wstrb_s[3]}}, {8{wstrb_s[2]}}, {8{wstrb_s[1]}}, {8{wstrb_s[0]}} };
+        end
+    end
+
+    /* Register access */
+    // Registers
+    ${reg_define}
+
+    // Block RAM ports
+    ${bram_port}
+
+    // Register read
+    reg  [31:0] read_reg;
+    always @(*) begin
+        ${reg_read}
+
+        hrdata_s = fwd_hit ? ((read_reg & ~fwd_mask) | (fwd_data & fwd_mask)) : read_reg;
+    end
+
+    // Register write, a bus write takes precedence over the field updates
+    always @(posedge clk, negedge reset_n) begin
+        if(!reset_n) begin
+            ${reg_reset}
+        end
+        else begin
+            ${reg_field_update}
+            if(write_pending) begin
+                ${reg_write}
+            end
+        end
+    end
+
+    /* Register fields output */
+    ${reg_field_assign}
+endmodule
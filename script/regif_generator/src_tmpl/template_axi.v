@@ -154,15 +154,15 @@ module axi_regif_template(
 
     // Register read
     function [31:0] read_reg;
-        input  [31:0] addr;
+        input  [31:0] raddr_s;
     begin
-        case(addr[31:2])
-            ${reg_read}
-        endcase
+        ${reg_read}
     end
     endfunction
 
     // Register write
+    wire [31:0] waddr_s = conf_if_addr;
+
     always @(posedge aclk_s, negedge aresetn_s) begin
         if(!aresetn_s) begin
             ${reg_reset}
@@ -170,9 +170,7 @@ module axi_regif_template(
         else begin
         if(ce) begin
             if((conf_if_state == STAT_WDATA) && (wvalid_s && wready_s)) begin
-                case(conf_if_addr[31:2])
-                    ${reg_write}
-                endcase
+                ${reg_write}
             end
             else begin
                 ${reg_field_update}
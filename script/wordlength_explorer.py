@@ -0,0 +1,341 @@
+'''
+    wordlength_explorer.py
+    Word-length exploration of the DSP chain, CIC -> FIR -> AGC -> window -> FFT -> modulus
+
+    Each stage is a vectorized model on full-scale fractions in [-1, 1), and a
+    word length W truncates the stage output to W-bit two's complement, as the
+    >>> and part selects of the RTL. The output SNR of a candidate is measured
+    against the same chain without quantization, so it is the loss of precision
+    alone. Candidates sharing the upstream widths reuse the upstream outputs.
+'''
+import sys, getopt, json, time, itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy import signal
+import yaml
+
+from fft_window import WINDOWS, parseWindow, quantize as quantizeWindow
+
+HELP_MESSAGE = '''Sweep the word lengths of the DSP chain and report the Pareto frontier
+of the resource estimate against the output SNR.
+Usage: python wordlength_explorer.py [-c <config_file>] [-j <jobs>] [-s <snr>] [-o <report_file>] [-q] [-h]
+    -c <config_file>
+        YAML config, the keys of DEFAULT_CONFIG. Missing keys keep the defaults.
+    -j <jobs>
+        Worker processes, count of CPUs by default.
+    -s <snr>
+        Required SNR in dB, the smallest candidate meeting it is reported.
+    -o <report_file>
+        Write the frontier and all candidates as JSON.
+    -q
+        Quick sweep, two widths per stage around 16 bits.
+    -h
+        Display this help message.
+
+Stages and their width:
+    cic         Output of the CIC decimator, and the FIR sample buffer
+    fir         Output of the FIR
+    coeff       FIR coefficients
+    agc         AGC gain and output
+    window      Window coefficients and output
+    fft         Butterfly data of the FFT, scaled by 1/2 per stage
+    modulus     Output of the modulus (alpha max + beta min)
+
+The resource estimate is in LUT equivalents: the multiplier bit products,
+plus the memory bits times memory-weight.'''
+
+DEFAULT_CONFIG = {
+    'widths': {
+        'cic':     [12, 14, 16, 18],
+        'fir':     [12, 14, 16, 18],
+        'coeff':   [10, 12, 14, 16],
+        'agc':     [12, 14, 16, 18],
+        'window':  [10, 12, 14, 16],
+        'fft':     [14, 16, 18, 20],
+        'modulus': [12, 14, 16],
+    },
+    'input-width': 16,
+    'decimation': 8,        # CIC rate
+    'cic-order': 5,
+    'fir-taps': 63,
+    'fir-cutoff': 0.4,      # Of the decimated Nyquist frequency
+    'agc-level': 0.25,      # RMS output of the AGC, of full scale
+    'agc-gain-bits': 4,     # Integer bits of the AGC gain
+    'window': 'hann',
+    'fft-length': 1024,
+    'frames': 8,            # Frames of each stimulus, after the settling frame
+    'memory-weight': 1 / 32,
+}
+
+QUICK_WIDTHS = {
+    'cic': [14, 16], 'fir': [14, 16], 'coeff': [12, 16], 'agc': [14, 16],
+    'window': [12, 16], 'fft': [16, 18], 'modulus': [14, 16],
+}
+
+STAGES = ['cic', 'fir', 'coeff', 'agc', 'window', 'fft', 'modulus']
+
+# Models of the stages, the width None is the float reference
+
+def quantize(x, width, rounding = False):
+    '''Fractions of a W-bit word, truncated (or rounded) and saturated'''
+    if width is None:
+        return x
+    scale = 1 << (width - 1)
+    v = np.round(x * scale) if rounding else np.floor(x * scale)
+    return np.clip(v, -scale, scale - 1) / scale
+
+def quantizeComplex(x, width):
+    if width is None:
+        return x
+    return quantize(x.real, width) + 1j * quantize(x.imag, width)
+
+def cicStage(x, config, width):
+    '''CIC of unity gain, the internal registers are wide enough (Hogenauer pruned)'''
+    R = config['decimation']
+    N = config['cic-order']
+    h = np.ones(R)
+    for i in range(N - 1):
+        h = np.convolve(h, np.ones(R))
+    y = signal.lfilter(h / pow(R, N), 1, x)[::R]
+    return quantize(y, width)
+
+def firTaps(config, width):
+    taps = signal.firwin(config['fir-taps'], config['fir-cutoff'])
+    return quantize(taps, width, rounding = True)
+
+def firStage(x, taps, width):
+    return quantize(signal.lfilter(taps, 1, x), width)
+
+def agcStage(x, config, width):
+    '''Settled AGC, a constant gain to the level, the gain has agc-gain-bits integer bits'''
+    rms = np.sqrt(np.mean(x * x)) or 1.0
+    top = 1 << config['agc-gain-bits']
+    gain = min(config['agc-level'] / rms, top)
+    if width is not None:
+        step = pow(2.0, config['agc-gain-bits'] + 1 - width)
+        gain = min(round(gain / step) * step, top - step)
+    return quantize(x * gain, width)
+
+def windowCoeffs(config, width):
+    '''Window of fft_window.py, quantized as its tables'''
+    name, param = parseWindow(config['window'])
+    w = WINDOWS[name][0](config['fft-length'], param, False)
+    if width is None:
+        return w
+    return quantizeWindow(w, width, width - 1) / (1 << (width - 1))
+
+def frames(x, config):
+    '''Frames of the stream, the first frame is dropped for the settling of the filters'''
+    n = config['fft-length']
+    count = len(x) // n - 1
+    return x[n:n * (count + 1)].reshape(count, n)
+
+def windowStage(x, coeffs, width):
+    return quantize(x * coeffs, width)
+
+def fftStage(x, width):
+    '''Radix-2 decimation in frequency over the frames, scaled by 1/2 per stage'''
+    n = x.shape[1]
+    stages = n.bit_length() - 1
+    y = x.astype(np.complex128)
+
+    for s in range(stages):
+        half = n >> (s + 1)
+        y = y.reshape(len(x), 1 << s, 2, half)
+        a = y[:, :, 0, :]
+        b = y[:, :, 1, :]
+        twiddle = np.exp(-2j * np.pi * np.arange(half) / (2 * half))
+        y = np.stack([quantizeComplex((a + b) / 2, width), quantizeComplex((a - b) / 2 * twiddle, width)], axis = 2)
+
+    # Bit reversed order to natural order
+    index = np.zeros(n, dtype = np.int64)
+    for i in range(stages):
+        index |= ((np.arange(n) >> i) & 1) << (stages - 1 - i)
+    return y.reshape(len(x), n)[:, index]
+
+def modulusStage(x, width):
+    '''Alpha max + beta min of modulus.v, 61/64 and 13/32'''
+    re = np.abs(x.real)
+    im = np.abs(x.imag)
+    return quantize(np.maximum(re, im) * 61 / 64 + np.minimum(re, im) * 13 / 32, width)
+
+# Stimuli at the input rate, as fractions of full scale
+
+def stimuli(config):
+    rate = config['decimation']
+    length = config['fft-length'] * (config['frames'] + 1) * rate + config['fir-taps'] * rate
+    t = np.arange(length)
+    rng = np.random.default_rng(1)
+    binFreq = 1 / (config['fft-length'] * rate)
+
+    li = {
+        # Strong and weak tones off the bin centers
+        'two_tones': 0.5 * np.sin(2 * np.pi * 100.3 * binFreq * t) + 0.001 * np.sin(2 * np.pi * 230.7 * binFreq * t),
+        # A weak tone, for the low level precision
+        'low_level': 0.01 * np.sin(2 * np.pi * 150.5 * binFreq * t),
+        'noise': 0.2 * rng.standard_normal(length),
+    }
+    return {k: quantize(v, config['input-width'], rounding = True) for k, v in li.items()}
+
+def snr(output, reference):
+    noise = np.sum((output - reference) ** 2)
+    return float('inf') if noise == 0 else float(10 * np.log10(np.sum(reference ** 2) / noise))
+
+def resourceEstimate(w, config):
+    '''LUT equivalents of the multipliers and the memories'''
+    n = config['fft-length']
+    multipliers = (w['cic'] * w['coeff'] +          # FIR multiply-accumulate
+                   w['fir'] * w['agc'] +             # AGC gain
+                   w['agc'] * w['window'] +          # Window
+                   4 * w['fft'] * w['fft'] +         # Complex twiddle multiply
+                   2 * w['fft'] * 6)                 # Modulus constants
+    memory = (1024 * (w['cic'] + w['coeff']) +      # FIR sample buffer and coefficients
+              n * w['window'] +                      # Window table
+              2 * n * 2 * w['fft'] +                 # FFT ping-pong buffers
+              n * w['modulus'])                      # Output FIFO
+    return multipliers + memory * config['memory-weight']
+
+# Workers
+
+_worker = {}
+
+def initWorker(config):
+    '''Stimuli and the float reference chain, once per process'''
+    _worker['config'] = config
+    _worker['stimuli'] = stimuli(config)
+    _worker['reference'] = {k: runChain(v, config, dict.fromkeys(STAGES)) for k, v in _worker['stimuli'].items()}
+
+def runChain(x, config, w):
+    x = cicStage(x, config, w['cic'])
+    x = firStage(x, firTaps(config, w['coeff']), w['fir'])
+    x = agcStage(x, config, w['agc'])
+    x = windowStage(frames(x, config), windowCoeffs(config, w['window']), w['window'])
+    return modulusStage(fftStage(x, w['fft']), w['modulus'])
+
+def sweepPrefix(prefix):
+    '''Candidates with the given cic, coeff and fir widths, the downstream stages
+    reuse the upstream outputs of the loop nest'''
+    config = _worker['config']
+    widths = config['widths']
+    cic, coeff, fir = prefix
+    results = []
+
+    firOut = {}
+    for k, x in _worker['stimuli'].items():
+        firOut[k] = firStage(cicStage(x, config, cic), firTaps(config, coeff), fir)
+
+    for agc in widths['agc']:
+        agcOut = {k: frames(agcStage(v, config, agc), config) for k, v in firOut.items()}
+        for win in widths['window']:
+            coeffs = windowCoeffs(config, win)
+            winOut = {k: windowStage(v, coeffs, win) for k, v in agcOut.items()}
+            for fft in widths['fft']:
+                fftOut = {k: fftStage(v, fft) for k, v in winOut.items()}
+                for mod in widths['modulus']:
+                    w = {'cic': cic, 'fir': fir, 'coeff': coeff, 'agc': agc, 'window': win, 'fft': fft, 'modulus': mod}
+                    snrs = {k: snr(modulusStage(v, mod), _worker['reference'][k]) for k, v in fftOut.items()}
+                    results.append({
+                        'widths': w,
+                        'snr': snrs,
+                        'worst_snr': min(snrs.values()),
+                        'resources': resourceEstimate(w, config),
+                    })
+
+    return results
+
+def paretoFrontier(results):
+    '''Candidates no other candidate beats in both resources and SNR, by resources'''
+    frontier = []
+    best = -float('inf')
+    for v in sorted(results, key = lambda v: (v['resources'], -v['worst_snr'])):
+        if v['worst_snr'] > best:
+            frontier.append(v)
+            best = v['worst_snr']
+    return frontier
+
+def explore(config, jobs = None):
+    widths = config['widths']
+    prefixes = list(itertools.product(widths['cic'], widths['coeff'], widths['fir']))
+
+    with ProcessPoolExecutor(max_workers = jobs, initializer = initWorker, initargs = (config,)) as executor:
+        results = [v for li in executor.map(sweepPrefix, prefixes) for v in li]
+
+    return results
+
+def loadConfig(path):
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path is not None:
+        with open(path, 'r') as f:
+            v = yaml.load(f, Loader = yaml.FullLoader) or {}
+        config['widths'].update(v.pop('widths', {}))
+        config.update(v)
+
+    for k in STAGES:
+        if not config['widths'].get(k):
+            raise ValueError('No width of %s' % k)
+    n = config['fft-length']
+    if n & (n - 1):
+        raise ValueError('fft-length %d is not a power of 2' % n)
+
+    return config
+
+def formatWidths(w):
+    return ' '.join(['%s=%d' % (k, w[k]) for k in STAGES])
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hc:j:s:o:q")
+
+    config_file = None
+    jobs = None
+    required = None
+    report_file = None
+    quick = False
+
+    for opt,val in opts:
+        if opt == '-c':
+            config_file = val
+        elif opt == '-j':
+            jobs = int(val)
+        elif opt == '-s':
+            required = float(val)
+        elif opt == '-o':
+            report_file = val
+        elif opt == '-q':
+            quick = True
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    try:
+        config = loadConfig(config_file)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if quick:
+        config['widths'] = QUICK_WIDTHS
+
+    count = 1
+    for k in STAGES:
+        count *= len(config['widths'][k])
+    print('Sweeping %d candidates...' % count)
+
+    start = time.perf_counter()
+    results = explore(config, jobs)
+    frontier = paretoFrontier(results)
+    print('%d candidates in %.1fs' % (len(results), time.perf_counter() - start))
+
+    print('\nPareto frontier:')
+    print('%10s %10s  %s' % ('resources', 'SNR dB', 'widths'))
+    for v in frontier:
+        print('%10.0f %10.2f  %s' % (v['resources'], v['worst_snr'], formatWidths(v['widths'])))
+
+    if required is not None:
+        meet = [v for v in frontier if v['worst_snr'] >= required]
+        if meet:
+            print('\nSmallest candidate of %.1f dB: %s, %.0f LUT equivalents' % (required, formatWidths(meet[0]['widths']), meet[0]['resources']))
+        else:
+            print('\nNo candidate reaches %.1f dB' % required)
+
+    if report_file is not None:
+        with open(report_file, 'w') as f:
+            json.dump({'config': config, 'frontier': frontier, 'candidates': results}, f, indent = 2)
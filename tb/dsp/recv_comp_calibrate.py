@@ -0,0 +1,277 @@
+'''
+    recv_comp_calibrate.py
+    Calibration of the receiver_compensation table from captured spectra
+
+    receiver_compensation subtracts the table from the spectrum bin by bin, so
+    the table is the offset of the captured spectrum of a known reference
+    signal from the expected one. Frames are read in blocks, and the per-bin
+    statistics are vectorized over the block.
+'''
+import sys, getopt, glob
+import numpy as np
+
+try:
+    import stream_compare as sc
+except ImportError:
+    sc = None
+
+HELP_MESSAGE = '''Estimate the receiver_compensation table from captured spectra.
+Usage: python recv_comp_calibrate.py -i <captures> [-r <reference>] [-o <output_file>] [options]
+    -i <captures>
+        Comma separated capture files or glob patterns. A capture is an
+        axi_stream_sink dump or a .mem file of the spectrum words, framed by
+        tlast if present, or a .npy array of frames. Dumps and .mem files are
+        read by stream_compare, with tb/infrastructure/axi_stream on PYTHONPATH.
+    -r <reference>
+        Expected spectrum of the reference signal, a .mem or .npy file of one
+        frame. By default the reference is flat, at the median level of the
+        estimate (a white noise reference).
+    -o <output_file>
+        Memory file of the table, recv_comp.mem by default.
+    -n <length>
+        Bins per frame, the DATA_CNT of receiver_compensation. 1024 by default.
+    -b <numerator>
+        Signed bits of the correction, the table is clipped to
+        [-2^(numerator - 1), 2^(numerator - 1) - 1]. 8 by default.
+    -w <width>
+        Word length of the spectrum and the table, the DW of
+        receiver_compensation. 16 by default.
+    -s
+        The spectrum words are signed.
+    -m <clip|median|mean>
+        Averaging of the frames. clip (default): mean of the frames within
+        -k robust deviations of the per-bin median, in two passes. median:
+        median of the block medians, in one pass. mean: plain mean.
+    -k <deviations>
+        Clipping threshold of the clip averaging, 3.0 by default.
+    -h
+        Display this help message.'''
+
+# Frames per block of the statistics
+BLOCK = 256
+# MAD to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+def readFrames(path, length, width = 16, signed = False, block = BLOCK):
+    '''Frames of a capture in blocks of (frames, length) arrays.
+    Frames with x/z words or of another length than the tlast framing are dropped.'''
+    if path.endswith('.npy'):
+        a = np.load(path, mmap_mode = 'r')
+        if a.size % length:
+            raise ValueError('%s has %d words, not a multiple of %d' % (path, a.size, length))
+        a = a.reshape(-1, length)
+        for i in range(0, len(a), block):
+            yield np.asarray(a[i:i + block], dtype = np.int64)
+        return
+
+    stream = sc.Stream(sc.openFile(path), width, signed)
+    data = np.empty(0, dtype = np.int64)
+    valid = np.empty(0, dtype = bool)
+    framed = False
+    frames = []
+
+    while stream.available():
+        n = stream.available()
+        d, v, last, user = stream.view(n)
+        stream.consume(n)
+
+        ends = np.flatnonzero(last) + len(data)
+        data = np.concatenate([data, d])
+        valid = np.concatenate([valid, v])
+
+        # Frame boundaries are the tlast beats, or every length words without tlast
+        framed = framed or len(ends) > 0
+        if framed:
+            starts = np.concatenate([[0], ends[:-1] + 1]) if len(ends) else []
+            bounds = list(zip(starts, ends + 1))
+        else:
+            bounds = [(i, i + length) for i in range(0, len(data) - length + 1, length)]
+
+        for s, e in bounds:
+            if e - s == length and valid[s:e].all():
+                frames.append(data[s:e])
+        cut = bounds[-1][1] if bounds else 0
+        data = data[cut:]
+        valid = valid[cut:]
+
+        while len(frames) >= block:
+            yield np.array(frames[:block])
+            frames = frames[block:]
+
+    if frames:
+        yield np.array(frames)
+
+def readReference(path, length, width = 16, signed = False):
+    if path.endswith('.npy'):
+        ref = np.load(path).astype(np.float64).reshape(-1)
+    else:
+        stream = sc.Stream(sc.openFile(path), width, signed)
+        ref = stream.view(stream.available())[0].astype(np.float64)
+
+    if len(ref) != length:
+        raise ValueError('The reference has %d bins, not %d' % (len(ref), length))
+    return ref
+
+class Calibration():
+    '''Per-bin statistics of the captures'''
+
+    def __init__(self, captures, length = 1024, width = 16, signed = False):
+        self.captures = captures
+        self.length = length
+        self.width = width
+        self.signed = signed
+
+        self.frames = 0
+        self.rejected = np.zeros(length, dtype = np.int64)
+
+    def blocks(self):
+        for path in self.captures:
+            yield from readFrames(path, self.length, self.width, self.signed)
+
+    def blockStatistics(self):
+        '''Per-bin median and MAD of each block, in one pass'''
+        medians = []
+        mads = []
+        self.frames = 0
+
+        for b in self.blocks():
+            m = np.median(b, axis = 0)
+            medians.append(m)
+            mads.append(np.median(np.abs(b - m), axis = 0))
+            self.frames += len(b)
+
+        if not medians:
+            raise ValueError('No complete frame of %d bins in the captures' % self.length)
+
+        return np.array(medians), np.array(mads)
+
+    def estimate(self, method = 'clip', k = 3.0):
+        '''Per-bin level of the captures, and its standard error'''
+        if method == 'mean':
+            total = np.zeros(self.length)
+            square = np.zeros(self.length)
+            self.frames = 0
+            for b in self.blocks():
+                total += b.sum(axis = 0)
+                square += (b.astype(np.float64) ** 2).sum(axis = 0)
+                self.frames += len(b)
+            if not self.frames:
+                raise ValueError('No complete frame of %d bins in the captures' % self.length)
+
+            mean = total / self.frames
+            std = np.sqrt(np.maximum(square / self.frames - mean ** 2, 0))
+            return mean, std / np.sqrt(self.frames)
+
+        medians, mads = self.blockStatistics()
+        center = np.median(medians, axis = 0)
+        if method == 'median':
+            # Spread of the block medians over the blocks
+            return center, MAD_SCALE * np.median(np.abs(medians - center), axis = 0) / np.sqrt(len(medians))
+        if method != 'clip':
+            raise ValueError('Unknown averaging %s' % method)
+
+        # Second pass, the frames far from the median are rejected bin by bin.
+        # A bin of constant words has no spread, one LSB is allowed.
+        limit = k * np.maximum(MAD_SCALE * np.median(mads, axis = 0), 1.0)
+        total = np.zeros(self.length)
+        square = np.zeros(self.length)
+        count = np.zeros(self.length, dtype = np.int64)
+        self.rejected[:] = 0
+
+        for b in self.blocks():
+            keep = np.abs(b - center) <= limit
+            total += np.where(keep, b, 0).sum(axis = 0)
+            square += np.where(keep, b.astype(np.float64) ** 2, 0).sum(axis = 0)
+            count += keep.sum(axis = 0)
+            self.rejected += len(b) - keep.sum(axis = 0)
+
+        n = np.maximum(count, 1)
+        mean = np.where(count > 0, total / n, center)
+        std = np.sqrt(np.maximum(square / n - mean ** 2, 0))
+        return mean, std / np.sqrt(n)
+
+def correctionTable(level, reference, numerator):
+    '''Offsets to subtract, clipped to the signed numerator bits. Returns the table and the clipped bins.'''
+    offset = np.round(level - reference).astype(np.int64)
+    low = -(1 << (numerator - 1))
+    high = (1 << (numerator - 1)) - 1
+    clipped = np.flatnonzero((offset < low) | (offset > high))
+    return np.clip(offset, low, high), clipped
+
+def writeTable(table, width, path):
+    digits = (width + 3) // 4
+    mask = (1 << width) - 1
+    with open(path, 'w') as f:
+        f.write('\n'.join([('%0*x' % (digits, int(v) & mask)) for v in table]))
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hi:r:o:n:b:w:sm:k:")
+
+    captures = []
+    reference_file = None
+    output_file = 'recv_comp.mem'
+    length = 1024
+    numerator = 8
+    width = 16
+    signed = False
+    method = 'clip'
+    k = 3.0
+
+    for opt,val in opts:
+        if opt == '-i':
+            for v in val.split(','):
+                captures += sorted(glob.glob(v)) or [v]
+        elif opt == '-r':
+            reference_file = val
+        elif opt == '-o':
+            output_file = val
+        elif opt == '-n':
+            length = int(val)
+        elif opt == '-b':
+            numerator = int(val)
+        elif opt == '-w':
+            width = int(val)
+        elif opt == '-s':
+            signed = True
+        elif opt == '-m':
+            method = val
+        elif opt == '-k':
+            k = float(val)
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    if not captures:
+        print(HELP_MESSAGE)
+        sys.exit()
+
+    if sc is None:
+        print('stream_compare is not on the module path. Add tb/infrastructure/axi_stream to PYTHONPATH.', file = sys.stderr)
+        sys.exit(1)
+
+    try:
+        cal = Calibration(captures, length, width, signed)
+        level, error = cal.estimate(method, k)
+
+        if reference_file is not None:
+            reference = readReference(reference_file, length, width, signed)
+        else:
+            reference = np.full(length, np.median(level))
+        table, clipped = correctionTable(level, reference, numerator)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(e)
+        sys.exit(1)
+
+    print('%d frames of %d captures' % (cal.frames, len(captures)))
+    if method == 'clip':
+        print('Rejected frames per bin: %.2f%% on average, %.2f%% at most' %
+              (cal.rejected.mean() * 100 / cal.frames, cal.rejected.max() * 100 / cal.frames))
+    print('Standard error of the estimate: %.3f LSB on average, %.3f LSB at most' % (error.mean(), error.max()))
+    print('Deviation from the reference: %.2f LSB RMS before, %.2f LSB RMS after' %
+          (np.sqrt(np.mean((level - reference) ** 2)), np.sqrt(np.mean((level - table - reference) ** 2))))
+    if len(clipped):
+        print('%d bins clipped to [%d, %d], e.g. bins %s' % (len(clipped), -(1 << (numerator - 1)), (1 << (numerator - 1)) - 1,
+                                                              ', '.join(map(str, clipped[:8]))))
+
+    writeTable(table, width, output_file)
+    print('Table saved to %s' % output_file)
@@ -0,0 +1,422 @@
+'''
+    stream_compare.py
+    Streaming comparator of axi_stream_sink dumps and golden data
+'''
+import sys, getopt, importlib, os
+from collections import namedtuple
+import numpy as np
+import yaml
+
+# Help message
+HELP_MESSAGE = '''Compare an axi_stream_sink dump with golden data.
+Usages:stream_compare.py -i <dump_file> -g <golden> [options]
+       stream_compare.py -c <config_file>
+    -i <dump_file>
+        Simulation output with the axi_stream_sink transactions.
+    -g <golden>
+        Golden data. A .mem file of hex words, one beat per line, with
+        optional tlast and tuser columns; another sink dump; or a Python
+        model as module:function, which returns an iterable of words or of
+        (tdata, tlast, tuser) tuples.
+    -w <width>
+        TDATA width in bits, 16 by default.
+    -s
+        TDATA is signed.
+    -t <atol>[,<rtol>]
+        Tolerance, a beat matches if |rtl - golden| <= atol + rtol * |golden|.
+    -a <none|tuser|tlast>
+        Frame alignment. tuser: both streams start at the first beat with
+        tuser set. tlast: both streams start after the first tlast. Frames
+        of different lengths are reported and resynchronized at the next
+        frame, a lost frame marker drops the frame of both streams.
+    -n <count>
+        Number of mismatches to print, 10 by default.
+    -x
+        Stop at the printed mismatches.
+    -c <config_file>
+        Compare the streams of a YAML config, a list of streams with the
+        keys dump, golden, width, signed, atol, rtol, align, tid, tdest,
+        max-mismatches, stop.
+    -h
+        Display this help message.
+
+The streams are read in chunks, the memory does not grow with the length of
+the simulation.'''
+
+# Beats per chunk
+CHUNK = 65536
+
+Beat = namedtuple('Beat', ['data', 'last', 'user', 'tid', 'tdest'])
+Mismatch = namedtuple('Mismatch', ['index', 'frame', 'offset', 'rtl', 'golden', 'kind'])
+
+def parseHex(s):
+    '''Value of a hex string, None if it has x or z bits'''
+    try:
+        return int(s, 16)
+    except ValueError:
+        return None
+
+def readDump(f):
+    '''Beats of the $display output of axi_stream_sink, other lines are skipped'''
+    beat = None
+    for line in f:
+        if line.startswith('TDATA='):
+            if beat is not None:
+                yield Beat(**beat)
+            beat = {'data': parseHex(line[6:line.find(',')].strip()), 'last': 0, 'user': 0, 'tid': 0, 'tdest': 0}
+        elif beat is not None:
+            if line.startswith('TLAST='):
+                beat['last'] = parseHex(line[6:].strip()) or 0
+            elif line.startswith('TUSER='):
+                beat['user'] = parseHex(line[6:].strip()) or 0
+            elif line.startswith('TID='):
+                beat['tid'] = parseHex(line[4:].strip()) or 0
+            elif line.startswith('TDEST='):
+                beat['tdest'] = parseHex(line[6:].strip()) or 0
+
+    if beat is not None:
+        yield Beat(**beat)
+
+def readMem(f):
+    '''Beats of a $readmemh file, columns are tdata, tlast and tuser'''
+    for line in f:
+        line = line.split('//')[0].strip()
+        if not line or line.startswith('@'):
+            continue
+
+        v = line.split()
+        yield Beat(parseHex(v[0]), int(v[1]) if len(v) > 1 else 0, int(v[2]) if len(v) > 2 else 0, 0, 0)
+
+def readModel(spec):
+    '''Beats of a Python model, module:function'''
+    moduleName, functionName = spec.rsplit(':', 1)
+    sys.path.insert(0, os.getcwd())
+    function = getattr(importlib.import_module(moduleName), functionName)
+
+    for v in function():
+        if isinstance(v, tuple):
+            yield Beat(v[0], v[1] if len(v) > 1 else 0, v[2] if len(v) > 2 else 0, 0, 0)
+        else:
+            yield Beat(v, 0, 0, 0, 0)
+
+def openFile(path, probe = 1000):
+    '''Beats of a sink dump or a .mem file, a dump has TDATA= lines in the first lines'''
+    with open(path, 'r') as f:
+        isDump = any([line.startswith('TDATA=') for i, line in zip(range(probe), f)])
+
+    with open(path, 'r') as f:
+        yield from (readDump(f) if isDump else readMem(f))
+
+def openSource(spec):
+    if os.path.isfile(spec):
+        return openFile(spec)
+    if ':' in spec:
+        return readModel(spec)
+    raise RuntimeError('Golden source %s is neither a file nor a module:function' % spec)
+
+class Stream():
+    '''Beats of a source in numpy chunks, consumed from the front'''
+
+    def __init__(self, beats, width = 16, signed = False, tid = None, tdest = None):
+        if width > 62:
+            raise RuntimeError('TDATA width %d is too wide' % width)
+
+        self.beats = iter(beats)
+        self.width = width
+        self.signed = signed
+        self.tid = tid
+        self.tdest = tdest
+
+        self.pos = 0
+        self.index = 0          # Beats consumed
+        self.frame = 0          # Frames ended by the consumed beats
+        self.since = {'last': 0, 'user': 0}     # Beats consumed after the last tlast, from the last tuser
+        self.fill()
+
+    def fill(self):
+        '''Read the next chunk'''
+        data = []
+        valid = []
+        last = []
+        user = []
+
+        for v in self.beats:
+            if (self.tid is not None and v.tid != self.tid) or (self.tdest is not None and v.tdest != self.tdest):
+                continue
+
+            data.append(0 if v.data is None else v.data)
+            valid.append(v.data is not None)
+            last.append(v.last)
+            user.append(v.user)
+            if len(data) == CHUNK:
+                break
+
+        mask = (1 << self.width) - 1
+        self.data = np.array(data, dtype = np.int64) & mask
+        if self.signed:
+            self.data = np.where(self.data >> (self.width - 1), self.data - (1 << self.width), self.data)
+        self.valid = np.array(valid, dtype = bool)
+        self.last = np.array(last, dtype = bool)
+        self.user = np.array(user, dtype = bool)
+        self.pos = 0
+
+    def available(self):
+        '''Beats left in the chunk, 0 at the end of the stream'''
+        if self.pos == len(self.data) and len(self.data) == CHUNK:
+            self.fill()
+        return len(self.data) - self.pos
+
+    def view(self, n):
+        s = slice(self.pos, self.pos + n)
+        return self.data[s], self.valid[s], self.last[s], self.user[s]
+
+    def consume(self, n):
+        '''Drop n beats, n is within the chunk'''
+        ends = np.flatnonzero(self.last[self.pos:self.pos + n])
+        self.frame += len(ends)
+        self.since['last'] = n - 1 - ends[-1] if len(ends) else self.since['last'] + n
+
+        starts = np.flatnonzero(self.user[self.pos:self.pos + n])
+        self.since['user'] = n - starts[-1] if len(starts) else self.since['user'] + n
+
+        self.pos += n
+        self.index += n
+
+    def skipTo(self, marker, after):
+        '''Drop the beats before the next beat with the marker, and the beat if after.
+        Returns the dropped beats.'''
+        dropped = 0
+        while self.available():
+            hits = np.flatnonzero(getattr(self, marker)[self.pos:])
+            if len(hits):
+                n = hits[0] + (1 if after else 0)
+                self.consume(n)
+                return dropped + n
+
+            n = len(self.data) - self.pos
+            self.consume(n)
+            dropped += n
+
+        return dropped
+
+class Report():
+    def __init__(self, name, maxMismatches):
+        self.name = name
+        self.maxMismatches = maxMismatches
+        self.compared = 0
+        self.mismatches = 0
+        self.frameErrors = 0
+        self.maxError = 0
+        self.first = []
+        self.rtlExtra = 0
+        self.goldenExtra = 0
+        self.skipped = (0, 0)
+
+    def add(self, m):
+        if len(self.first) < self.maxMismatches:
+            self.first.append(m)
+
+    def passed(self):
+        return self.mismatches == 0 and self.frameErrors == 0 and self.rtlExtra == 0 and self.goldenExtra == 0
+
+    def summary(self):
+        lines = ['%s: %s' % (self.name, 'PASS' if self.passed() else 'FAIL'),
+                 '    %d beats compared, %d mismatches, max error %d' % (self.compared, self.mismatches, self.maxError)]
+
+        if any(self.skipped):
+            lines.append('    Aligned after %d RTL and %d golden beats' % self.skipped)
+        if self.frameErrors:
+            lines.append('    %d frames of different lengths' % self.frameErrors)
+        if self.rtlExtra:
+            lines.append('    %d RTL beats after the end of the golden data' % self.rtlExtra)
+        if self.goldenExtra:
+            lines.append('    %d golden beats missing in the RTL output' % self.goldenExtra)
+
+        for v in self.first:
+            if v.kind == 'data':
+                lines.append('    beat %d (frame %d, +%d): rtl %d, golden %d, error %d'
+                             % (v.index, v.frame, v.offset, v.rtl, v.golden, v.rtl - v.golden))
+            else:
+                lines.append('    beat %d (frame %d, +%d): %s' % (v.index, v.frame, v.offset, v.kind))
+
+        return '\n'.join(lines)
+
+def compareStreams(rtl, golden, name = 'stream', atol = 0, rtol = 0.0, align = 'none', maxMismatches = 10, stop = False):
+    '''Compare the streams chunk by chunk, returns a Report'''
+    report = Report(name, maxMismatches)
+
+    # Frame alignment
+    if align == 'tuser':
+        report.skipped = (rtl.skipTo('user', False), golden.skipTo('user', False))
+    elif align == 'tlast':
+        report.skipped = (rtl.skipTo('last', True), golden.skipTo('last', True))
+    elif align != 'none':
+        raise RuntimeError('Unknown alignment %s' % align)
+
+    marker = {'tuser': 'user', 'tlast': 'last'}.get(align)
+
+    while True:
+        n = min(rtl.available(), golden.available())
+        if n == 0:
+            break
+
+        a, aValid, aLast, aUser = rtl.view(n)
+        g, gValid, gLast, gUser = golden.view(n)
+
+        # Frame markers, the beats up to the first different marker are compared
+        resync = None
+        if marker is not None:
+            diff = np.flatnonzero((aLast != gLast) if marker == 'last' else (aUser != gUser))
+            if len(diff):
+                resync = diff[0]
+                n = resync
+
+        # Beats with x or z in either stream are mismatches, without an error value
+        valid = aValid[:n] & gValid[:n]
+        error = a[:n] - g[:n]
+        bad = np.abs(error) > atol + rtol * np.abs(g[:n])
+        bad |= ~valid
+        idx = np.flatnonzero(bad)
+
+        # Stopping, the chunk is cut after the last mismatch reported
+        full = stop and len(idx) > 0 and len(report.first) + len(idx) >= maxMismatches
+        if full:
+            n = int(idx[max(maxMismatches - len(report.first), 1) - 1]) + 1
+            idx = idx[idx < n]
+            resync = None
+
+        report.compared += n
+        if len(idx):
+            report.mismatches += len(idx)
+            report.maxError = max(report.maxError, int(np.max(np.abs(error[idx][valid[idx]]), initial = 0)))
+
+            if len(report.first) < maxMismatches:
+                # Frame and offset of the mismatches in the chunk
+                ends = np.concatenate(([0], np.cumsum(aLast[:n])))
+                for i in idx[:maxMismatches - len(report.first)]:
+                    frames = ends[i]
+                    if frames:
+                        start = np.flatnonzero(aLast[:i])[-1] + 1
+                        offset = i - start
+                    else:
+                        offset = rtl.since['last'] + i
+                    if not aValid[i]:
+                        kind = 'x or z in RTL data'
+                    elif not gValid[i]:
+                        kind = 'x or z in golden data'
+                    else:
+                        kind = 'data'
+                    report.add(Mismatch(rtl.index + i, rtl.frame + int(frames), int(offset), int(a[i]), int(g[i]), kind))
+
+        rtl.consume(n)
+        golden.consume(n)
+
+        if full:
+            return report
+
+        if resync is not None:
+            # The stream with the marker has the shorter frame, the other one skips to its marker
+            report.frameErrors += 1
+            short, long = (rtl, golden) if getattr(rtl, marker)[rtl.pos] else (golden, rtl)
+            report.add(Mismatch(rtl.index, rtl.frame, rtl.since['last'], 0, 0,
+                                '%s frame is shorter' % ('RTL' if short is rtl else 'golden')))
+
+            # If the long stream skips most of a frame, it lost a marker, and
+            # the short stream skips the frame too
+            if marker == 'last':
+                length = short.since['last'] + 1
+                short.consume(1)
+                if long.skipTo('last', True) > length // 2:
+                    short.skipTo('last', True)
+            else:
+                length = short.since['user']
+                if long.skipTo('user', False) > length // 2:
+                    short.consume(1)
+                    short.skipTo('user', False)
+
+            if stop and len(report.first) >= maxMismatches:
+                return report
+
+    # Beats left in one stream
+    while rtl.available():
+        k = rtl.available()
+        report.rtlExtra += k
+        rtl.consume(k)
+    while golden.available():
+        k = golden.available()
+        report.goldenExtra += k
+        golden.consume(k)
+
+    return report
+
+def compareConfig(v):
+    '''Compare a stream of a config'''
+    width = v.get('width', 16)
+    signed = v.get('signed', False)
+
+    for k in ('dump', 'golden'):
+        if not k in v:
+            raise RuntimeError('%s is missing from the stream %s' % (k, v.get('name', '')))
+
+    with open(v['dump'], 'r') as f:
+        rtl = Stream(readDump(f), width, signed, v.get('tid'), v.get('tdest'))
+        golden = Stream(openSource(v['golden']), width, signed)
+
+        return compareStreams(rtl, golden, v.get('name', v['dump']), v.get('atol', 0), v.get('rtol', 0.0),
+                              v.get('align', 'none'), v.get('max-mismatches', 10), v.get('stop', False))
+
+if __name__ == '__main__':
+    # Parse the arguments
+    opts, args = getopt.getopt(sys.argv[1:], "hi:g:w:st:a:n:xc:")
+
+    config = {}
+    configFile = None
+
+    for opt,val in opts:
+        if opt == '-i':
+            config['dump'] = val
+        elif opt == '-g':
+            config['golden'] = val
+        elif opt == '-w':
+            config['width'] = int(val)
+        elif opt == '-s':
+            config['signed'] = True
+        elif opt == '-t':
+            tol = val.split(',')
+            config['atol'] = float(tol[0])
+            if len(tol) > 1:
+                config['rtol'] = float(tol[1])
+        elif opt == '-a':
+            config['align'] = val
+        elif opt == '-n':
+            config['max-mismatches'] = int(val)
+        elif opt == '-x':
+            config['stop'] = True
+        elif opt == '-c':
+            configFile = val
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    if configFile is not None:
+        with open(configFile, 'r') as f:
+            streams = yaml.load(f, Loader = yaml.SafeLoader)
+    else:
+        if not 'dump' in config or not 'golden' in config:
+            print(HELP_MESSAGE)
+            sys.exit()
+        streams = [config]
+
+    passed = True
+    for v in streams:
+        try:
+            report = compareConfig(v)
+        except (RuntimeError, OSError) as e:
+            print(e)
+            passed = False
+            continue
+
+        print(report.summary())
+        passed = passed and report.passed()
+
+    sys.exit(0 if passed else 1)
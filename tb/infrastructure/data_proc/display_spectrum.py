@@ -19,8 +19,14 @@
 from scipy.fft import fft
 import matplotlib.pyplot as plt
 import numpy as np
-import sys, getopt
+import sys, getopt, os
 import yaml
+try:
+    from Instrumentation import stage
+except ImportError:
+    from contextlib import nullcontext as stage
+    if os.environ.get('INSTRUMENT'):
+        print('INSTRUMENT is set, but Instrumentation is not on the module path. Add the script folder to PYTHONPATH.', file = sys.stderr)
 
 # Constants
 # Help message
@@ -78,8 +84,9 @@ if __name__ == '__main__':
             sys.exit()
 
     # Read parameters from config file
-    with open(config_file, 'r') as f:
-        config = yaml.load(f, Loader = yaml.FullLoader)
+    with stage('config'):
+        with open(config_file, 'r') as f:
+            config = yaml.load(f, Loader = yaml.FullLoader)
     
     SAMPLERATE = config['samplerate']
     SPECTRUMS = config['spectrum']
@@ -91,15 +98,18 @@ if __name__ == '__main__':
             max_freq = v['freq']
 
     # Read data files
-    data = readDataFile(input_file)
+    with stage('read'):
+        data = readDataFile(input_file)
     # Normalize
     data = normalize(data)
     # Do FFT
-    spect = np.abs(fft(data))
+    with stage('fft'):
+        spect = np.abs(fft(data))
 
     # Plot data
-    plt.subplot(211)
-    plot(data[:int(SAMPLERATE * max_freq)], 'Time Domain', 'Value')
-    plt.subplot(212)
-    plot(spect[:int(SAMPLERATE / 2)], 'Spectrum', 'Value')
+    with stage('plot'):
+        plt.subplot(211)
+        plot(data[:int(SAMPLERATE * max_freq)], 'Time Domain', 'Value')
+        plt.subplot(212)
+        plot(spect[:int(SAMPLERATE / 2)], 'Spectrum', 'Value')
     plt.show()
\ No newline at end of file
@@ -4,8 +4,14 @@
 '''
 import numpy as np
 import matplotlib.pyplot as plt
-import sys, getopt, math
+import sys, getopt, math, os
 import yaml
+try:
+    from Instrumentation import stage
+except ImportError:
+    from contextlib import nullcontext as stage
+    if os.environ.get('INSTRUMENT'):
+        print('INSTRUMENT is set, but Instrumentation is not on the module path. Add the script folder to PYTHONPATH.', file = sys.stderr)
 
 # Constants
 # Help message
@@ -46,8 +52,9 @@ if __name__ == '__main__':
             sys.exit()
 
     # Read parameters from config file
-    with open(config_file, 'r') as f:
-        config = yaml.load(f, Loader = yaml.FullLoader)
+    with stage('config'):
+        with open(config_file, 'r') as f:
+            config = yaml.load(f, Loader = yaml.FullLoader)
     
     SAMPLERATE = config['samplerate']
     LENGTH = config['length']
@@ -59,15 +66,17 @@ if __name__ == '__main__':
     QUANT = config['quant']
 
     # Generate spectrum
-    data = np.zeros(int(LENGTH), dtype = np.float32)
-    for v in SPECTRUMS:
-        data += generate_sine(v['ampl'], v['freq'] * SAMPLERATE, int(LENGTH))
+    with stage('sines'):
+        data = np.zeros(int(LENGTH), dtype = np.float32)
+        for v in SPECTRUMS:
+            data += generate_sine(v['ampl'], v['freq'] * SAMPLERATE, int(LENGTH))
 
     # Add noise
     # Generate white noise and add to data
     if NOISE_INFO['enable']:
-        white_noise = np.random.uniform(0, 1, LENGTH)
-        data = add_noise(data, white_noise, NOISE_INFO['snr'])
+        with stage('noise'):
+            white_noise = np.random.uniform(0, 1, LENGTH)
+            data = add_noise(data, white_noise, NOISE_INFO['snr'])
 
     # Normalize
     mx = np.max(data)
@@ -75,14 +84,17 @@ if __name__ == '__main__':
     
     # Apply gain on the curve
     print('Converting to fixed point...')
-    data = data * (pow(2, QUANT) - 1)
-    data = data.astype(np.int16)
-    data = data.tolist()
-    data = '\n'.join([('%04x' % v) for v in data])
+    with stage('quantize'):
+        data = data * (pow(2, QUANT) - 1)
+        data = data.astype(np.int16)
+    with stage('hex_format'):
+        data = data.tolist()
+        data = '\n'.join([('%04x' % v) for v in data])
 
     # Save wave audio
     print('Saving the file...')
-    with open(output_file, 'w') as f:
-        f.write(data)
+    with stage('write'):
+        with open(output_file, 'w') as f:
+            f.write(data)
 
     print('Done.')
\ No newline at end of file
@@ -0,0 +1,329 @@
+'''
+    sim_regression.py
+    Parallel simulation regression of the testbenches with Icarus Verilog or Verilator
+'''
+import sys, getopt, os, re, time, json, hashlib, shutil, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+HELP_MESSAGE = '''Run the testbenches of the tb folder in parallel.
+Usage: python sim_regression.py [-s iverilog|verilator] [-k <filter>] [-j <jobs>] [-t <timeout>] [-r <report_file>] [-f] [-l] [-h]
+    -s <simulator>
+        iverilog (default) or verilator.
+    -k <filter>
+        Run the tests whose name contains one of the comma separated
+        filters, e.g. -k dsp,graphic. Test names are <folder>/<top module>.
+    -j <jobs>
+        Number of parallel tests, count of CPUs by default.
+    -t <timeout>
+        Simulation timeout of a test in seconds, 600 by default.
+    -r <report_file>
+        Write the results as JSON.
+    -f
+        Recompile all tests. Otherwise a compiled snapshot is reused while
+        its sources, simulator and options are unchanged.
+    -l
+        List the tests and their source files.
+    -h
+        Display this help message.
+
+A test is a module of the tb folder named *_tb or *_tb_*. Its sources are
+found by the module instantiations, in the rtl and tb folders. The test runs
+in the folder of the testbench, so the memory and stimulus files are found
+as in the makefiles. A test passes if the simulation ends by $finish or
+$stop in time, and prints no ERROR, FATAL or FAIL message.'''
+
+TB_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TB_DIR)
+SOURCE_DIRS = [os.path.join(ROOT_DIR, 'rtl'), TB_DIR]
+CACHE_DIR = os.path.join(TB_DIR, '.sim_cache')
+
+SOURCE_EXT = ('.v', '.sv')
+TB_RE = re.compile(r'_tb(_|$)')
+
+COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+MODULE_RE = re.compile(r'\bmodule\s+([A-Za-z_]\w*)')
+INSTANCE_RE = re.compile(r'\b([A-Za-z_]\w*)\s*(?:#\s*\([^;]*?\)\s*)?[A-Za-z_]\w*\s*\(')
+INCLUDE_RE = re.compile(r'`include\s+"([^"]+)"')
+ERROR_RE = re.compile(r'\b(ERROR|FATAL|FAIL|FAILED)\b|%Error')
+
+SIMULATORS = {
+    'iverilog': {
+        'tools': ['iverilog', 'vvp'],
+        'options': ['-g2012'],
+    },
+    'verilator': {
+        'tools': ['verilator'],
+        'options': ['--binary', '-j', '0', '-Wno-fatal', '--timing'],
+    },
+}
+
+@dataclass
+class SourceFile():
+    path: str
+    modules: list
+    instances: set
+    includes: list
+
+@dataclass
+class Test():
+    name: str
+    top: str
+    workDir: str
+    files: list = field(default_factory = list)
+    includeDirs: list = field(default_factory = list)
+
+@dataclass
+class Result():
+    name: str
+    status: str             # PASS, FAIL, TIMEOUT, ERROR
+    compileTime: float
+    runTime: float
+    cached: bool
+    message: str = ''
+
+def parseSource(path):
+    with open(path, 'r', encoding = 'utf-8', errors = 'replace') as f:
+        text = COMMENT_RE.sub(' ', f.read())
+
+    return SourceFile(path, MODULE_RE.findall(text), set(INSTANCE_RE.findall(text)), INCLUDE_RE.findall(text))
+
+def scanSources(dirs = SOURCE_DIRS):
+    '''Source files by path, and the defining file of the modules'''
+    sources = {}
+    modules = {}
+
+    for d in dirs:
+        for root, subdirs, files in os.walk(d):
+            subdirs[:] = sorted([v for v in subdirs if not v.startswith('.')])
+            for name in sorted(files):
+                if name.endswith(SOURCE_EXT):
+                    src = parseSource(os.path.join(root, name))
+                    sources[src.path] = src
+                    for m in src.modules:
+                        modules.setdefault(m, []).append(src.path)
+
+    return sources, modules
+
+def pickDefinition(paths, near):
+    '''Definition of a module defined in several files, the nearest to the testbench'''
+    if len(paths) == 1:
+        return paths[0]
+    return sorted(paths, key = lambda v: (-len(os.path.commonpath([v, near])), len(v), v))[0]
+
+def resolveInclude(name, src, includeDirs):
+    for d in [os.path.dirname(src)] + includeDirs:
+        path = os.path.join(d, name)
+        if os.path.isfile(path):
+            return os.path.normpath(path)
+    return None
+
+def resolveTest(test, sources, modules):
+    '''Source files of a test, from the top module down the instantiations.
+    Modules out of the rtl and tb folders are reported by the compiler.'''
+    files = []
+    todo = [test.top]
+    seen = set()
+
+    while todo:
+        m = todo.pop()
+        if m in seen:
+            continue
+        seen.add(m)
+
+        path = pickDefinition(modules[m], test.workDir)
+        if path in files:
+            continue
+        files.append(path)
+
+        for v in sources[path].instances:
+            if v in modules and not v in seen:
+                todo.append(v)
+
+    # Included files are found in the folders of the sources
+    test.includeDirs = sorted(set([os.path.dirname(v) for v in files]))
+    test.files = files
+
+    return test
+
+def includedFiles(test, sources):
+    '''Files included by the sources of a test, recursively'''
+    li = []
+    todo = list(test.files)
+    while todo:
+        path = todo.pop()
+        includes = sources[path].includes if path in sources else parseSource(path).includes
+        for name in includes:
+            inc = resolveInclude(name, path, test.includeDirs)
+            if inc is not None and not inc in li and not inc in test.files:
+                li.append(inc)
+                todo.append(inc)
+    return li
+
+def discoverTests(sources, modules, filters = None):
+    tests = []
+    for path, src in sorted(sources.items()):
+        if not path.startswith(TB_DIR + os.sep):
+            continue
+
+        for m in src.modules:
+            if not TB_RE.search(m):
+                continue
+
+            name = '%s/%s' % (os.path.relpath(os.path.dirname(path), TB_DIR).replace(os.sep, '/'), m)
+            if filters and not any([v in name for v in filters]):
+                continue
+
+            tests.append(resolveTest(Test(name, m, os.path.dirname(path)), sources, modules))
+
+    return tests
+
+def snapshotHash(test, sources, simulator):
+    h = hashlib.sha256()
+    h.update(json.dumps([simulator, SIMULATORS[simulator]['options'], test.top]).encode())
+    for path in test.files + includedFiles(test, sources):
+        h.update(path.encode())
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+def compileTest(test, simulator, snapshotDir):
+    '''Compile a test to the snapshot folder, returns (executable command, error)'''
+    os.makedirs(snapshotDir, exist_ok = True)
+    options = SIMULATORS[simulator]['options']
+    includes = ['-I%s' % v for v in test.includeDirs]
+
+    if simulator == 'iverilog':
+        snapshot = os.path.join(snapshotDir, 'sim.vvp')
+        cmd = ['iverilog'] + options + includes + ['-s', test.top, '-o', snapshot] + test.files
+        run = ['vvp', '-n', snapshot]
+    else:
+        cmd = ['verilator'] + options + includes + ['--top-module', test.top, '--Mdir', snapshotDir, '-o', 'sim'] + test.files
+        snapshot = os.path.join(snapshotDir, 'sim')
+        run = [snapshot]
+
+    p = subprocess.run(cmd, capture_output = True, text = True)
+    if p.returncode != 0:
+        shutil.rmtree(snapshotDir, ignore_errors = True)
+        return None, p.stdout + p.stderr
+
+    return run, None
+
+def runTest(test, sources, simulator, timeout, force):
+    snapshotDir = os.path.join(CACHE_DIR, simulator, test.name.replace('/', '_'), snapshotHash(test, sources, simulator))
+    doneFile = os.path.join(snapshotDir, 'run.json')
+
+    # Compile, or reuse the snapshot
+    start = time.perf_counter()
+    cached = os.path.isfile(doneFile) and not force
+    if cached:
+        with open(doneFile, 'r') as f:
+            run = json.load(f)
+    else:
+        # Snapshots of the older sources of the test are dropped
+        shutil.rmtree(os.path.dirname(snapshotDir), ignore_errors = True)
+        run, error = compileTest(test, simulator, snapshotDir)
+        if run is None:
+            return Result(test.name, 'ERROR', time.perf_counter() - start, 0, False, error.strip())
+        with open(doneFile, 'w') as f:
+            json.dump(run, f)
+    compileTime = time.perf_counter() - start
+
+    # Simulate in the testbench folder
+    start = time.perf_counter()
+    try:
+        p = subprocess.run(run, cwd = test.workDir, capture_output = True, text = True, timeout = timeout)
+    except subprocess.TimeoutExpired:
+        return Result(test.name, 'TIMEOUT', compileTime, time.perf_counter() - start, cached)
+    runTime = time.perf_counter() - start
+
+    output = p.stdout + p.stderr
+    errors = [v for v in output.splitlines() if ERROR_RE.search(v) and not '$stop' in v]
+    stopped = p.returncode == 0 or '$stop' in output
+
+    if errors or not stopped:
+        message = '\n'.join(errors[:10]) if errors else 'Exit code %d' % p.returncode
+        return Result(test.name, 'FAIL', compileTime, runTime, cached, message)
+
+    return Result(test.name, 'PASS', compileTime, runTime, cached)
+
+def runRegression(tests, sources, simulator = 'iverilog', jobs = None, timeout = 600, force = False):
+    for v in SIMULATORS[simulator]['tools']:
+        if shutil.which(v) is None:
+            raise RuntimeError('%s is not found in PATH' % v)
+
+    print('%-48s %-8s %10s %10s' % ('test', 'status', 'compile', 'run'))
+
+    def job(test):
+        r = runTest(test, sources, simulator, timeout, force)
+        line = '%-48s %-8s %10s %9.2fs' % (r.name, r.status, 'cached' if r.cached else '%.2fs' % r.compileTime, r.runTime)
+        if r.message:
+            line += '\n    ' + r.message.replace('\n', '\n    ')
+        # One print per test, the tests run in threads
+        print(line)
+        return r
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = jobs or os.cpu_count()) as executor:
+        results = list(executor.map(job, tests))
+
+    passed = len([v for v in results if v.status == 'PASS'])
+    print('%d tests, %d passed, %d failed, %.2fs' % (len(results), passed, len(results) - passed, time.perf_counter() - start))
+
+    return results
+
+if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "hs:k:j:t:r:fl")
+
+    simulator = 'iverilog'
+    filters = None
+    jobs = None
+    timeout = 600
+    reportFile = None
+    force = False
+    listTests = False
+
+    for opt,val in opts:
+        if opt == '-s':
+            simulator = val
+        elif opt == '-k':
+            filters = val.split(',')
+        elif opt == '-j':
+            jobs = int(val)
+        elif opt == '-t':
+            timeout = float(val)
+        elif opt == '-r':
+            reportFile = val
+        elif opt == '-f':
+            force = True
+        elif opt == '-l':
+            listTests = True
+        else:
+            print(HELP_MESSAGE)
+            sys.exit()
+
+    if not simulator in SIMULATORS:
+        print('Unknown simulator %s' % simulator)
+        sys.exit(1)
+
+    sources, modules = scanSources()
+    tests = discoverTests(sources, modules, filters)
+
+    if listTests:
+        for v in tests:
+            print(v.name)
+            for f in v.files:
+                print('    ' + os.path.relpath(f, ROOT_DIR))
+        sys.exit()
+
+    try:
+        results = runRegression(tests, sources, simulator, jobs, timeout, force)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    if reportFile is not None:
+        with open(reportFile, 'w') as f:
+            json.dump([v.__dict__ for v in results], f, indent = 2)
+
+    sys.exit(0 if all([v.status == 'PASS' for v in results]) else 1)